@@ -1,7 +1,51 @@
 from dash import Dash, html, dcc
 import dash
+import flask
+from telemetry.convert import start_conversion
+from telemetry.export import export_response
+from telemetry.figcache import figure_cache
+from telemetry.ingest import start_ingestion
+from telemetry.live import broadcaster
+from telemetry.metrics import callback_metrics
+from telemetry.offload import RENDERER, start_pool
+from telemetry.sources import SOURCES
+
+app = Dash(__name__, use_pages=True, prevent_initial_callbacks=True, compress=True)
+app.renderer = RENDERER
+# fork the report workers while the process has no other threads; they inherit the imported pages
+start_pool()
+start_conversion()
+ingester = start_ingestion()
+
+
+@app.server.route('/cache-stats')
+def cache_stats():
+    return flask.jsonify(figure_cache.stats())
+
+
+@app.server.route('/metrics')
+def metrics():
+    return flask.Response(callback_metrics.exposition(), mimetype='text/plain; version=0.0.4')
+
+
+# callback serialisation time and payload size, once Dash has built the response
+app.server.after_request(callback_metrics.finish)
+
+
+@app.server.route('/live/<name>')
+def live(name):
+    if name not in SOURCES:
+        flask.abort(404)
+    return flask.Response(broadcaster.stream(name), mimetype='text/event-stream',
+                          headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.server.route('/export/<name>')
+def export(name):
+    if name not in SOURCES:
+        flask.abort(404)
+    return export_response(name, flask.request.args)
 
-app = Dash(__name__, use_pages=True, prevent_initial_callbacks=True)
 
 app.layout = html.Div([
     html.H1('PLANT DASHBOARD FOR VARIOUS PARAMETERS MONITERING',
@@ -0,0 +1,52 @@
+// Latest readings pushed over /live/<source> (see telemetry/live.py), kept per source
+// and copied into the gauges by the clientside callbacks of live_outputs.
+window.telemetryLive = (function () {
+    var sources = {};
+    var rendered = {};
+
+    function connect(name) {
+        var source = {readings: {}, stamps: {}, clock: 0};
+        var events = new EventSource('/live/' + name);
+        events.addEventListener('snapshot', function (e) {
+            source.readings = JSON.parse(e.data);
+            source.clock += 1;
+            Object.keys(source.readings).forEach(function (node) {
+                source.stamps[node] = source.clock;
+            });
+        });
+        events.addEventListener('delta', function (e) {
+            var changes = JSON.parse(e.data);
+            source.clock += 1;
+            Object.keys(changes).forEach(function (node) {
+                source.readings[node] = Object.assign({}, source.readings[node], changes[node]);
+                source.stamps[node] = source.clock;
+            });
+        });
+        sources[name] = source;
+        return source;
+    }
+
+    function values(name, key, n, node, columns) {
+        var source = sources[name] || connect(name);
+        if (!(n > 1)) {
+            // the render timer restarted, so the page (and its gauges) was rebuilt
+            delete rendered[key];
+        }
+        if (Array.isArray(node)) {
+            // multi-select dropdowns: the gauges follow the first selected node
+            node = node[0];
+        }
+        var reading = source.readings[node];
+        var mark = node + '@' + source.stamps[node];
+        if (!reading || rendered[key] === mark) {
+            throw window.dash_clientside.PreventUpdate;
+        }
+        rendered[key] = mark;
+        return columns.map(function (column) {
+            var value = reading[column];
+            return value === undefined || value === null ? window.dash_clientside.no_update : value;
+        });
+    }
+
+    return {values: values};
+})();
@@ -0,0 +1,56 @@
+// Figures packed by telemetry/packing.py: their base64 trace arrays are decoded into
+// typed arrays here, since the bundled plotly.js cannot read them itself.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    telemetry: (function () {
+        var ARRAYS = {i2: Int16Array, i4: Int32Array, f4: Float32Array, f8: Float64Array};
+
+        function decode(packed) {
+            var raw = atob(packed.bdata);
+            var bytes = new Uint8Array(raw.length);
+            for (var i = 0; i < raw.length; i++) {
+                bytes[i] = raw.charCodeAt(i);
+            }
+            var values = new ARRAYS[packed.dtype](bytes.buffer);
+            if (packed.dtype[0] === 'f') {
+                return values;
+            }
+            // integers: the type's minimum marks a missing value
+            var missing = -Math.pow(2, 8 * values.BYTES_PER_ELEMENT - 1);
+            var out = new Float64Array(values.length);
+            if (packed.decimals !== undefined) {
+                var scale = Math.pow(10, packed.decimals);
+                for (var j = 0; j < values.length; j++) {
+                    out[j] = values[j] === missing ? NaN : values[j] / scale;
+                }
+            } else {
+                for (var k = 0; k < values.length; k++) {
+                    out[k] = values[k] === missing ? NaN : packed.offset + values[k] * packed.unit;
+                }
+            }
+            return out;
+        }
+
+        function unpack(figure) {
+            if (!figure) {
+                throw window.dash_clientside.PreventUpdate;
+            }
+            var data = [];
+            (figure.data || []).forEach(function (trace) {
+                var copy = Object.assign({}, trace);
+                ['x', 'y'].forEach(function (axis) {
+                    var packed = copy[axis];
+                    if (packed && packed.bdata !== undefined) {
+                        copy[axis] = decode(packed);
+                    } else if (packed && packed.ref !== undefined) {
+                        // the same values as an array decoded earlier, e.g. a shared time axis
+                        copy[axis] = data[packed.ref[0]][packed.ref[1]];
+                    }
+                });
+                data.push(copy);
+            });
+            return Object.assign({}, figure, {data: data});
+        }
+
+        return {decode: decode, unpack: unpack};
+    })()
+});
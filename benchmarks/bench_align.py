@@ -0,0 +1,53 @@
+"""Cost of aligning all three sources on one time grid.
+
+    python -m benchmarks.bench_align --nodes 6 --days 365 --steps 1min,15min,1D
+
+Builds EM, VFD and air stores from ``benchmarks.synthetic`` histories and
+joins, over their whole extent, every node's EM and VFD consumption, the
+air meters' ``Flow_Total`` counter and their ``Flow_Rate`` (see
+``telemetry.align``).  Reports the time and tracemalloc peak of each
+``--steps`` grid; tracemalloc slows the join, so the time is measured
+without it.
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.bench_callbacks import build_store
+from benchmarks.synthetic import periods_for
+from telemetry.align import Side, join
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=6)
+    parser.add_argument('--days', type=float, default=365)
+    parser.add_argument('--freq', default='1min')
+    parser.add_argument('--steps', default='1min,15min,1D')
+    args = parser.parse_args()
+
+    periods = periods_for(args.days, args.freq)
+    stores = {name: build_store(name, args.nodes, periods, args.freq) for name in ('em', 'vfd', 'air')}
+    em, vfd, air = stores['em'], stores['vfd'], stores['air']
+    sides = [Side('em', em, 'Last_consumption', tuple(em.nodes())),
+             Side('vfd', vfd, 'Last_consumption', tuple(vfd.nodes())),
+             Side('air', air, 'Flow_Total', tuple(air.nodes()), counter=True),
+             Side('rate', air, 'Flow_Rate', tuple(air.nodes()), kind='level')]
+    start, stop = em.extent()
+    rows = sum(len(store.frame) for store in stores.values())
+    print('%d nodes per source, %d rows in all' % (args.nodes, rows))
+
+    for step in args.steps.split(','):
+        t = time.perf_counter()
+        joined = join(sides, start, stop, step)
+        elapsed = time.perf_counter() - t
+        tracemalloc.start()
+        join(sides, start, stop, step)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('%-6s %8d intervals  %6.2f s  peak %6.1f MB  %.1f%% NaN' % (
+            step, len(joined), elapsed, peak / 2 ** 20, joined.isna().to_numpy().mean() * 100))
+
+
+if __name__ == '__main__':
+    main()
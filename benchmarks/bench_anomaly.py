@@ -0,0 +1,65 @@
+"""Throughput of the anomaly detector on 1 Hz readings from many meters.
+
+    python -m benchmarks.bench_anomaly --nodes 500 --batch 2 --minutes 10
+
+Feeds the EM detector (see ``telemetry.anomaly.RULES``) synthetic THD
+readings the way the ingester would: one batch every ``--batch`` seconds,
+holding that many readings per node.  Reports the time per batch, the
+readings checked per second and the share of one core that keeping up in
+real time takes.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_em
+from telemetry.anomaly import WARMUP, AnomalyDetector
+from telemetry.sources import SOURCES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=2, help='seconds of readings per batch')
+    parser.add_argument('--minutes', type=int, default=10)
+    args = parser.parse_args()
+
+    seconds = args.minutes * 60
+    history = synthetic_em((WARMUP + seconds) * args.nodes, args.nodes, freq='1s')
+    detector = AnomalyDetector.for_source(SOURCES['em'])
+    times = history['DATE_TIME']
+    start = times.iloc[WARMUP]
+
+    t = time.perf_counter()
+    detector.update(history[times < start])
+    seed = time.perf_counter() - t
+
+    batches = []
+    step = np.timedelta64(args.batch, 's')
+    lo = start.to_datetime64()
+    while True:
+        batch = history[(times >= lo) & (times < lo + step)]
+        if not len(batch):
+            break
+        batches.append(batch)
+        lo += step
+
+    timings = []
+    for batch in batches:
+        t = time.perf_counter()
+        detector.update(batch)
+        timings.append(time.perf_counter() - t)
+    timings = np.array(timings)
+    readings = sum(len(batch) for batch in batches) * len(detector.columns)
+
+    print('%d nodes, %d watched columns, %d-second batches' % (args.nodes, len(detector.columns), args.batch))
+    print('seed with %d readings per node: %.0f ms' % (WARMUP, seed * 1e3))
+    print('per batch: median %.2f ms, p99 %.2f ms' % (np.median(timings) * 1e3, np.percentile(timings, 99) * 1e3))
+    print('throughput: %.0f readings/s' % (readings / timings.sum()))
+    print('one core busy keeping up at 1 Hz: %.1f%%' % (timings.mean() / args.batch * 100))
+    print('alarms kept: %d' % len(detector.alarms))
+
+
+if __name__ == '__main__':
+    main()
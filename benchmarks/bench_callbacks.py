@@ -0,0 +1,233 @@
+"""Cost of every dashboard callback on a synthetic plant, without a browser.
+
+    python -m benchmarks.bench_callbacks --nodes 200 --days 365 --freq 1min
+    python -m benchmarks.bench_callbacks --save baseline.json
+    python -m benchmarks.bench_callbacks --compare baseline.json --tolerance 1.5
+    python -m benchmarks.bench_callbacks --backend sqlite
+
+Builds EM, VFD and air stores from ``benchmarks.synthetic`` histories,
+serves them to the pages through ``register_store`` and mounts the pages on
+a headless Dash app (no ingestion or conversion threads, nothing under
+``data/`` is read).  With ``--backend sqlite`` the histories are written to
+SQLite databases in a temporary directory and served from there.  Each figure callback is run for every ``--views``
+date range, with its inputs filled in the way the page would:
+
+* data -- the callback body (store queries and figure building), without
+  the memo cache or instrumentation, best of ``--repeat``;
+* json -- serialising its figures the way Dash does, and the payload size,
+  raw and gzipped (the app compresses its responses);
+* request -- the whole ``/_dash-update-component`` round trip through the
+  Flask test client with the memo cache emptied, best of ``--repeat``;
+* cached -- the same request answered from the memo cache;
+* peak -- tracemalloc peak of data + json.
+
+The gauges are pushed rather than requested, so for them the snapshot
+event a new viewer receives is timed instead.  ``--save`` writes the
+numbers as JSON; ``--compare`` exits non-zero if any case's data + json or
+request time grew beyond ``--tolerance`` times the saved one.
+"""
+import argparse
+import gzip
+import inspect
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import dash
+import pandas as pd
+import pyarrow as pa
+from dash import html
+from plotly.io.json import to_json_plotly
+
+from benchmarks.synthetic import periods_for, synthetic
+from telemetry.figcache import figure_cache
+from telemetry.live import _event
+from telemetry.rollup import Rollups
+from telemetry.sources import SOURCES, derive, prepare
+from telemetry.sqlite import write_database
+from telemetry.store import BACKENDS, TelemetryStore, register_store
+
+# figure callbacks timed, by function name
+CALLBACKS = ['em_callbacks', 'thd_callbacks', 'em_alarm_callbacks', 'em_demand_callbacks', 'vfd_callbacks',
+             'vfd_alarm_callbacks', 'year_wise', 'cross_callbacks']
+# node dropdown id -> the source its options come from
+NODE_SELECTS = {'select_em_thd': 'em', 'select_vfd': 'vfd', 'cross-compressor-meters': 'em', 'cross-air-meters': 'air',
+                'cross-vfd': 'vfd', 'cross-feeder': 'em'}
+# browser viewport width the figures are downsampled for, px
+WIDTH = 1400
+
+
+def build_store(name, nodes, periods, freq, backend='arrow', directory=None):
+    source = SOURCES[name]
+    frame = derive(source, prepare(source, synthetic(name, nodes, periods, freq)))
+    if backend == 'arrow':
+        return TelemetryStore.from_frame(source, frame)
+    path = os.path.join(directory, name + '.sqlite')
+    long = Rollups.from_frame(frame, source.node_col, source.time_col, source.rollup_cols).to_long()
+    write_database(path, pa.Table.from_pandas(frame, preserve_index=False), long,
+                   source.node_col, source.time_col, {'synthetic': True})
+    return TelemetryStore.from_database(source, path)
+
+
+def view_dates(store, view):
+    first, last = store.extent()
+    start = {'day': last, 'week': last - pd.Timedelta(days=6), 'month': last - pd.Timedelta(days=29),
+             'all': first}[view]
+    return str(max(start, first).date()), str(last.date())
+
+
+def input_value(component, prop, dates, compare, stores):
+    if prop in ('start_date', 'end_date'):
+        return dates[prop == 'end_date']
+    if prop == 'relayoutData':
+        return None
+    if component in NODE_SELECTS:
+        return stores[NODE_SELECTS[component]].nodes()[:compare]
+    if component.endswith('-viewport'):
+        return WIDTH
+    if component.endswith('compare-mode'):
+        return 'overlay'
+    if component.endswith('-step'):
+        return '1h'
+    raise ValueError('no benchmark value for %s.%s' % (component, prop))
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def callback_case(app, client, key, entry, dates, compare, stores, repeat):
+    func = inspect.unwrap(entry['callback'])
+    inputs = [dict(spec, value=input_value(spec['id'], spec['property'], dates, compare, stores))
+              for spec in entry['inputs']]
+    state = [dict(spec, value=input_value(spec['id'], spec['property'], dates, compare, stores))
+             for spec in entry['state']]
+    args = [spec['value'] for spec in inputs + state]
+
+    def data():
+        with app.server.test_request_context():
+            return func(*args)
+
+    result = data()
+    payload = to_json_plotly(result)
+    outputs = [dict(zip(('id', 'property'), out.split('.'))) for out in key.strip('.').split('...')]
+    body = {'output': key, 'outputs': outputs if key.startswith('..') else outputs[0],
+            'inputs': inputs, 'state': state, 'changedPropIds': [inputs[0]['id'] + '.' + inputs[0]['property']]}
+
+    def request():
+        response = client.post('/_dash-update-component', json=body)
+        if response.status_code != 200:
+            raise RuntimeError('%s answered %s' % (key, response.status_code))
+
+    def cold_request():
+        figure_cache.clear()
+        request()
+
+    tracemalloc.start()
+    to_json_plotly(data())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'data ms': best_of(data, repeat) * 1e3,
+        'json ms': best_of(lambda: to_json_plotly(result), repeat) * 1e3,
+        'KB': len(payload) / 1e3,
+        'gzip KB': len(gzip.compress(payload.encode(), 6)) / 1e3,
+        'request ms': best_of(cold_request, repeat) * 1e3,
+        'cached ms': best_of(request, repeat) * 1e3,
+        'peak MB': peak / 2 ** 20,
+    }
+
+
+def gauge_case(store, repeat):
+    snapshot = lambda: _event('snapshot', store.latest.snapshot())
+    tracemalloc.start()
+    payload = snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'data ms': best_of(snapshot, repeat) * 1e3, 'json ms': 0.0, 'KB': len(payload) / 1e3,
+            'gzip KB': len(gzip.compress(payload, 6)) / 1e3, 'request ms': None, 'cached ms': None, 'peak MB': peak / 2 ** 20}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=50)
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--freq', default='1min')
+    parser.add_argument('--views', default='day,month', help='comma-separated: day, week, month, all')
+    parser.add_argument('--compare-nodes', type=int, default=1, help='nodes selected in the node dropdowns')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--backend', choices=BACKENDS, default='arrow')
+    parser.add_argument('--save', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    args = parser.parse_args()
+    # the pages still import the deprecated dash_*_components packages
+    warnings.simplefilter('ignore')
+
+    periods = periods_for(args.days, args.freq)
+    # removed when main returns
+    directory = tempfile.TemporaryDirectory(prefix='bench-callbacks-')
+    stores = {}
+    for name in SOURCES:
+        t = time.perf_counter()
+        stores[name] = build_store(name, args.nodes, periods, args.freq, args.backend, directory.name)
+        frame = stores[name].frame
+        print('%-4s %10d rows %8.0f MB  built in %.1f s' % (
+            name, len(frame), frame.memory_usage(deep=True).sum() / 2 ** 20, time.perf_counter() - t))
+        register_store(name, stores[name])
+
+    figure_cache.disk_dir = None
+    app = dash.Dash(__name__, use_pages=True, pages_folder='../pages', prevent_initial_callbacks=True)
+    app.layout = html.Div([dash.page_container])
+    client = app.server.test_client()
+    client.get('/')
+    entries = {entry['callback'].__wrapped__.__name__: (key, entry)
+               for key, entry in app.callback_map.items() if hasattr(entry.get('callback'), '__wrapped__')}
+
+    results = {}
+    for name in ('em', 'vfd'):
+        results['gauges (%s live snapshot)|-' % name] = gauge_case(stores[name], args.repeat)
+    for view in args.views.split(','):
+        for name in CALLBACKS:
+            key, entry = entries[name]
+            store = stores['air' if name == 'year_wise' else 'vfd' if name.startswith('vfd') else 'em']
+            results['%s|%s' % (name, view)] = callback_case(app, client, key, entry, view_dates(store, view),
+                                                            args.compare_nodes, stores, args.repeat)
+
+    metrics = ['data ms', 'json ms', 'KB', 'gzip KB', 'request ms', 'cached ms', 'peak MB']
+    print('%-32s %-6s %s' % ('case', 'view', ' '.join('%11s' % m for m in metrics)))
+    for case, row in results.items():
+        label, view = case.split('|')
+        print('%-32s %-6s %s' % (label, view, ' '.join(
+            '%11s' % ('-' if row[m] is None else '%.1f' % row[m]) for m in metrics)))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        slower = []
+        for case, row in results.items():
+            old = baseline.get(case)
+            if old is None:
+                continue
+            for now, before in ((row['data ms'] + row['json ms'], old['data ms'] + old['json ms']),
+                                (row['request ms'], old['request ms'])):
+                if now is not None and before and now > before * args.tolerance:
+                    slower.append('%s: %.1f ms, was %.1f ms' % (case, now, before))
+        if slower:
+            sys.exit('slower than %s:\n  %s' % (args.compare, '\n  '.join(slower)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Load time of the EM readings per input format.
+
+    python -m benchmarks.bench_formats --rows 50000
+
+Writes one synthetic EM history as xlsx, csv and parquet and times
+``read_raw`` on each (csv with both the pyarrow reader the sources use and
+pandas' default C parser), then the memory-mapped Arrow cache the pages
+actually read.  Writing the xlsx dominates the run time; keep ``--rows``
+modest.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_em
+from telemetry.schema import read_dtypes, usecols
+from telemetry.sources import SOURCES, read_raw
+from telemetry.store import _read_arrow, _write_arrow
+
+
+def best_of(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--nodes', type=int, default=6)
+    args = parser.parse_args()
+
+    source = SOURCES['em']
+    frame = synthetic_em(args.rows, args.nodes)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {ext: os.path.join(tmp, 'EM' + ext) for ext in ('.xlsx', '.csv', '.parquet', '.arrow')}
+        frame.to_excel(paths['.xlsx'], index=False)
+        frame.to_csv(paths['.csv'], index=False)
+        frame.to_parquet(paths['.parquet'], index=False)
+        _write_arrow(paths['.arrow'], frame)
+
+        cases = [
+            ('xlsx (openpyxl)', lambda: read_raw(source, paths['.xlsx'])),
+            ('csv (pandas C)', lambda: pd.read_csv(paths['.csv'], usecols=usecols('em'), dtype=read_dtypes('em'),
+                                                   parse_dates=[source.time_col])),
+            ('csv (pyarrow)', lambda: read_raw(source, paths['.csv'])),
+            ('parquet', lambda: read_raw(source, paths['.parquet'])),
+            ('arrow cache (mmap)', lambda: _read_arrow(paths['.arrow'])),
+        ]
+        print('%d rows x %d columns' % frame.shape)
+        print('%-20s %12s %10s' % ('format', 'load ms', 'file MB'))
+        for (name, fn), ext in zip(cases, ('.xlsx', '.csv', '.csv', '.parquet', '.arrow')):
+            repeat = 1 if ext == '.xlsx' else 3
+            print('%-20s %12.1f %10.1f' % (name, best_of(fn, repeat) * 1e3, os.path.getsize(paths[ext]) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Date-range query cost: legacy copy-and-mask vs the store's searchsorted views.
+
+    python -m benchmarks.bench_query --rows 10000000
+
+Times the data path of em_callbacks (all nodes, one day) and thd_callbacks
+(one node, one week) and reports tracemalloc peak memory for each, then
+the comparison mode: one week of k nodes, fetched by k legacy filters vs
+one batched ``by_node`` lookup.
+"""
+import argparse
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_em
+from telemetry.consumption import ConsumptionEngine
+from telemetry.sources import SOURCES
+from telemetry.store import TelemetryStore
+
+
+def legacy_em(df, start_date, end_date):
+    df_copy = df.copy()
+    df_copy = df_copy[(df_copy['DATE_TIME'] >= start_date) &
+                      (df_copy['DATE_TIME'] <= end_date)]
+    return df_copy.groupby('Node_Name', observed=True)['Last_consumption'].sum()
+
+
+def legacy_thd(df, start_date, end_date, node):
+    df_copy = df.copy()
+    return df_copy[(df_copy['DATE_TIME'] >= start_date) &
+                   (df_copy['DATE_TIME'] <= end_date) &
+                   (df_copy['Node_Name'] == node)]
+
+
+def store_em(store, start_date, end_date):
+    df_range = store.query(start_date=start_date, end_date=end_date,
+                           columns=['DATE_TIME', 'Node_Name', 'Last_consumption'])
+    return df_range.groupby('Node_Name', observed=True)['Last_consumption'].sum()
+
+
+def store_thd(store, start_date, end_date, node):
+    return store.query(node=node, start_date=start_date, end_date=end_date)
+
+
+def legacy_compare(df, start_date, end_date, nodes):
+    return {node: legacy_thd(df, start_date, end_date, node) for node in nodes}
+
+
+def store_compare(store, start_date, end_date, nodes):
+    return store.by_node(nodes, start_date, end_date)
+
+
+def measure(fn, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t)
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--nodes', type=int, default=40)
+    args = parser.parse_args()
+
+    source = SOURCES['em']
+    df = synthetic_em(args.rows, args.nodes)
+    df['Last_consumption'] = ConsumptionEngine.for_source(source).update(df)
+    store = TelemetryStore.from_frame(source, df)
+    middle = df['DATE_TIME'].iloc[len(df) // args.nodes // 2]
+    day = str(middle.date())
+    week_end = str((middle + pd.Timedelta(days=6)).date())
+    node = store.nodes()[0]
+
+    print('%d rows, %d nodes, %.0f MB' % (len(df), args.nodes, df.memory_usage(deep=True).sum() / 1e6))
+    print('%-26s %12s %12s' % ('query', 'latency ms', 'peak MB'))
+    cases = [
+        ('em_callbacks legacy', legacy_em, (df, day, day + ' 23:59:59')),
+        ('em_callbacks store', store_em, (store, day, day)),
+        ('thd_callbacks legacy', legacy_thd, (df, day, week_end + ' 23:59:59', node)),
+        ('thd_callbacks store', store_thd, (store, day, week_end, node)),
+    ]
+    for name, fn, fn_args in cases:
+        latency, peak = measure(fn, *fn_args)
+        print('%-26s %12.2f %12.1f' % (name, latency * 1e3, peak / 1e6))
+
+    print()
+    print('%-26s %12s %12s' % ('compare, one week', 'legacy ms', 'batched ms'))
+    for k in (1, 5, 10, 20):
+        nodes = store.nodes()[:k]
+        legacy, _ = measure(legacy_compare, df, day, week_end + ' 23:59:59', nodes, repeat=1)
+        batched, _ = measure(store_compare, store, day, week_end, nodes)
+        print('%-26s %12.2f %12.2f' % ('%d nodes' % k, legacy * 1e3, batched * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Shift tagging cost: the legacy per-row ``apply`` vs the calendar's searchsorted.
+
+    python -m benchmarks.bench_shifts --rows 1000000
+"""
+import argparse
+import datetime
+import time
+
+import pandas as pd
+
+from telemetry.shifts import CALENDARS
+
+
+def shift_assign(x):
+    if datetime.time(5, 45, 0) < x.time() < datetime.time(14, 20, 0):
+        return 'A'
+    elif datetime.time(14, 20, 0) < x.time() < datetime.time(22, 40, 0):
+        return 'B'
+    elif not (not (datetime.time(22, 40, 0) < x.time() < datetime.time(23, 59, 0)) and not (
+            datetime.time(00, 00, 0) < x.time() < datetime.time(5, 45, 0))):
+        return 'C'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    times = pd.Series(pd.date_range('2022-01-01', periods=args.rows, freq='1min'))
+    calendar = CALENDARS['plant']
+    for name, fn in (('legacy apply', lambda: times.apply(shift_assign)),
+                     ('calendar', lambda: calendar.assign(times))):
+        t = time.perf_counter()
+        fn()
+        print('%-14s %10.1f ms' % (name, (time.perf_counter() - t) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Cold-start time of the app: process start to first page served.
+
+    python -m benchmarks.bench_startup --runs 5 --max-seconds 3
+
+Every run is a fresh interpreter pointed (via ``TELEMETRY_DATA_DIR``) at a
+temporary copy of ``data/``, and reports
+
+* import -- ``import app``, which registers every page;
+* first request -- the first ``/`` request, where Dash builds its
+  validation layout from every page layout;
+* first visit -- rendering each page's layout through the page router.
+
+The first run starts without a cache (so it includes parsing the sources),
+the rest reuse the cache it wrote.  With ``--max-seconds`` the script
+exits non-zero when the median warm import + first request exceeds it, so
+CI can track regressions.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from telemetry.sources import DATA_DIR, SOURCES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, time, warnings
+warnings.simplefilter('ignore')
+t = time.perf_counter()
+import app
+timings = {'import': time.perf_counter() - t}
+client = app.app.server.test_client()
+t = time.perf_counter()
+client.get('/')
+timings['first request'] = time.perf_counter() - t
+t = time.perf_counter()
+for page in app.dash.page_registry.values():
+    layout = page['layout']
+    layout() if callable(layout) else layout
+timings['first visit'] = time.perf_counter() - t
+print(json.dumps(timings))
+'''
+
+
+def run_once(data_dir):
+    env = dict(os.environ, TELEMETRY_DATA_DIR=data_dir)
+    out = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        for source in SOURCES.values():
+            shutil.copy2(os.path.join(DATA_DIR, source.filename), data_dir)
+        runs = [run_once(data_dir) for _ in range(max(args.runs, 2))]
+
+    phases = list(runs[0])
+    print('%-12s %s' % ('run', ' '.join('%14s' % p for p in phases)))
+    for i, timings in enumerate(runs):
+        label = 'cold cache' if i == 0 else 'warm %d' % i
+        print('%-12s %s' % (label, ' '.join('%12.0f ms' % (timings[p] * 1e3) for p in phases)))
+    warm = statistics.median(t['import'] + t['first request'] for t in runs[1:])
+    print('median warm import + first request: %.0f ms' % (warm * 1e3))
+    if args.max_seconds is not None and warm > args.max_seconds:
+        sys.exit('cold start %.2fs exceeds %.2fs' % (warm, args.max_seconds))
+
+
+if __name__ == '__main__':
+    main()
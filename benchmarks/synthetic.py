@@ -0,0 +1,163 @@
+"""Synthetic meter histories shaped like the files under ``data/``.
+
+    synthetic('em', nodes=200, periods=periods_for(365, '1min'))
+
+Each source gets every column of its schema (``telemetry.schema``), in the
+schema's types, sorted by node then time like a store segment, so a frame
+can go straight through ``prepare``/``derive`` into a ``TelemetryStore``.
+The readings are tied together the way the real ones are rather than
+drawn independently:
+
+* every node follows a load curve -- a daily swing, quieter Sundays,
+  its own size and some noise -- and the measurements derive from it
+  (power factor and current THD worsen at light load, IGBT temperatures
+  and output currents rise with it, ...);
+* counters are cumulative sums of the power or flow, the VFD kWh register
+  rolling over at 10000 like the real one;
+* a few readings in ``SPIKE_RATE`` carry a spike, so the anomaly rules
+  have something to find.
+
+A year of 200 meters at one-minute resolution is 105M rows (about 11 GB
+as EM columns); scale ``nodes`` and ``periods`` to the memory at hand.
+"""
+import numpy as np
+import pandas as pd
+
+from telemetry.schema import coerce, usecols
+from telemetry.sources import SOURCES
+
+# share of readings of the watched columns that carry a spike
+SPIKE_RATE = 1e-4
+SQRT3 = np.float32(np.sqrt(3))
+
+
+def periods_for(days, freq='1min'):
+    """Readings per node in ``days`` at ``freq``."""
+    return max(int(pd.Timedelta(days=days) / pd.Timedelta(freq)), 1)
+
+
+def _noise(rng, shape, scale):
+    return rng.standard_normal(shape, dtype=np.float32) * np.float32(scale)
+
+
+def _spikes(rng, values, factor):
+    hit = rng.random(values.shape, dtype=np.float32) < SPIKE_RATE
+    values[hit] *= np.float32(factor)
+    return values
+
+
+def _load(rng, times, nodes):
+    """``(nodes, periods)`` load fraction in [0, 1]."""
+    hours = (times.hour + times.minute / 60).to_numpy(dtype=np.float32)
+    daily = 0.55 + 0.35 * np.sin(2 * np.pi * (hours - 8) / 24)
+    daily = np.where(times.dayofweek == 6, daily * 0.4, daily).astype(np.float32)
+    size = rng.uniform(0.5, 1.0, (nodes, 1)).astype(np.float32)
+    return np.clip(size * daily + _noise(rng, (nodes, len(times)), 0.05), 0, 1)
+
+
+def _counter(rate, hours, offset):
+    """Cumulative register from a per-reading ``rate`` (per hour) held for ``hours``."""
+    return np.cumsum(rate * hours, axis=1, dtype=np.float64) + offset[:, None]
+
+
+def _em(rng, times, nodes, hours):
+    load = _load(rng, times, nodes)
+    shape = load.shape
+    power = rng.uniform(20, 200, (nodes, 1)).astype(np.float32) * load
+    pf = np.clip(0.97 - 0.12 * (1 - load) + _noise(rng, shape, 0.01), 0.5, 1.0)
+    apparent = power / pf
+    ll = 415 * (1 - 0.02 * load) + _noise(rng, shape, 3.0)
+    columns = {
+        'Cumm_Power': _counter(power, hours, rng.uniform(1e4, 1e6, nodes)),
+        'Active_Power': power,
+        'Average_Apparent_Power': apparent,
+        'Average_Reactive_Power': np.sqrt(np.maximum(apparent ** 2 - power ** 2, 0)),
+        'Average_Power_Factor': pf,
+        'LL_Average_Voltage': ll,
+        'LN_Average_Voltage': ll / SQRT3 + _noise(rng, shape, 0.5),
+        'Average_Current': apparent * 1000 / (SQRT3 * ll),
+        'Frequency': 50 + _noise(rng, shape, 0.03),
+        'G_Ph_THD_Current': np.zeros(shape, dtype=np.float32),
+    }
+    thd_current = 4 + 25 * (1 - load) ** 2
+    for phase in 'RYB':
+        columns['%s_Ph_THD_Current' % phase] = _spikes(
+            rng, np.abs(thd_current + _noise(rng, shape, 1.5)), 4)
+    columns['N_Ph_THD_Current'] = 2 * thd_current + np.abs(_noise(rng, shape, 3.0))
+    thd_voltage = 1.6 + 1.2 * load
+    for ll_col, ln_col in (('R_Ph_THD_Voltage', 'RN_THD_Voltage'), ('Y_Ph_THD_Voltage', 'YN_THD_Voltage'),
+                           ('B_Ph_THD_Voltage', 'BN_THD_Voltage')):
+        columns[ll_col] = _spikes(rng, thd_voltage + _noise(rng, shape, 0.3), 3)
+        columns[ln_col] = thd_voltage + _noise(rng, shape, 0.3)
+    columns['L_L_Average_THD_Voltage'] = (columns['R_Ph_THD_Voltage'] + columns['Y_Ph_THD_Voltage'] +
+                                          columns['B_Ph_THD_Voltage']) / 3
+    columns['L_N_Average_THD_Voltage'] = (columns['RN_THD_Voltage'] + columns['YN_THD_Voltage'] +
+                                          columns['BN_THD_Voltage']) / 3
+    return columns
+
+
+def _vfd(rng, times, nodes, hours):
+    load = _load(rng, times, nodes)
+    shape = load.shape
+    set_freq = np.round(50 * np.clip(load, 0.1, 1.0), 1)
+    out_freq = set_freq + _noise(rng, shape, 0.05)
+    current = rng.uniform(100, 500, (nodes, 1)).astype(np.float32) * (0.3 + 0.7 * load)
+    columns = {}
+    for phase in 'UVW':
+        # each drive has its own small, steady phase imbalance
+        skew = rng.uniform(-0.03, 0.03, (nodes, 1)).astype(np.float32)
+        columns['Output_Current_' + phase] = _spikes(rng, current * (1 + skew) + _noise(rng, shape, 2.0), 1.5)
+        columns['IGBT_HS_Temperature_' + phase] = _spikes(
+            rng, 30 + 30 * load + skew * 100 + _noise(rng, shape, 0.5), 1.6)
+    avg = (columns['Output_Current_U'] + columns['Output_Current_V'] + columns['Output_Current_W']) / 3
+    v_in = 415 + _noise(rng, shape, 4.0)
+    kw = SQRT3 * 415 * avg * 0.9 / 1000 * (out_freq / 50)
+    columns.update({
+        'Energy_Meter_KWH': _counter(kw, hours, rng.uniform(0, 10000, nodes)) % SOURCES['vfd'].rollover,
+        'Output_Frequency': out_freq,
+        'Set_Frequency': set_freq,
+        'Motor_Speed': out_freq * 29.6 * (1 - 0.01 * load),
+        'Set_Speed': set_freq * 29.6,
+        'Output_Current_Avg': avg,
+        'Input_Voltage': v_in,
+        'Output_Voltage': 415 * out_freq / 50 + _noise(rng, shape, 2.0),
+        'DC_Bus_Voltage': 1.35 * v_in + _noise(rng, shape, 3.0),
+    })
+    return columns
+
+
+def _air(rng, times, nodes, hours):
+    load = _load(rng, times, nodes)
+    flow = rng.uniform(5, 40, (nodes, 1)).astype(np.float32) * load
+    consumption = flow * np.float32(hours * 60)
+    return {
+        'Flow_Total': np.cumsum(consumption, axis=1, dtype=np.float64) + rng.uniform(1e5, 1e7, (nodes, 1)),
+        'Flow_Rate': flow,
+        'Consumption': consumption,
+    }
+
+
+# source -> (node name prefix, column generator)
+GENERATORS = {'em': ('EM', _em), 'vfd': ('VFD', _vfd), 'air': ('Compressor', _air)}
+
+
+def synthetic(name, nodes=40, periods=1440, freq='1min', start='2022-01-01', seed=0):
+    """History of ``periods`` readings every ``freq`` for each of ``nodes`` nodes of source ``name``."""
+    source = SOURCES[name]
+    prefix, generate = GENERATORS[name]
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=periods, freq=freq)
+    hours = pd.Timedelta(freq) / pd.Timedelta(hours=1)
+    columns = generate(rng, times, nodes, hours)
+    names = ['%s %03d' % (prefix, i) for i in range(nodes)]
+    frame = pd.DataFrame({
+        source.time_col: np.tile(times.values, nodes),
+        source.node_col: pd.Categorical.from_codes(np.repeat(np.arange(nodes), periods), names),
+        **{col: values.ravel() for col, values in columns.items()},
+    })
+    return coerce(name, frame[usecols(name)])
+
+
+def synthetic_em(rows, nodes=40, freq='1min', seed=0):
+    """EM history of about ``rows`` readings spread over ``nodes`` meters."""
+    return synthetic('em', nodes, max(rows // nodes, 1), freq, seed=seed)
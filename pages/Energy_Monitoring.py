@@ -5,34 +5,43 @@ import dash
 from dash import Dash, callback
 import dash_html_components as html
 import dash_core_components as dcc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_daq as daq
 import datetime
-import os
+import functools
+from telemetry import LazyStore
+from telemetry.schema import usecols
+from telemetry.rollup import GRAIN_NAMES
+from telemetry.figcache import memoize
+from telemetry.metrics import instrument
+from telemetry.anomaly import alarm_table
+from telemetry.compare import MODES, compare_figure
+from telemetry.export import export_links
+from telemetry.live import live_outputs
+from telemetry.offload import checkpoint, offload
+from telemetry.packing import pack_figure, packed_graph
+from telemetry.downsample import downsample, point_budget, viewport_probe, zoom_range
 dash.register_page(__name__)
 
+store = LazyStore('em')
 
-def get_em():
-    path  = os.getcwd()
-    data = pd.read_excel(os.path.join(path,'data','EM.xlsx'))
-    data.sort_values(['DATE_TIME'], ascending=True)
-    data['Year'] = data['DATE_TIME'].dt.year
-    data['Month'] = data['DATE_TIME'].dt.month
-
-    for i in data['Node_Name'].unique():
-        data.loc[data['Node_Name'].str.contains(i), 'Last_consumption'] = data.loc[
-            data['Node_Name'].str.contains(i), 'Cumm_Power'].diff(-1)
-    return data
-
-
-df = get_em()
 
 gauge = ['Active_Power', 'Average_Apparent_Power', 'Average_Reactive_Power',
          'LL_Average_Voltage', 'LN_Average_Voltage', 'Average_Current',
          'R_Ph_THD_Current', 'Y_Ph_THD_Current', 'B_Ph_THD_Current',
          'L_L_Average_THD_Voltage', 'L_N_Average_THD_Voltage']
 card = ['Frequency', 'Average_Power_Factor']
+# demand KPI card -> (label, unit, decimals), from DemandEngine.current
+kpi_cards = {'Demand_15min': ('15 min Demand', 'KW', 2),
+             'Demand_30min': ('30 min Demand', 'KW', 2),
+             'Peak_Demand': ('24 h Peak Demand', 'KW', 2),
+             'Max_Demand_15min': ('Max Demand today', 'KW', 2),
+             'Load_Factor': ('Load Factor today', None, 3),
+             'Power_Factor': ('Power Factor today', None, 3)}
+# ms between refreshes of the demand KPI cards
+KPI_REFRESH = 60000
 
 
 def unit(x):
@@ -46,147 +55,10 @@ def unit(x):
         return None
 
 
-em_P1 = px.histogram(
-    data_frame=df.groupby(['Node_Name', 'Year', 'Month'], as_index=False).sum().sort_values('Last_consumption',
-                                                                                            ascending=False),
-    y='Last_consumption',
-    x='Node_Name',
-    labels={
-        'Node_Name': '<b>Area<b>',
-        'Last_consumption': '<b>Power Consumed in KW<b>'})
-em_P1.update_layout(
-    title='<b>Area-wise Energy consumption<b>',
-    title_x=0.5)
-
-em_P2 = px.histogram(
-    data_frame=df,
-    y='Last_consumption',
-    x='DATE_TIME',
-    color='Node_Name',
-    barmode='group',
-    labels={
-        'Node_Name': '<b>Area<b>',
-        'Last_consumption': '<b>Power Consumed in KW<b>'})
-em_P2.update_layout(
-    title='<b>Hourly Energy consumption<b>',
-    title_x=0.5)
-voltage_thd_list = [i for i in df.columns if 'THD_Voltage' in i]
-current_thd_list = [i for i in df.columns if 'THD_Current' in i]
-
-pd.options.plotting.backend = "plotly"
-em_P3 = df.plot(kind='scatter', x=df['DATE_TIME'], y=voltage_thd_list)
-em_P4 = df.plot(kind='scatter', x=df['DATE_TIME'], y=current_thd_list)
-
-layout = html.Div(children=[
-    html.H1('Plant Energy Monitoring',
-            style={'textAlign': 'center', 'color': 'blue'}),
-    html.Br(),
-    html.H3("Current Energy parameters' parameters", style={'textAlign': 'center', 'color': 'blue'}),
-    html.Br(),
-    dcc.Dropdown(
-        id='select_em',
-        value='WSHN LGT DB',
-        placeholder='Please select the Energy Meter',
-        options=[{'label': i, 'value': i} for i in df.Node_Name.unique()],
-        multi=False,
-        style={'width': '500px',
-               'verticalAlign': 'center',
-               'border': '2px black solid'}),
-    dcc.Interval(
-        id='interval-component',
-        interval=1 * 5000,
-        n_intervals=0),
-    html.Div([dbc.Card(
-        dbc.CardBody(
-            html.H3(f"{i.replace('_', ' ')} = {df[i][1]}", className="card-title", id="card_num1"))
-    ) for i in card]),
-    html.Div([
-        daq.Gauge(
-            id=i,
-            value=df[i].mean(),
-            label=i.replace('_', ' '),
-            units=unit(i),
-            showCurrentValue=True,
-            max=round(df[i].max()),
-            min=round(df[i].min(), 0), style={'width': '16%',
-                                              'display': 'inline-block',
-                                              "margin-left": "5px",
-                                              "margin-top": "5px",
-                                              'border': '2px black solid'}) for i in gauge
-    ]),
-    html.Br(),
-    html.H3("Analysis of wooshin EMs' parameters", style={'textAlign': 'center', 'color': 'blue'}),
-    html.Br(),
-    dcc.DatePickerRange(
-        id='em-date-picker-range',
-        start_date=df['DATE_TIME'].max().date(),
-        end_date=df['DATE_TIME'].max().date(),
-        min_date_allowed=df['DATE_TIME'].min().date(),
-        max_date_allowed=df['DATE_TIME'].max().date(),
-        display_format='DD MM YYYY',
-        updatemode='bothdates',
-        style={
-            'border': '2px black solid'}),
-    html.Br(),
-    html.H4("Energy consumption Analysis", style={'textAlign': 'center', 'color': 'blue'}),
-    dcc.Graph(id='em_wise', figure=em_P1, style={'width': '48%',
-                                                 'display': 'inline-block',
-                                                 'border': '2px black solid',
-                                                 }),
-    dcc.Graph(id='node_wise', figure=em_P2, style={'width': '48%',
-                                                   'display': 'inline-block',
-                                                   'border': '2px black solid',
-                                                   "margin-left": "2px"
-                                                   }),
-    html.Br(),
-    html.H4("THD Analysis", style={'textAlign': 'center', 'color': 'blue'}),
-    dcc.Dropdown(
-        id='select_em_thd',
-        value='WSHN LGT DB',
-        placeholder='Please select the Energy Meter',
-        options=[{'label': i, 'value': i} for i in df.Node_Name.unique()],
-        multi=False,
-        style={'width': '500px',
-               'verticalAlign': 'center',
-               'border': '2px black solid'}),
-
-    dcc.Graph(id='voltage_thd', figure=em_P3, style={'width': '48%',
-                                                     'display': 'inline-block',
-                                                     'border': '2px black solid'}),
-    dcc.Graph(id='current_thd', figure=em_P4, style={'width': '48%',
-                                                     'display': 'inline-block',
-                                                     'border': '2px black solid',
-                                                     "margin-left": "2px"})
-
-])
-
-
-@callback(
-    [Output(i, 'value') for i in gauge],
-    Input('select_em', 'value'),
-    Input('interval-component', 'n_intervals')
-)
-def gauge_update(em, n):
-    df_copy = df.copy()
-    df_copy = df_copy[df_copy['Node_Name'].str.contains(em)].reset_index(drop=True)
-    val = []
-    for i in gauge:
-        val.append(float(df_copy[i][0]))
-    return val[0], val[1], val[2], val[3], val[4], val[5], val[6], val[7], val[8], val[9], val[10]
-
-
-@callback(
-    [Output('em_wise', 'figure'),
-     Output('node_wise', 'figure'),
-     Input('em-date-picker-range', 'start_date'),
-     Input('em-date-picker-range', 'end_date')]
-)
-def em_callbacks(start_date, end_date):
-    df_copy = df.copy()
-    df_copy = df_copy[(df_copy['DATE_TIME'] >= start_date) &
-                      (df_copy['DATE_TIME'] <= end_date)]
+def area_figure(start_date, end_date):
+    totals = store.totals(start_date, end_date).rename_axis('Node_Name').reset_index()
     em_P1 = px.histogram(
-        data_frame=df_copy.groupby('Node_Name', as_index=False).sum().sort_values('Last_consumption', ascending=False),
+        data_frame=totals.sort_values('Last_consumption', ascending=False),
         y='Last_consumption',
         x='Node_Name',
         labels={
@@ -195,41 +67,334 @@ def em_callbacks(start_date, end_date):
     em_P1.update_layout(
         title='<b>Area-wise Energy consumption<b>',
         title_x=0.5, )
+    return em_P1
 
-    em_P2 = px.histogram(
-        data_frame=df_copy,
+
+def period_figure(start_date, end_date):
+    grain, periods = store.series(start_date, end_date)
+    em_P2 = px.bar(
+        data_frame=periods,
         y='Last_consumption',
-        x='DATE_TIME',
+        x='period',
         color='Node_Name',
         barmode='relative',
         labels={
             'Node_Name': '<b>Area<b>',
+            'period': '<b>DATE_TIME<b>',
             'Last_consumption': '<b>Power Consumed in KW<b>'},)
-
     em_P2.update_layout(
-        title='<b>Hourly Energy consumption<b>',
+        title='<b>%s Energy consumption<b>' % GRAIN_NAMES[grain],
         title_x=0.5,
         bargap=0.3)
+    return em_P2
+
+
+def shift_figure(start_date, end_date):
+    shifts = store.shift_totals(start_date, end_date, by_node=True)['Last_consumption'].reset_index()
+    em_shift = px.bar(
+        data_frame=shifts,
+        y='Last_consumption',
+        x='Node_Name',
+        color='Shift',
+        labels={
+            'Node_Name': '<b>Area<b>',
+            'Last_consumption': '<b>Power Consumed in KW<b>'},)
+    em_shift.update_layout(
+        title='<b>Shift-wise Energy consumption<b>',
+        title_x=0.5, )
+    return em_shift
+
+
+def demand_figure(days):
+    em_demand = px.bar(
+        data_frame=days,
+        y='Max_Demand_15min',
+        x='Day',
+        color='Node_Name',
+        barmode='group',
+        hover_data=['Max_Demand_15min_Time', 'Max_Demand_30min', 'Max_Demand_30min_Time', 'Average_Demand'],
+        labels={
+            'Node_Name': '<b>Area<b>',
+            'Day': '<b>DATE_TIME<b>',
+            'Max_Demand_15min': '<b>15 min Max Demand in KW<b>'},)
+    em_demand.update_layout(
+        title='<b>Daily maximum demand<b>',
+        title_x=0.5,
+        bargap=0.3)
+    return em_demand
+
+
+def power_quality_figure(days):
+    em_quality = px.line(
+        data_frame=days.melt(id_vars=['Node_Name', 'Day'], value_vars=['Load_Factor', 'Power_Factor']),
+        y='value',
+        x='Day',
+        color='Node_Name',
+        line_dash='variable',
+        markers=True,
+        labels={
+            'Node_Name': '<b>Area<b>',
+            'Day': '<b>DATE_TIME<b>',
+            'value': '<b>Ratio<b>',
+            'variable': '<b>KPI<b>'},)
+    em_quality.update_layout(
+        title='<b>Daily load factor and time-weighted power factor<b>',
+        title_x=0.5, )
+    return em_quality
+
+
+def kpi_text(key, value):
+    label, units, places = kpi_cards[key]
+    if value is None or pd.isna(value):
+        return f"{label} = -"
+    return f"{label} = {value:.{places}f}" + (f" {units}" if units else "")
 
-    return em_P1, em_P2
+
+voltage_thd_list = [i for i in usecols('em') if 'THD_Voltage' in i]
+current_thd_list = [i for i in usecols('em') if 'THD_Current' in i]
+
+thd_graphs = {'voltage_thd': voltage_thd_list, 'current_thd': current_thd_list}
+
+
+def thd_figure(graph, thd, start_date, end_date, width, revision, mode='overlay'):
+    cols = thd_graphs[graph]
+    parts = store.by_node(thd, start_date=start_date, end_date=end_date, columns=['DATE_TIME'] + cols)
+    budget = point_budget(width, share=0.48)
+    parts = {node: downsample(part, cols, budget) for node, part in parts.items()}
+    alarms = store.alarms(thd, columns=cols)
+    figure = compare_figure(parts, 'DATE_TIME', [(col, col) for col in cols], mode=mode, alarms=alarms)
+    figure.update_layout(uirevision=revision)
+    return pack_figure(figure)
+
+
+@offload('em_callbacks')
+def em_figures(start_date, end_date):
+    em_P1 = area_figure(start_date, end_date)
+    checkpoint()
+    em_P2 = period_figure(start_date, end_date)
+    checkpoint()
+    em_shift = shift_figure(start_date, end_date)
+    return [em_P1, em_P2, em_shift]
+
+
+@offload('thd_callbacks')
+def thd_figures(thd, start_date, end_date, width, revision, mode):
+    em_P3 = thd_figure('voltage_thd', thd, start_date, end_date, width, revision, mode)
+    checkpoint()
+    em_P4 = thd_figure('current_thd', thd, start_date, end_date, width, revision, mode)
+    return [em_P3, em_P4]
+
+
+@functools.lru_cache(maxsize=2)
+def gauge_ranges(data_version):
+    stats = store.column_stats(gauge)
+    return {i: (stats[i]['mean'], round(stats[i]['min'], 0), round(stats[i]['max'])) for i in gauge}
+
+
+viewport = viewport_probe('em')
+packed = [packed_graph(graph) for graph in thd_graphs]
+live_render = live_outputs('em', 'em', 'select_em', [(i, i) for i in gauge])
+downloads = export_links('em', 'em', 'em-date-picker-range', 'select_em_thd')
+
+
+def layout():
+    # built on each visit; the figures are filled in by the callbacks below
+    df = store.head(2)
+    first, last = store.extent()
+    ranges = gauge_ranges(store.data_version)
+    return html.Div(children=[
+        html.H1('Plant Energy Monitoring',
+                style={'textAlign': 'center', 'color': 'blue'}),
+        viewport,
+        html.Br(),
+        html.H3("Current Energy parameters' parameters", style={'textAlign': 'center', 'color': 'blue'}),
+        html.Br(),
+        dcc.Dropdown(
+            id='select_em',
+            value='WSHN LGT DB',
+            placeholder='Please select the Energy Meter',
+            options=[{'label': i, 'value': i} for i in store.nodes()],
+            multi=False,
+            style={'width': '500px',
+                   'verticalAlign': 'center',
+                   'border': '2px black solid'}),
+        live_render,
+        html.Div([dbc.Card(
+            dbc.CardBody(
+                html.H3(f"{i.replace('_', ' ')} = {df[i][1]}", className="card-title", id="card_num1"))
+        ) for i in card]),
+        html.Div([
+            daq.Gauge(
+                id=i,
+                value=ranges[i][0],
+                label=i.replace('_', ' '),
+                units=unit(i),
+                showCurrentValue=True,
+                max=ranges[i][2],
+                min=ranges[i][1], style={'width': '16%',
+                                         'display': 'inline-block',
+                                         "margin-left": "5px",
+                                         "margin-top": "5px",
+                                         'border': '2px black solid'}) for i in gauge
+        ]),
+        html.H3("Demand and power quality", style={'textAlign': 'center', 'color': 'blue'}),
+        dcc.Interval(id='em-kpi-refresh', interval=KPI_REFRESH),
+        html.Div([dbc.Card(
+            dbc.CardBody(
+                html.H3(kpi_text(i, None), className="card-title", id='em-kpi-' + i)),
+            style={'width': '32%', 'display': 'inline-block', "margin-left": "5px", "margin-top": "5px"}
+        ) for i in kpi_cards]),
+        html.Br(),
+        html.H3("Analysis of wooshin EMs' parameters", style={'textAlign': 'center', 'color': 'blue'}),
+        html.Br(),
+        dcc.DatePickerRange(
+            id='em-date-picker-range',
+            start_date=last.date(),
+            end_date=last.date(),
+            min_date_allowed=first.date(),
+            max_date_allowed=last.date(),
+            display_format='DD MM YYYY',
+            updatemode='bothdates',
+            style={
+                'border': '2px black solid'}),
+        downloads,
+        html.Br(),
+        html.H4("Energy consumption Analysis", style={'textAlign': 'center', 'color': 'blue'}),
+        dcc.Graph(id='em_wise', style={'width': '48%',
+                                       'display': 'inline-block',
+                                       'border': '2px black solid',
+                                       }),
+        dcc.Graph(id='node_wise', style={'width': '48%',
+                                         'display': 'inline-block',
+                                         'border': '2px black solid',
+                                         "margin-left": "2px"
+                                         }),
+        dcc.Graph(id='shift_wise', style={'width': '48%',
+                                          'display': 'inline-block',
+                                          'border': '2px black solid',
+                                          }),
+        html.Br(),
+        html.H4("Maximum demand and power quality", style={'textAlign': 'center', 'color': 'blue'}),
+        dcc.Graph(id='em_demand', style={'width': '48%',
+                                         'display': 'inline-block',
+                                         'border': '2px black solid',
+                                         }),
+        dcc.Graph(id='em_power_quality', style={'width': '48%',
+                                                'display': 'inline-block',
+                                                'border': '2px black solid',
+                                                "margin-left": "2px"
+                                                }),
+        html.Br(),
+        html.H4("THD Analysis", style={'textAlign': 'center', 'color': 'blue'}),
+        dcc.Dropdown(
+            id='select_em_thd',
+            value=['WSHN LGT DB'],
+            placeholder='Please select the Energy Meters to compare',
+            options=[{'label': i, 'value': i} for i in store.nodes()],
+            multi=True,
+            style={'width': '500px',
+                   'verticalAlign': 'center',
+                   'border': '2px black solid'}),
+        dcc.RadioItems(
+            id='em-compare-mode',
+            options=[{'label': label, 'value': mode} for mode, label in MODES.items()],
+            value='overlay',
+            inline=True),
+        *packed,
+
+        dcc.Graph(id='voltage_thd', style={'width': '48%',
+                                           'display': 'inline-block',
+                                           'border': '2px black solid'}),
+        dcc.Graph(id='current_thd', style={'width': '48%',
+                                           'display': 'inline-block',
+                                           'border': '2px black solid',
+                                           "margin-left": "2px"}),
+        dcc.Graph(id='em_alarms', style={'width': '97%',
+                                         'border': '2px black solid'})
+
+    ])
+
+
+@callback(
+    [Output('em_wise', 'figure'),
+     Output('node_wise', 'figure'),
+     Output('shift_wise', 'figure'),
+     Input('em-date-picker-range', 'start_date'),
+     Input('em-date-picker-range', 'end_date')],
+    prevent_initial_call=False
+)
+@instrument('em_callbacks')
+@memoize('em_callbacks', [store])
+def em_callbacks(start_date, end_date):
+    return em_figures(start_date, end_date)
+
+
+@callback(
+    [Output('voltage_thd-packed', 'data'),
+     Output('current_thd-packed', 'data')],
+    Input('em-date-picker-range', 'start_date'),
+    Input('em-date-picker-range', 'end_date'),
+    Input('select_em_thd', 'value'),
+    Input('em-compare-mode', 'value'),
+    Input('voltage_thd', 'relayoutData'),
+    Input('current_thd', 'relayoutData'),
+    State('em-viewport', 'data'),
+    prevent_initial_call=False
+)
+@instrument('thd_callbacks')
+@memoize('thd_callbacks', [store])
+def thd_callbacks(start_date, end_date, thd, mode, voltage_zoom, current_zoom, width):
+    if not thd:
+        raise PreventUpdate
+    revision = '%s|%s|%s|%s' % (thd, mode, start_date, end_date)
+    zooms = {'voltage_thd': voltage_zoom, 'current_thd': current_zoom}
+    graph = dash.ctx.triggered_id
+    if graph in zooms:
+        zoom = zoom_range(zooms[graph], start_date, end_date)
+        if zoom is None:
+            raise PreventUpdate
+        figures = [dash.no_update] * 2
+        figures[list(zooms).index(graph)] = thd_figure(graph, thd, *zoom, width, revision, mode)
+        return figures
+
+    return thd_figures(thd, start_date, end_date, width, revision, mode)
+
+
+@callback(
+    Output('em_alarms', 'figure'),
+    Input('select_em_thd', 'value'),
+    prevent_initial_call=False
+)
+@instrument('em_alarm_callbacks')
+@memoize('em_alarm_callbacks', [store])
+def em_alarm_callbacks(thd):
+    return alarm_table(store.alarms(thd or None))
+
+
+@callback(
+    [Output('em-kpi-' + i, 'children') for i in kpi_cards],
+    Input('select_em', 'value'),
+    Input('em-kpi-refresh', 'n_intervals'),
+    prevent_initial_call=False
+)
+@instrument('em_kpi_callbacks')
+def em_kpi_callbacks(node, n_intervals):
+    values = (store.demand_now(node) if node else None) or {}
+    return [kpi_text(i, values.get(i)) for i in kpi_cards]
 
 
 @callback(
-    [Output('voltage_thd', 'figure'),
-     Output('current_thd', 'figure')],
+    [Output('em_demand', 'figure'),
+     Output('em_power_quality', 'figure')],
     Input('em-date-picker-range', 'start_date'),
     Input('em-date-picker-range', 'end_date'),
-    Input('select_em_thd', 'value')
+    Input('select_em_thd', 'value'),
+    prevent_initial_call=False
 )
-def thd_callbacks(start_date, end_date, thd):
-    df_copy = df.copy()
-    df_copy = df_copy[(df_copy['DATE_TIME'] >= start_date) &
-                      (df_copy['DATE_TIME'] <= end_date) &
-                      (df_copy['Node_Name'] == thd)]
-    voltage_thd_list = [i for i in df_copy.columns if 'THD_Voltage' in i]
-    current_thd_list = [i for i in df_copy.columns if 'THD_Current' in i]
-
-    pd.options.plotting.backend = "plotly"
-    em_P3 = df_copy.plot(kind='scatter', x=df_copy['DATE_TIME'], y=voltage_thd_list)
-    em_P4 = df_copy.plot(kind='scatter', x=df_copy['DATE_TIME'], y=current_thd_list)
-    return em_P3, em_P4
+@instrument('em_demand_callbacks')
+@memoize('em_demand_callbacks', [store])
+def em_demand_callbacks(start_date, end_date, nodes):
+    if not nodes:
+        raise PreventUpdate
+    days = store.demand_days(nodes, start_date, end_date)
+    return [demand_figure(days), power_quality_figure(days)]
@@ -5,96 +5,128 @@ import dash
 from dash import Dash, callback
 import dash_html_components as html
 import dash_core_components as dcc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import datetime
-import os
+from telemetry import LazyStore
+from telemetry.figcache import memoize
+from telemetry.metrics import instrument
+from telemetry.export import export_links
+from telemetry.offload import checkpoint, offload
+from telemetry.downsample import downsample, point_budget, viewport_probe, zoom_range
+from telemetry.rollup import GRAIN_NAMES
 dash.register_page(__name__)
 
-path  = os.getcwd()
-file = 'vfd.csv'
-df = pd.read_csv(os.path.join(path,'data','Air_con.csv'))
-
-df['Date_Time'] = pd.to_datetime(df['Date_Time'])
-df.sort_values('Date_Time', ascending=False, inplace=True)
-
-
-def shift_assign(x):
-    if datetime.time(5, 45, 0) < x.time() < datetime.time(14, 20, 0):
-        return 'A'
-    elif datetime.time(14, 20, 0) < x.time() < datetime.time(22, 40, 0):
-        return 'B'
-    elif not (not (datetime.time(22, 40, 0) < x.time() < datetime.time(23, 59, 0)) and not (
-            datetime.time(00, 00, 0) < x.time() < datetime.time(5, 45, 0))):
-        return 'C'
-
-
-df['Shift'] = df['Date_Time'].apply(shift_assign)
-
-fig1 = px.line(data_frame=df, x='Date_Time', y='Flow_Rate', text='Flow_Rate')
-fig1.update_traces(textposition='bottom right')
-fig1.update_layout({'title': 'Flow Rate W.R.T Time'})
-fig2 = px.pie(data_frame=df, names='Shift', values='Consumption')
-fig2.update_layout({'title': 'Shift-wise % consumption'})
-fig3 = px.bar(data_frame=df, x='Date_Time', y='Consumption')
-fig3.update_layout({'title': 'Air Consumption W.R.T. Time'})
-fig4 = go.Figure(data=[go.Table(header=dict(values=['Date_Time', 'Flow_Rate', 'Consumption']),
-                                cells=dict(values=[df.head(10).Date_Time, df.head(10).Flow_Rate,
-                                                   df.head(10).Consumption]))
-                       ])
-
-layout = html.Div(children=[
-    html.H1('Plant Airflow Data',
-            style={'textAlign': 'center', 'color': 'blue'}),
-    html.Label('Please select date range here: ', style={'color': 'white'}),
-    dcc.DatePickerRange(
-        id='my-date-picker-range',
-        start_date=df['Date_Time'].max().date(),
-        end_date=df['Date_Time'].max().date(),
-        start_date_placeholder_text='Start date',
-        end_date_placeholder_text='End date',
-        min_date_allowed=df['Date_Time'].min().date(),
-        max_date_allowed=df['Date_Time'].max().date(),
-        display_format='DD MM YYYY',
-        updatemode='bothdates',
-        style={'background-color': 'blue',
-
-               'border': '2px black solid'}),
-    html.Div([
-        dcc.Graph(id='1', figure=fig1,
-                  style={'width': '65%',
-                         'display': 'inline-block',
-                         'border': '2px black solid'}),
-        dcc.Graph(id='2', figure=fig2,
-                  style={'width': '30%',
-                         'display': 'inline-block',
-                         'border': '2px black solid'}),
-        dcc.Graph(id='3', figure=fig3,
-                  style={'width': '50%',
-                         'display': 'inline-block',
-                         'border': '2px black solid'}),
-        dcc.Graph(id='4', figure=fig4,
-                  style={'width': '45%',
-                         'display': 'inline-block',
-                         'border': '2px black solid'})
-    ])
+store = LazyStore('air')
+
+
+def flow_figure(start_date, end_date, width, revision):
+    df_range = store.query(start_date=start_date, end_date=end_date, columns=['Date_Time', 'Flow_Rate'])
+    df_range = downsample(df_range, ['Flow_Rate'], point_budget(width, share=0.65))
+    fig1 = px.line(data_frame=df_range, x='Date_Time', y='Flow_Rate', text='Flow_Rate',)
+    fig1.update_traces(textposition='bottom right')
+    fig1.update_layout({'title': 'Flow Rate W.R.T Time'}, uirevision=revision)
+    return fig1
+
+
+def shift_figure(start_date, end_date):
+    shifts = store.shift_totals(start_date, end_date).rename_axis('Shift').reset_index()
+    fig2 = px.pie(data_frame=shifts, names='Shift', values='Consumption')
+    fig2.update_layout({'title': 'Shift-wise % consumption'})
+    return fig2
+
+
+def consumption_figure(start_date, end_date):
+    grain, periods = store.series(start_date, end_date)
+    fig3 = px.bar(data_frame=periods, x='period', y='Consumption', text='Consumption',
+                  labels={'period': 'Date_Time'})
+    fig3.update_layout({'title': '%s Air Consumption W.R.T. Time' % GRAIN_NAMES[grain]})
+    return fig3
+
+
+def latest_figure():
+    latest = store.tail(10).iloc[::-1]
+    fig4 = go.Figure(data=[go.Table(header=dict(values=['Date_Time', 'Flow_Rate', 'Consumption']),
+                                    cells=dict(values=[latest.Date_Time, latest.Flow_Rate,
+                                                       latest.Consumption]))
+                           ])
+    return fig4
 
-])
+
+@offload('year_wise')
+def air_figures(start_date, end_date, width, revision):
+    fig1 = flow_figure(start_date, end_date, width, revision)
+    checkpoint()
+    fig2 = shift_figure(start_date, end_date)
+    checkpoint()
+    fig3 = consumption_figure(start_date, end_date)
+    return [fig1, fig2, fig3]
+
+
+viewport = viewport_probe('air')
+downloads = export_links('air', 'air', 'my-date-picker-range')
+
+
+def layout():
+    # built on each visit; the figures are filled in by year_wise
+    first, last = store.extent()
+    return html.Div(children=[
+        html.H1('Plant Airflow Data',
+                style={'textAlign': 'center', 'color': 'blue'}),
+        viewport,
+        html.Label('Please select date range here: ', style={'color': 'white'}),
+        dcc.DatePickerRange(
+            id='my-date-picker-range',
+            start_date=last.date(),
+            end_date=last.date(),
+            start_date_placeholder_text='Start date',
+            end_date_placeholder_text='End date',
+            min_date_allowed=first.date(),
+            max_date_allowed=last.date(),
+            display_format='DD MM YYYY',
+            updatemode='bothdates',
+            style={'background-color': 'blue',
+
+                   'border': '2px black solid'}),
+        downloads,
+        html.Div([
+            dcc.Graph(id='1',
+                      style={'width': '65%',
+                             'display': 'inline-block',
+                             'border': '2px black solid'}),
+            dcc.Graph(id='2',
+                      style={'width': '30%',
+                             'display': 'inline-block',
+                             'border': '2px black solid'}),
+            dcc.Graph(id='3',
+                      style={'width': '50%',
+                             'display': 'inline-block',
+                             'border': '2px black solid'}),
+            dcc.Graph(id='4', figure=latest_figure(),
+                      style={'width': '45%',
+                             'display': 'inline-block',
+                             'border': '2px black solid'})
+        ])
+
+    ])
 
 
 @callback([Output('1', 'figure'),
            Output('2', 'figure'),
            Output('3', 'figure')],
           Input('my-date-picker-range', 'start_date'),
-          Input('my-date-picker-range', 'end_date'))
-def year_wise(start_date, end_date):
-    df_copy = df.copy()
-    df_copy = df_copy[(df_copy['Date_Time'] >= start_date) & (df_copy['Date_Time'] <= end_date)]
+          Input('my-date-picker-range', 'end_date'),
+          Input('1', 'relayoutData'),
+          State('air-viewport', 'data'),
+          prevent_initial_call=False)
+@instrument('year_wise')
+@memoize('year_wise', [store])
+def year_wise(start_date, end_date, flow_zoom, width):
+    revision = '%s|%s' % (start_date, end_date)
+    if dash.ctx.triggered_id == '1':
+        zoom = zoom_range(flow_zoom, start_date, end_date)
+        if zoom is None:
+            raise PreventUpdate
+        return flow_figure(*zoom, width, revision), dash.no_update, dash.no_update
 
-    fig1 = px.line(data_frame=df_copy, x='Date_Time', y='Flow_Rate', text='Flow_Rate',)
-    fig1.update_traces(textposition='bottom right')
-    fig1.update_layout({'title': 'Flow Rate W.R.T Time'})
-    fig2 = px.pie(data_frame=df_copy, names='Shift', values='Consumption')
-    fig2.update_layout({'title': 'Shift-wise % consumption'})
-    fig3 = px.bar(data_frame=df_copy, x='Date_Time', y='Consumption', text='Consumption',)
-    fig3.update_layout({'title': 'Air Consumption W.R.T. Time'})
-    return fig1, fig2, fig3
+    return air_figures(start_date, end_date, width, revision)
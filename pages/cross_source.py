@@ -0,0 +1,157 @@
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+import dash
+from dash import callback
+import dash_html_components as html
+import dash_core_components as dcc
+from dash.dependencies import Input, Output
+from dash.exceptions import PreventUpdate
+from telemetry import LazyStore
+from telemetry.align import Side, join
+from telemetry.figcache import memoize
+from telemetry.metrics import instrument
+from telemetry.offload import checkpoint, offload
+from telemetry.store import time_bounds
+dash.register_page(__name__)
+
+em = LazyStore('em')
+vfd = LazyStore('vfd')
+air = LazyStore('air')
+
+# grid step -> label, finest first
+STEPS = {'15min': '15 min', '1h': 'Hourly', '1D': 'Daily'}
+# the grid is coarsened until a range has at most this many intervals
+MAX_INTERVALS = 3000
+
+
+def grid_step(step, start, stop):
+    """``step``, or the first coarser one that splits ``[start, stop)`` into at most ``MAX_INTERVALS``."""
+    steps = list(STEPS)
+    for candidate in steps[steps.index(step):]:
+        if (stop - start) / pd.Timedelta(candidate).value <= MAX_INTERVALS:
+            return candidate
+    return steps[-1]
+
+
+def ratio(numerator, denominator):
+    return numerator / denominator.where(denominator > 0)
+
+
+def specific_energy_figure(meters, compressors, start, stop, step):
+    joined = join([Side('energy', em, 'Last_consumption', tuple(meters)),
+                   Side('air', air, 'Flow_Total', tuple(compressors), counter=True)], start, stop, step)
+    figure = make_subplots(rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.06,
+                           subplot_titles=['Energy in KWH', 'Air delivered (Flow_Total)', 'KWH per unit of air'])
+    figure.add_trace(go.Bar(x=joined.index, y=joined['energy'], name='Energy'), row=1, col=1)
+    figure.add_trace(go.Bar(x=joined.index, y=joined['air'], name='Air'), row=2, col=1)
+    figure.add_trace(go.Scatter(x=joined.index, y=ratio(joined['energy'], joined['air']), name='KWH per unit',
+                                mode='lines+markers'), row=3, col=1)
+    figure.update_layout(title='<b>%s specific energy of compressed air<b>' % STEPS[step], title_x=0.5,
+                         height=750, bargap=0.3)
+    return figure
+
+
+def feeder_figure(drives, feeders, start, stop, step):
+    joined = join([Side('vfd', vfd, 'Last_consumption', tuple(drives)),
+                   Side('feeder', em, 'Last_consumption', tuple(feeders))], start, stop, step)
+    figure = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.08,
+                           subplot_titles=['Energy in KWH', 'VFD share of the feeder in %'])
+    figure.add_trace(go.Scatter(x=joined.index, y=joined['feeder'], name='Feeder meter', mode='lines'), row=1, col=1)
+    figure.add_trace(go.Scatter(x=joined.index, y=joined['vfd'], name='VFD meters', mode='lines'), row=1, col=1)
+    figure.add_trace(go.Scatter(x=joined.index, y=100 * ratio(joined['vfd'], joined['feeder']), name='VFD share',
+                                mode='lines+markers'), row=2, col=1)
+    figure.update_layout(title='<b>%s VFD energy against its feeder<b>' % STEPS[step], title_x=0.5, height=600)
+    return figure
+
+
+@offload('cross_callbacks')
+def cross_figures(meters, compressors, drives, feeders, start, stop, step):
+    energy = specific_energy_figure(meters, compressors, start, stop, step) if meters and compressors else go.Figure()
+    checkpoint()
+    feeder = feeder_figure(drives, feeders, start, stop, step) if drives and feeders else go.Figure()
+    return [energy, feeder]
+
+
+def default_range():
+    # the last week all three sources have readings in, else EM's last week
+    extents = [store.extent() for store in (em, vfd, air)]
+    last = min(extent[1] for extent in extents)
+    first = max(extent[0] for extent in extents)
+    if first > last:
+        first, last = extents[0]
+    return max(first, last - pd.Timedelta(days=6)), last
+
+
+def node_dropdown(id_, store, value, placeholder):
+    return dcc.Dropdown(
+        id=id_,
+        value=value,
+        placeholder=placeholder,
+        options=[{'label': i, 'value': i} for i in store.nodes()],
+        multi=True,
+        style={'width': '500px',
+               'display': 'inline-block',
+               'verticalAlign': 'center',
+               'border': '2px black solid'})
+
+
+def layout():
+    # built on each visit; the figures are filled in by cross_callbacks
+    start, end = default_range()
+    first = min(store.extent()[0] for store in (em, vfd, air))
+    last = max(store.extent()[1] for store in (em, vfd, air))
+    return html.Div(children=[
+        html.H1('Cross-source Analysis',
+                style={'textAlign': 'center', 'color': 'blue'}),
+        html.P('Readings of the energy meters, VFDs and air meters are aligned on one time grid '
+               'before they are compared.'),
+        dcc.DatePickerRange(
+            id='cross-date-picker-range',
+            start_date=start.date(),
+            end_date=end.date(),
+            min_date_allowed=first.date(),
+            max_date_allowed=last.date(),
+            display_format='DD MM YYYY',
+            updatemode='bothdates',
+            style={
+                'border': '2px black solid'}),
+        dcc.RadioItems(
+            id='cross-step',
+            options=[{'label': label, 'value': step} for step, label in STEPS.items()],
+            value='1h',
+            inline=True),
+        html.Br(),
+        html.H4("Compressed air specific energy", style={'textAlign': 'center', 'color': 'blue'}),
+        node_dropdown('cross-compressor-meters', em, em.nodes()[:1], 'Energy meters feeding the compressors'),
+        node_dropdown('cross-air-meters', air, air.nodes(), 'Air meters'),
+        dcc.Graph(id='cross_specific_energy', style={'width': '97%',
+                                                     'border': '2px black solid'}),
+        html.Br(),
+        html.H4("VFD against feeder energy", style={'textAlign': 'center', 'color': 'blue'}),
+        node_dropdown('cross-vfd', vfd, vfd.nodes()[:1], 'VFDs'),
+        node_dropdown('cross-feeder', em, em.nodes()[:1], 'Upstream feeder meters'),
+        dcc.Graph(id='cross_feeder', style={'width': '97%',
+                                            'border': '2px black solid'}),
+    ])
+
+
+@callback(
+    [Output('cross_specific_energy', 'figure'),
+     Output('cross_feeder', 'figure')],
+    Input('cross-date-picker-range', 'start_date'),
+    Input('cross-date-picker-range', 'end_date'),
+    Input('cross-step', 'value'),
+    Input('cross-compressor-meters', 'value'),
+    Input('cross-air-meters', 'value'),
+    Input('cross-vfd', 'value'),
+    Input('cross-feeder', 'value'),
+    prevent_initial_call=False
+)
+@instrument('cross_callbacks')
+@memoize('cross_callbacks', [em, vfd, air])
+def cross_callbacks(start_date, end_date, step, meters, compressors, drives, feeders):
+    if not start_date or not end_date:
+        raise PreventUpdate
+    start, stop = time_bounds(start_date, end_date)
+    return cross_figures(meters, compressors, drives, feeders, start, stop, grid_step(step, start, stop))
@@ -0,0 +1,49 @@
+import plotly.graph_objects as go
+import dash
+from dash import callback, dcc, html
+from dash.dependencies import Input, Output
+from telemetry.metrics import PHASES, callback_metrics
+
+dash.register_page(__name__)
+
+# ms between refreshes of the table while the page is open
+REFRESH = 5000
+
+
+def spread(row, label, scale, fmt):
+    values = [row['%s p%d' % (label, q)] for q in (50, 95, 99)]
+    if values[0] is None:
+        return '-'
+    return ' / '.join(fmt % (v * scale) for v in values)
+
+
+def metrics_figure():
+    rows = callback_metrics.summary()
+    columns = [
+        ('Callback', lambda r: r['callback']),
+        ('Calls (ok / cached / prevented / error)',
+         lambda r: '%d / %d / %d / %d' % (r['ok'], r['cached'], r['prevented'], r['error'])),
+        *(('%s ms' % phase, lambda r, phase=phase: spread(r, phase, 1e3, '%.1f')) for phase in PHASES),
+        ('Payload KB', lambda r: spread(r, 'bytes', 1e-3, '%.0f')),
+        ('Rows', lambda r: spread(r, 'rows', 1, '%.0f')),
+    ]
+    figure = go.Figure(data=[go.Table(header=dict(values=[name for name, _ in columns]),
+                                      cells=dict(values=[[cell(r) for r in rows] for _, cell in columns]))])
+    figure.update_layout(title='Callbacks since startup, p50 / p95 / p99', height=200 + 40 * len(rows))
+    return figure
+
+
+def layout():
+    return html.Div([
+        html.H1('Dashboard diagnostics', style={'textAlign': 'center', 'color': 'blue'}),
+        html.P(['Per-callback timings of this worker; ', html.A('/metrics', href='/metrics'),
+                ' has the same histograms for Prometheus.']),
+        dcc.Graph(id='diagnostics-table', figure=metrics_figure()),
+        dcc.Interval(id='diagnostics-refresh', interval=REFRESH),
+    ])
+
+
+@callback(Output('diagnostics-table', 'figure'),
+          Input('diagnostics-refresh', 'n_intervals'))
+def refresh(n_intervals):
+    return metrics_figure()
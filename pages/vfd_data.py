@@ -1,4 +1,3 @@
-import os
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -6,224 +5,274 @@ import dash
 from dash import Dash, callback
 import dash_html_components as html
 import dash_core_components as dcc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_daq as daq
 import datetime
+from telemetry import LazyStore
+from telemetry.rollup import GRAIN_NAMES
+from telemetry.figcache import memoize
+from telemetry.metrics import instrument
+from telemetry.anomaly import alarm_table
+from telemetry.compare import MODES, compare_figure
+from telemetry.export import export_links
+from telemetry.live import live_outputs
+from telemetry.offload import checkpoint, offload
+from telemetry.packing import pack_figure, packed_graph
+from telemetry.downsample import downsample, point_budget, viewport_probe, zoom_range
 
 dash.register_page(__name__)
 
-path  = os.getcwd()
-file = 'vfd.csv'
-df = pd.read_csv(os.path.join(path,'data','vfd.csv'))
-
-df['Date_Time'] = pd.to_datetime(df['Date_Time'])
-df = df.sort_values('Date_Time').reset_index(drop=True)
-df['Node_Name'] = df['Node_Name'].str.strip()
-
-for i in df['Node_Name'].unique():
-    df.loc[df['Node_Name'].str.contains(i), 'Last_consumption'] = df.loc[
-        df['Node_Name'].str.contains(i), 'Energy_Meter_KWH'].diff(-1)
-
-df.drop(['Master_ID', 'Node_ID', 'Energy_Meter_MWH', 'Adjustable_OverCurrent_Level',
-         'UnderCurrent_Level', 'Output_Current_level', 'Earth_Fault_Detection_Level',
-         'Run_Time_Hrs', 'Energy_Saved_KWH'], inplace=True, axis=1)
-
-I_u = go.Scatter(x=df['Date_Time'], y=df['Output_Current_U'], name='U phase o/p current')
-I_v = go.Scatter(x=df['Date_Time'], y=df['Output_Current_V'], name='V phase o/p current')
-I_w = go.Scatter(x=df['Date_Time'], y=df['Output_Current_W'], name='W phase o/p current')
-I_a = go.Scatter(x=df['Date_Time'], y=df['Output_Current_Avg'], name='Average o/p current')
-O_c = go.Layout({'title': 'Output currents'})
-current = go.Figure(data=[I_u, I_v, I_w, I_a], layout=O_c)
-
-HS_u = go.Scatter(x=df['Date_Time'], y=df['IGBT_HS_Temperature_U'], name='U phase IGBT Temp.')
-HS_v = go.Scatter(x=df['Date_Time'], y=df['IGBT_HS_Temperature_V'], name='U phase IGBT Temp.')
-HS_w = go.Scatter(x=df['Date_Time'], y=df['IGBT_HS_Temperature_W'], name='U phase IGBT Temp.')
-HS_t = go.Layout({'title': 'IGBT Heat Sink Temperature'})
-temperature = go.Figure(data=[HS_u, HS_v, HS_w], layout=HS_t)
-
-V_i = go.Scatter(x=df['Date_Time'], y=df['Input_Voltage'], name='Input Voltage')
-V_o = go.Scatter(x=df['Date_Time'], y=df['Output_Voltage'], name='Output Voltage')
-V_d = go.Scatter(x=df['Date_Time'], y=df['DC_Bus_Voltage'], name='DC Voltage')
-V_t = go.Layout({'title': 'Voltages at different points'})
-voltage = go.Figure(data=[V_i, V_o, V_d], layout=V_t)
-
-consumption = px.histogram(data_frame=df, x='Date_Time', y='Last_consumption', color='Node_Name', barmode='group')
-
-layout = html.Div(children=[
-    html.H1('Plant VFD Data',
-            style={'textAlign': 'center', 'color': 'blue'}),
-    html.Br(),
-    html.H3('Current VFD parameters', style={'textAlign': 'center', 'color': 'blue'}),
-    html.Br(),
-    dcc.Dropdown(
-        id='select_vfd',
-        value='FDV Unit 3A',
-        placeholder='Please select the VFDs',
-        options=[{'label': i, 'value': i} for i in df.Node_Name.unique()],
-        multi=False,
-        style={'width': '500px',
-               'verticalAlign': 'center',
-               'border': '2px black solid'}),
-    html.Br(),
-    html.Div([
-        daq.Gauge(
-            id='Output_Current_U',
-            color={"gradient": True, "ranges": {"green": [0, 150], "yellow": [151, 200], "red": [201, 500]}},
-            value=200,
-            label='Output Current U',
-            max=500,
-            min=0, style={'width': '16%',
-                          'display': 'inline-block',
-                          'border': '2px black solid'}),
-        daq.Thermometer(
-            id='IGBT_HS_Temp_U',
-            value=200,
-            label='IGBT HS Temp U',
-            max=100,
-            min=0,
-            height=220,
-            width=10,
-            units="C", style={'width': '16%',
-                              'height': '100%',
-                              'display': 'inline-block'}),
-
-        daq.Gauge(
-            id='Output_Current_V',
-            color={"gradient": True, "ranges": {"green": [0, 150], "yellow": [151, 200], "red": [201, 500]}},
-            value=200,
-            label='Output Current V',
-            max=500,
-            min=0, style={'width': '16%',
-                          'display': 'inline-block',
-                          'border': '2px black solid'}),
-        daq.Thermometer(
-            id='IGBT_HS_Temp_V',
-            value=200,
-            label='IGBT HS Temp V',
-            max=100,
-            min=0,
-            height=220,
-            width=10,
-            units="C",
-            style={'width': '16%',
-                   'top': '0%',
-                   'display': 'inline-block'}),
-
-        daq.Gauge(
-            id='Output_Current_W',
-            value=200,
-            color={"gradient": True, "ranges": {"green": [0, 150], "yellow": [151, 200], "red": [201, 500]}},
-            label='Output Current W',
-            max=500,
-            min=0, style={'width': '16%',
-                          'display': 'inline-block',
-                          'border': '2px black solid'}),
-        daq.Thermometer(
-            id='IGBT_HS_Temp_W',
-            value=200,
-            label='IGBT HS Temp W',
-            max=100,
-            min=0,
-            height=220,
-            width=10,
-            units="C",
-            style={'width': '16%',
-                   'height': '100%',
-                   'display': 'inline-block'}),
-    ]),
-    html.Br(),
-    html.H3('Historical parameter analysis graphs', style={'textAlign': 'center', 'color': 'blue'}),
-    html.Br(),
-    dcc.DatePickerRange(
-        id='my-date-picker-range',
-        start_date=df['Date_Time'].max().date(),
-        end_date=df['Date_Time'].max().date(),
-        min_date_allowed=df['Date_Time'].min().date(),
-        max_date_allowed=df['Date_Time'].max().date(),
-        display_format='DD MM YYYY',
-        updatemode='bothdates',
-        style={
-            'border': '2px black solid'}),
-
-    html.Br(),
-    html.Div([
-        dcc.Graph(id='current', figure=current,
-                  style={'width': '48%',
-                         'display': 'inline-block',
-                         'border': '2px black solid'}),
-        dcc.Graph(id='temperature', figure=temperature,
-                  style={'width': '48%',
-                         'display': 'inline-block',
-                         'border': '2px black solid'}),
+store = LazyStore('vfd')
+
+instant = [('Output_Current_U', 'Output_Current_U'), ('Output_Current_V', 'Output_Current_V'),
+           ('Output_Current_W', 'Output_Current_W'), ('IGBT_HS_Temp_U', 'IGBT_HS_Temperature_U'),
+           ('IGBT_HS_Temp_V', 'IGBT_HS_Temperature_V'), ('IGBT_HS_Temp_W', 'IGBT_HS_Temperature_W')]
+
+# graph id -> (title, [(column, trace name), ...]) for the zoomable time series
+range_graphs = {
+    'current': ('Output currents', [
+        ('Output_Current_U', 'U phase o/p current'),
+        ('Output_Current_V', 'V phase o/p current'),
+        ('Output_Current_W', 'W phase o/p current'),
+        ('Output_Current_Avg', 'Average o/p current')]),
+    'temperature': ('IGBT Heat Sink Temperature', [
+        ('IGBT_HS_Temperature_U', 'U phase IGBT Temp.'),
+        ('IGBT_HS_Temperature_V', 'V phase IGBT Temp.'),
+        ('IGBT_HS_Temperature_W', 'W phase IGBT Temp.')]),
+    'voltage': ('Voltages at different points', [
+        ('Input_Voltage', 'Input Voltage'),
+        ('Output_Voltage', 'Output Voltage'),
+        ('DC_Bus_Voltage', 'DC Voltage')]),
+}
+
+
+def range_figure(graph, vfd, start_date, end_date, width, revision, mode='overlay'):
+    title, series = range_graphs[graph]
+    cols = [column for column, _ in series]
+    parts = store.by_node(vfd, start_date=start_date, end_date=end_date, columns=['Date_Time'] + cols)
+    budget = point_budget(width, share=0.48)
+    parts = {node: downsample(part, cols, budget) for node, part in parts.items()}
+    alarms = store.alarms(vfd, columns=cols)
+    figure = compare_figure(parts, 'Date_Time', series, title, mode, alarms)
+    figure.update_layout(uirevision=revision)
+    return pack_figure(figure)
+
+
+def consumption_figure(vfd, start_date, end_date):
+    grain, periods = store.series(start_date, end_date, node=vfd)
+    consumption = px.bar(data_frame=periods, x='period', y='Last_consumption', color='Node_Name', barmode='group',
+                         labels={'period': 'Date_Time'})
+    consumption.update_layout(title='%s consumption' % GRAIN_NAMES[grain])
+    return consumption
+
+
+def shift_figure(vfd, start_date, end_date):
+    shifts = store.shift_totals(start_date, end_date, node=vfd).rename_axis('Shift').reset_index()
+    shift = px.pie(data_frame=shifts, names='Shift', values='Last_consumption')
+    shift.update_layout(title='Shift-wise % consumption')
+    return shift
+
+
+@offload('vfd_callbacks')
+def vfd_figures(vfd, start_date, end_date, width, revision, mode):
+    figures = []
+    for graph in range_graphs:
+        figures.append(range_figure(graph, vfd, start_date, end_date, width, revision, mode))
+        checkpoint()
+    figures.append(consumption_figure(vfd, start_date, end_date))
+    checkpoint()
+    figures.append(shift_figure(vfd, start_date, end_date))
+    return figures
+
+
+viewport = viewport_probe('vfd')
+packed = [packed_graph(graph) for graph in range_graphs]
+live_render = live_outputs('vfd', 'vfd', 'select_vfd', instant)
+downloads = export_links('vfd', 'vfd', 'my-date-picker-range', 'select_vfd')
+
+
+def layout():
+    # built on each visit; the figures are filled in by vfd_callbacks
+    first, last = store.extent()
+    return html.Div(children=[
+        html.H1('Plant VFD Data',
+                style={'textAlign': 'center', 'color': 'blue'}),
+        viewport,
         html.Br(),
-        dcc.Graph(id='voltage', figure=voltage,
-                  style={'width': '48%',
-                         'display': 'inline-block',
-                         'border': '2px black solid'}),
-        dcc.Graph(id='consumption', figure=consumption,
-                  style={'width': '48%',
-                         'display': 'inline-block',
-                         'border': '2px black solid'})
-    ])
+        html.H3('Current VFD parameters', style={'textAlign': 'center', 'color': 'blue'}),
+        html.Br(),
+        dcc.Dropdown(
+            id='select_vfd',
+            value=['FDV Unit 3A'],
+            placeholder='Please select the VFDs',
+            options=[{'label': i, 'value': i} for i in store.nodes()],
+            multi=True,
+            style={'width': '500px',
+                   'verticalAlign': 'center',
+                   'border': '2px black solid'}),
+        html.Br(),
+        live_render,
+        html.Div([
+            daq.Gauge(
+                id='Output_Current_U',
+                color={"gradient": True, "ranges": {"green": [0, 150], "yellow": [151, 200], "red": [201, 500]}},
+                value=200,
+                label='Output Current U',
+                max=500,
+                min=0, style={'width': '16%',
+                              'display': 'inline-block',
+                              'border': '2px black solid'}),
+            daq.Thermometer(
+                id='IGBT_HS_Temp_U',
+                value=200,
+                label='IGBT HS Temp U',
+                max=100,
+                min=0,
+                height=220,
+                width=10,
+                units="C", style={'width': '16%',
+                                  'height': '100%',
+                                  'display': 'inline-block'}),
 
-])
+            daq.Gauge(
+                id='Output_Current_V',
+                color={"gradient": True, "ranges": {"green": [0, 150], "yellow": [151, 200], "red": [201, 500]}},
+                value=200,
+                label='Output Current V',
+                max=500,
+                min=0, style={'width': '16%',
+                              'display': 'inline-block',
+                              'border': '2px black solid'}),
+            daq.Thermometer(
+                id='IGBT_HS_Temp_V',
+                value=200,
+                label='IGBT HS Temp V',
+                max=100,
+                min=0,
+                height=220,
+                width=10,
+                units="C",
+                style={'width': '16%',
+                       'top': '0%',
+                       'display': 'inline-block'}),
 
+            daq.Gauge(
+                id='Output_Current_W',
+                value=200,
+                color={"gradient": True, "ranges": {"green": [0, 150], "yellow": [151, 200], "red": [201, 500]}},
+                label='Output Current W',
+                max=500,
+                min=0, style={'width': '16%',
+                              'display': 'inline-block',
+                              'border': '2px black solid'}),
+            daq.Thermometer(
+                id='IGBT_HS_Temp_W',
+                value=200,
+                label='IGBT HS Temp W',
+                max=100,
+                min=0,
+                height=220,
+                width=10,
+                units="C",
+                style={'width': '16%',
+                       'height': '100%',
+                       'display': 'inline-block'}),
+        ]),
+        html.Br(),
+        html.H3('Historical parameter analysis graphs', style={'textAlign': 'center', 'color': 'blue'}),
+        html.Br(),
+        dcc.DatePickerRange(
+            id='my-date-picker-range',
+            start_date=last.date(),
+            end_date=last.date(),
+            min_date_allowed=first.date(),
+            max_date_allowed=last.date(),
+            display_format='DD MM YYYY',
+            updatemode='bothdates',
+            style={
+                'border': '2px black solid'}),
+        dcc.RadioItems(
+            id='vfd-compare-mode',
+            options=[{'label': label, 'value': mode} for mode, label in MODES.items()],
+            value='overlay',
+            inline=True),
+        downloads,
 
-@callback(
-    [Output('Output_Current_U', 'value'),
-     Output('Output_Current_V', 'value'),
-     Output('Output_Current_W', 'value'),
-     Output('IGBT_HS_Temp_U', 'value'),
-     Output('IGBT_HS_Temp_V', 'value'),
-     Output('IGBT_HS_Temp_W', 'value')],
-    Input('select_vfd', 'value')
-)
-def instant_value(node):
-    df_copy = df.copy()
-    df_copy = df_copy[df_copy['Node_Name'] == node].reset_index(drop=True)
-    iu = int(df_copy['Output_Current_U'][0])
-    iv = int(df_copy['Output_Current_V'][0])
-    iw = int(df_copy['Output_Current_W'][0])
-    hu = int(df_copy['IGBT_HS_Temperature_U'][0])
-    hv = int(df_copy['IGBT_HS_Temperature_V'][0])
-    hw = int(df_copy['IGBT_HS_Temperature_W'][0])
-    return iu, iv, iw, hu, hv, hw
+        html.Br(),
+        html.Div(packed + [
+            dcc.Graph(id='current',
+                      style={'width': '48%',
+                             'display': 'inline-block',
+                             'border': '2px black solid'}),
+            dcc.Graph(id='temperature',
+                      style={'width': '48%',
+                             'display': 'inline-block',
+                             'border': '2px black solid'}),
+            html.Br(),
+            dcc.Graph(id='voltage',
+                      style={'width': '48%',
+                             'display': 'inline-block',
+                             'border': '2px black solid'}),
+            dcc.Graph(id='consumption',
+                      style={'width': '48%',
+                             'display': 'inline-block',
+                             'border': '2px black solid'}),
+            dcc.Graph(id='vfd_shift',
+                      style={'width': '48%',
+                             'display': 'inline-block',
+                             'border': '2px black solid'}),
+            dcc.Graph(id='vfd_alarms',
+                      style={'width': '48%',
+                             'display': 'inline-block',
+                             'border': '2px black solid'})
+        ])
+
+    ])
 
 
 @callback(
-    [Output('current', 'figure'),
-     Output('temperature', 'figure'),
-     Output('voltage', 'figure'),
-     Output('consumption', 'figure')],
+    [Output('current-packed', 'data'),
+     Output('temperature-packed', 'data'),
+     Output('voltage-packed', 'data'),
+     Output('consumption', 'figure'),
+     Output('vfd_shift', 'figure')],
     Input('my-date-picker-range', 'start_date'),
     Input('my-date-picker-range', 'end_date'),
     Input('select_vfd', 'value'),
+    Input('vfd-compare-mode', 'value'),
+    Input('current', 'relayoutData'),
+    Input('temperature', 'relayoutData'),
+    Input('voltage', 'relayoutData'),
+    State('vfd-viewport', 'data'),
+    prevent_initial_call=False
+)
+@instrument('vfd_callbacks')
+@memoize('vfd_callbacks', [store])
+def vfd_callbacks(start_date, end_date, vfd, mode, current_zoom, temperature_zoom, voltage_zoom, width):
+    if not vfd:
+        raise PreventUpdate
+    revision = '%s|%s|%s|%s' % (vfd, mode, start_date, end_date)
+    zooms = {'current': current_zoom, 'temperature': temperature_zoom, 'voltage': voltage_zoom}
+    graph = dash.ctx.triggered_id
+    if graph in zooms:
+        # zoomed in or reset: re-query just that graph at the resolution of its new range
+        zoom = zoom_range(zooms[graph], start_date, end_date)
+        if zoom is None:
+            raise PreventUpdate
+        figures = [dash.no_update] * 5
+        figures[list(zooms).index(graph)] = range_figure(graph, vfd, *zoom, width, revision, mode)
+        return figures
+
+    return vfd_figures(vfd, start_date, end_date, width, revision, mode)
+
+
+@callback(
+    Output('vfd_alarms', 'figure'),
+    Input('select_vfd', 'value'),
+    prevent_initial_call=False
 )
-def vfd_callbacks(start_date, end_date, vfd):
-    df_copy = df.copy()
-    df_copy = df_copy[(df_copy['Date_Time'] >= start_date) &
-                      (df_copy['Date_Time'] <= end_date) &
-                      (df_copy['Node_Name'] == vfd)]
-
-    I_u = go.Scatter(x=df_copy['Date_Time'], y=df_copy['Output_Current_U'], name='U phase o/p current')
-    I_v = go.Scatter(x=df_copy['Date_Time'], y=df_copy['Output_Current_V'], name='V phase o/p current')
-    I_w = go.Scatter(x=df_copy['Date_Time'], y=df_copy['Output_Current_W'], name='W phase o/p current')
-    I_a = go.Scatter(x=df_copy['Date_Time'], y=df_copy['Output_Current_Avg'], name='Average o/p current')
-    O_c = go.Layout({'title': 'Output currents'})
-    current = go.Figure(data=[I_u, I_v, I_w, I_a], layout=O_c)
-
-    HS_u = go.Scatter(x=df_copy['Date_Time'], y=df_copy['IGBT_HS_Temperature_U'], name='U phase IGBT Temp.')
-    HS_v = go.Scatter(x=df_copy['Date_Time'], y=df_copy['IGBT_HS_Temperature_V'], name='U phase IGBT Temp.')
-    HS_w = go.Scatter(x=df_copy['Date_Time'], y=df_copy['IGBT_HS_Temperature_W'], name='U phase IGBT Temp.')
-    HS_t = go.Layout({'title': 'IGBT Heat Sink Temperature'})
-    temperature = go.Figure(data=[HS_u, HS_v, HS_w], layout=HS_t)
-
-    V_i = go.Scatter(x=df_copy['Date_Time'], y=df_copy['Input_Voltage'], name='Input Voltage')
-    V_o = go.Scatter(x=df_copy['Date_Time'], y=df_copy['Output_Voltage'], name='Output Voltage')
-    V_d = go.Scatter(x=df_copy['Date_Time'], y=df_copy['DC_Bus_Voltage'], name='DC Voltage')
-    V_t = go.Layout({'title': 'Voltages at different points'})
-    voltage = go.Figure(data=[V_i, V_o, V_d], layout=V_t)
-
-    consumption = px.bar(data_frame=df_copy, x='Date_Time', y='Last_consumption', barmode='group')
-
-    return current, temperature, voltage, consumption
+@instrument('vfd_alarm_callbacks')
+@memoize('vfd_alarm_callbacks', [store])
+def vfd_alarm_callbacks(vfd):
+    return alarm_table(store.alarms(vfd or None))
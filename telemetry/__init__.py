@@ -0,0 +1,3 @@
+from telemetry.shifts import CALENDARS, ShiftCalendar
+from telemetry.sources import DATA_DIR, SOURCES, Source
+from telemetry.store import LazyStore, TelemetryStore, build_cache, get_store, load_store
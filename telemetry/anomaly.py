@@ -0,0 +1,258 @@
+"""Online anomaly detection over the ingested readings.
+
+Every batch a store ingests runs through the source's detector, which
+carries its state per node between batches in a few ``(node, column)``
+arrays, so each new reading costs a constant amount of work however long
+the history is.  The rules, per watched column:
+
+* threshold -- the reading went above ``limit`` (raised once on entering
+  the breach, not on every reading while it lasts);
+* zscore -- the reading is more than ``z`` standard deviations from the
+  node's exponentially weighted mean, once ``MIN_READINGS`` have been seen;
+* rate -- the reading changed faster than ``rate`` per minute since the
+  node's previous one;
+
+and per group of phase columns:
+
+* imbalance -- the largest deviation of a phase from the phases' mean, as
+  a percentage of that mean (the NEMA definition), above ``limit`` while
+  the mean is at least ``min_mean`` (i.e. the load is running).
+
+Only the exponentially weighted mean and variance depend on the previous
+reading's update, so batches are processed one reading per node at a time
+-- a batch of a few seconds at 1 Hz is a few vectorised steps over all
+nodes.  Everything else is vectorised over the whole batch.
+
+Alarms are kept as a frame of the ``MAX_ALARMS`` most recent, with the
+alarmed column and its reading so the pages can mark them on the charts.
+A store seeds its detector with each node's last ``WARMUP`` readings, so
+history before that raises no alarms: the pages show these as recent
+alarms rather than as the alarms of a date range.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# weight of a new reading in the moving mean and variance, about a 60-reading window
+ALPHA = 2 / 61
+# readings a node needs before its z-scores are trusted
+MIN_READINGS = 30
+# readings per node a store's detector is seeded with
+WARMUP = 256
+# alarms kept per source, newest first out
+MAX_ALARMS = 2000
+
+ALARM_COLUMNS = {'time': 'datetime64[ns]', 'node': object, 'column': object, 'rule': object,
+                 'value': 'float64', 'limit': 'float64', 'reading': 'float64'}
+
+
+@dataclass(frozen=True)
+class Watch:
+    column: str
+    limit: float = None
+    z: float = None
+    rate: float = None
+
+
+@dataclass(frozen=True)
+class Imbalance:
+    columns: tuple
+    limit: float
+    min_mean: float = 0.0
+
+
+RULES = {
+    'em': [
+        # IEEE 519 limit for individual voltage harmonic distortion below 1 kV
+        *(Watch(col, limit=5.0, z=4.0) for col in ('R_Ph_THD_Voltage', 'Y_Ph_THD_Voltage', 'B_Ph_THD_Voltage',
+                                                   'L_L_Average_THD_Voltage')),
+        # current THD swings with load, so only unusual jumps are flagged
+        *(Watch(col, z=4.0, rate=50.0) for col in ('R_Ph_THD_Current', 'Y_Ph_THD_Current', 'B_Ph_THD_Current')),
+    ],
+    'vfd': [
+        *(Watch(col, limit=80.0, z=4.0, rate=5.0) for col in ('IGBT_HS_Temperature_U', 'IGBT_HS_Temperature_V',
+                                                              'IGBT_HS_Temperature_W')),
+        *(Watch(col, z=4.0) for col in ('Output_Current_U', 'Output_Current_V', 'Output_Current_W')),
+        Imbalance(('Output_Current_U', 'Output_Current_V', 'Output_Current_W'), limit=10.0, min_mean=20.0),
+    ],
+}
+
+
+def _limits(watches, attr):
+    return np.array([np.nan if getattr(w, attr) is None else getattr(w, attr) for w in watches])
+
+
+class AnomalyDetector:
+    def __init__(self, node_col, time_col, rules, alpha=ALPHA, min_readings=MIN_READINGS):
+        self.node_col = node_col
+        self.time_col = time_col
+        self.watches = [rule for rule in rules if isinstance(rule, Watch)]
+        self.imbalances = [rule for rule in rules if isinstance(rule, Imbalance)]
+        self.alpha = alpha
+        self.min_readings = min_readings
+        self.columns = [w.column for w in self.watches]
+        self.limit, self.z, self.rate = (_limits(self.watches, attr) for attr in ('limit', 'z', 'rate'))
+
+        self._rows = {}
+        shape = (0, len(self.watches))
+        self.mean = np.empty(shape)
+        self.var = np.empty(shape)
+        self.count = np.empty(shape, dtype=np.int64)
+        self.last = np.empty(shape)
+        self.last_time = np.empty(0, dtype=np.int64)
+        self.breached = np.empty(shape, dtype=bool)
+        self.imbalanced = np.empty((0, len(self.imbalances)), dtype=bool)
+        self.alarms = pd.DataFrame({c: pd.Series(dtype=t) for c, t in ALARM_COLUMNS.items()})
+
+    @classmethod
+    def for_source(cls, source):
+        """The detector for ``source``'s rules, or None if it has none."""
+        rules = RULES.get(source.name)
+        return None if not rules else cls(source.node_col, source.time_col, rules)
+
+    def _state_rows(self, nodes):
+        added = [n for n in nodes if n not in self._rows]
+        if added:
+            k = len(added)
+            self._rows.update({n: len(self._rows) + i for i, n in enumerate(added)})
+            self.mean = np.vstack([self.mean, np.zeros((k, len(self.watches)))])
+            self.var = np.vstack([self.var, np.zeros((k, len(self.watches)))])
+            self.count = np.vstack([self.count, np.zeros((k, len(self.watches)), dtype=np.int64)])
+            self.last = np.vstack([self.last, np.full((k, len(self.watches)), np.nan)])
+            self.last_time = np.concatenate([self.last_time, np.full(k, np.iinfo(np.int64).min)])
+            self.breached = np.vstack([self.breached, np.zeros((k, len(self.watches)), dtype=bool)])
+            self.imbalanced = np.vstack([self.imbalanced, np.zeros((k, len(self.imbalances)), dtype=bool)])
+        return np.array([self._rows[n] for n in nodes], dtype=np.int64)
+
+    def update(self, frame):
+        """Check a batch sorted by node then time; returns (and keeps) the alarms it raised."""
+        if not len(frame):
+            return self.alarms.iloc[0:0]
+        nodes = pd.Categorical(frame[self.node_col])
+        rows = self._state_rows(nodes.categories.astype(str))[nodes.codes]
+        names = nodes.categories.astype(str).to_numpy()[nodes.codes]
+        times = frame[self.time_col].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        values = frame.reindex(columns=self.columns).to_numpy(dtype='float64', na_value=np.nan)
+
+        first = np.r_[True, rows[1:] != rows[:-1]]
+        last = np.r_[rows[1:] != rows[:-1], True]
+        starts = np.flatnonzero(first)
+        step = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+
+        found = []
+        with np.errstate(invalid='ignore', divide='ignore'):
+            breach = values > self.limit
+            found.append(('threshold', breach & ~self._previous(breach, self.breached, rows, first), values,
+                          np.broadcast_to(self.limit, values.shape)))
+            self.breached[rows[last]] = breach[last]
+
+            prev = self._previous(values, self.last, rows, first)
+            prev_time = self._previous(times, self.last_time, rows, first)
+            minutes = np.where(prev_time == np.iinfo(np.int64).min, np.nan, (times - prev_time) / 60e9)
+            rate = np.abs(values - prev) / np.where(minutes > 0, minutes, np.nan)[:, None]
+            found.append(('rate', rate > self.rate, rate, np.broadcast_to(self.rate, values.shape)))
+            self.last[rows[last]] = values[last]
+            self.last_time[rows[last]] = times[last]
+
+            zscore = self._zscores(values, rows, step)
+            found.append(('zscore', zscore > self.z, zscore, np.broadcast_to(self.z, values.shape)))
+
+        alarms = [self._alarms(rule, mask, value, limit, values, names, times, self.columns)
+                  for rule, mask, value, limit in found]
+        alarms += self._imbalance(frame, rows, names, times, first, last)
+        alarms = pd.concat([a for a in alarms if len(a)] or [self.alarms.iloc[0:0]], ignore_index=True)
+        if len(alarms):
+            alarms = alarms.sort_values('time', kind='mergesort')
+            self.alarms = pd.concat([self.alarms, alarms], ignore_index=True).iloc[-MAX_ALARMS:]
+        return alarms
+
+    @staticmethod
+    def _previous(current, state, rows, first):
+        """Each row's previous value within its node, from ``state`` for a node's first row."""
+        prev = np.empty_like(current)
+        prev[1:] = current[:-1]
+        prev[first] = state[rows[first]]
+        return prev
+
+    def _zscores(self, values, rows, step):
+        """z-score of every reading against its node's moving mean, updating the moving state."""
+        zscore = np.full(values.shape, np.nan)
+        order = np.argsort(step, kind='stable')
+        bounds = np.r_[0, np.cumsum(np.bincount(step))]
+        alpha = self.alpha
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            idx = order[lo:hi]
+            r = rows[idx]
+            x, mean, var, count = values[idx], self.mean[r], self.var[r], self.count[r]
+            ready = (count >= self.min_readings) & (var > 0)
+            dev = x - mean
+            zscore[idx] = np.where(ready, np.abs(dev) / np.sqrt(var), np.nan)
+            valid = ~np.isnan(x)
+            fresh = valid & (count == 0)
+            incr = alpha * dev
+            self.mean[r] = np.where(fresh, x, np.where(valid, mean + incr, mean))
+            self.var[r] = np.where(valid & ~fresh, (1 - alpha) * (var + dev * incr), var)
+            self.count[r] = count + valid
+        return zscore
+
+    def _imbalance(self, frame, rows, names, times, first, last):
+        alarms = []
+        for g, rule in enumerate(self.imbalances):
+            phases = frame.reindex(columns=list(rule.columns)).to_numpy(dtype='float64', na_value=np.nan)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = phases.mean(axis=1)
+                deviation = np.abs(phases - mean[:, None])
+                worst = np.nanargmax(np.where(np.isnan(deviation), -1, deviation), axis=1)
+                percent = deviation[np.arange(len(phases)), worst] / mean * 100
+                breach = (mean >= rule.min_mean) & (percent > rule.limit)
+            state = self.imbalanced[:, g]
+            entered = breach & ~self._previous(breach, state, rows, first)
+            state[rows[last]] = breach[last]
+            i = np.flatnonzero(entered)
+            alarms.append(pd.DataFrame({
+                'time': times[i].view('datetime64[ns]'), 'node': names[i],
+                'column': np.array(rule.columns, dtype=object)[worst[i]], 'rule': 'imbalance',
+                'value': percent[i], 'limit': rule.limit, 'reading': phases[i, worst[i]]}))
+        return alarms
+
+    @staticmethod
+    def _alarms(rule, mask, value, limit, values, names, times, columns):
+        i, c = np.nonzero(mask)
+        return pd.DataFrame({
+            'time': times[i].view('datetime64[ns]'), 'node': names[i],
+            'column': np.array(columns, dtype=object)[c], 'rule': rule,
+            'value': value[i, c], 'limit': limit[i, c], 'reading': values[i, c]})
+
+    def recent(self, nodes=None, start=None, stop=None, columns=None):
+        """Kept alarms, newest first, optionally for some nodes, columns or ``[start, stop)`` ns range."""
+        alarms = self.alarms
+        keep = np.ones(len(alarms), dtype=bool)
+        if nodes is not None:
+            keep &= alarms['node'].isin(list(nodes)).to_numpy()
+        if columns is not None:
+            keep &= alarms['column'].isin(list(columns)).to_numpy()
+        times = alarms['time'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        if start is not None:
+            keep &= times >= int(start)
+        if stop is not None:
+            keep &= times < int(stop)
+        return alarms[keep].iloc[::-1]
+
+
+RULE_NAMES = {'threshold': 'above limit', 'zscore': 'z-score', 'rate': 'rate of change / min',
+              'imbalance': 'phase imbalance %'}
+
+
+def alarm_table(alarms, rows=100):
+    """Table figure of the newest ``rows`` alarms."""
+    alarms = alarms.head(rows)
+    cells = [alarms['time'].dt.strftime('%Y-%m-%d %H:%M:%S'), alarms['node'], alarms['column'],
+             alarms['rule'].map(RULE_NAMES), alarms['value'].round(2), alarms['limit'].round(2),
+             alarms['reading'].round(2)]
+    figure = go.Figure(data=[go.Table(header=dict(values=['Time', 'Node', 'Column', 'Rule', 'Value', 'Limit',
+                                                          'Reading']),
+                                      cells=dict(values=cells))])
+    figure.update_layout(title='Recent alarms (%d shown)' % len(alarms))
+    return figure
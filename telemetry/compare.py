@@ -0,0 +1,88 @@
+"""Figures comparing several nodes side by side.
+
+A time-series graph is described by its title and its ``(column, name)``
+series; ``compare_figure`` draws those series for every node's rows (from
+``TelemetryStore.by_node``, one batched lookup) either
+
+* overlaid -- every node's traces on one set of axes, named
+  ``<node>: <series>`` and grouped per node in the legend; or
+* as small multiples -- one row of subplots per node on a shared time axis.
+
+With a single node the traces are just named after their series, and
+every series trace carries its column in ``meta`` (for
+``telemetry.packing``).  Alarms (see ``telemetry.anomaly``) can be marked
+on the nodes' traces.
+
+Traces are handed to plotly as plain dicts of numpy arrays and the figure
+is validated once.  Building a figure per node and moving its traces into
+the combined one costs a deep copy and a re-validation per trace, which
+was most of the callback time past a handful of nodes.
+"""
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+MODES = {'overlay': 'Overlay', 'multiples': 'Small multiples'}
+# height of one small-multiple row, px
+ROW_HEIGHT = 220
+
+
+def _traces(frame, x, series, **extra):
+    times = frame[x].to_numpy()
+    return [dict(type='scatter', x=times, y=frame[column].to_numpy(), name=name, meta=column, **extra)
+            for column, name in series]
+
+
+def _markers(alarms, **extra):
+    text = alarms['rule'] + ' ' + alarms['column'] + ': ' + alarms['value'].round(2).astype(str)
+    return [dict(type='scatter', mode='markers', x=alarms['time'].to_numpy(), y=alarms['reading'].to_numpy(),
+                 hovertext=text.to_numpy(), hoverinfo='x+text', marker=dict(symbol='x', size=9, color='red'),
+                 **extra)]
+
+
+def _within(alarms, times):
+    """``alarms`` raised between the first and last of ``times``."""
+    if not len(times):
+        return alarms.iloc[0:0]
+    return alarms[(alarms['time'] >= times.iloc[0]) & (alarms['time'] <= times.iloc[-1])]
+
+
+def compare_figure(parts, x, series, title=None, mode='overlay', alarms=None):
+    """Line figure of ``series`` (``[(column, name), ...]``) against ``x`` for every ``{node: frame}``.
+
+    ``alarms`` (a ``TelemetryStore.alarms`` frame) are marked on the
+    traces at the alarmed readings within each node's rows.
+    """
+    marked = {} if alarms is None else {node: _within(rows, parts[node][x]) for node, rows in alarms.groupby('node')
+                                        if node in parts}
+    marked = {node: rows for node, rows in marked.items() if len(rows)}
+    if mode == 'multiples' and len(parts) > 1:
+        figure = make_subplots(rows=len(parts), cols=1, shared_xaxes=True, vertical_spacing=0.04,
+                               subplot_titles=list(parts))
+        traces = []
+        for row, (node, frame) in enumerate(parts.items(), start=1):
+            axis = '' if row == 1 else str(row)
+            for trace in _traces(frame, x, series, xaxis='x' + axis, yaxis='y' + axis, showlegend=row == 1):
+                trace['legendgroup'] = trace['name']
+                traces.append(trace)
+            if node in marked:
+                shown = any(trace['legendgroup'] == 'alarms' for trace in traces)
+                traces += _markers(marked[node], name='recent alarms', legendgroup='alarms', xaxis='x' + axis,
+                                   yaxis='y' + axis, showlegend=not shown)
+        figure.add_traces(traces)
+        figure.update_layout(height=max(ROW_HEIGHT * len(parts), 450))
+    elif len(parts) > 1:
+        traces = []
+        for node, frame in parts.items():
+            for trace in _traces(frame, x, series, legendgroup=node):
+                trace['name'] = '%s: %s' % (node, trace['name'])
+                traces.append(trace)
+            if node in marked:
+                traces += _markers(marked[node], name='%s: recent alarms' % node, legendgroup=node)
+        figure = go.Figure(data=traces)
+    else:
+        traces = [trace for frame in parts.values() for trace in _traces(frame, x, series)]
+        for rows in marked.values():
+            traces += _markers(rows, name='recent alarms')
+        figure = go.Figure(data=traces)
+    figure.update_layout(title=title)
+    return figure
@@ -0,0 +1,64 @@
+"""Convert raw sources into the columnar cache ahead of serving.
+
+    python -m telemetry.convert [em vfd air]
+
+Parsing EM.xlsx is by far the slowest step between a source changing and
+the dashboard showing it, so it belongs in a deploy or cron step rather
+than in a request.  This converts every named source whose content
+changed since its cache was built (see ``telemetry.store.ensure_cache``)
+and reports how long each took.  With ``TELEMETRY_BACKEND=sqlite`` the
+SQLite database is rebuilt from the cache as well.
+
+Sources may be xlsx, csv or parquet files (``telemetry.sources.READERS``);
+the result is the same Arrow file either way.  The app also calls
+``start_conversion`` at startup, so a stale cache is rebuilt in the
+background and a first request waits for it instead of parsing again.
+"""
+import argparse
+import logging
+import threading
+import time
+
+from telemetry.sources import SOURCES
+from telemetry.store import ensure_backend
+
+logger = logging.getLogger(__name__)
+
+
+def convert(names=None):
+    """Bring the named caches up to date; returns seconds taken per source."""
+    timings = {}
+    for name in (list(SOURCES) if names is None else names):
+        t = time.perf_counter()
+        ensure_backend(name)
+        timings[name] = time.perf_counter() - t
+    return timings
+
+
+def _convert_logged(names):
+    try:
+        convert(names)
+    except Exception:
+        logger.exception('telemetry conversion failed')
+
+
+def start_conversion(names=None):
+    """Run ``convert`` in a daemon thread; returns the thread."""
+    thread = threading.Thread(target=_convert_logged, args=(names,), name='telemetry-convert', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', metavar='source', help='one of %s (default: all)' % ', '.join(SOURCES))
+    args = parser.parse_args()
+    unknown = set(args.names) - set(SOURCES)
+    if unknown:
+        parser.error('unknown source: %s' % ', '.join(sorted(unknown)))
+    for name, seconds in convert(args.names or None).items():
+        print('%-4s %-12s %8.0f ms' % (name, SOURCES[name].filename, seconds * 1e3))
+
+
+if __name__ == '__main__':
+    main()
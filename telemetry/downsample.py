@@ -0,0 +1,132 @@
+"""Server-side downsampling of long time series before they become figures.
+
+A figure never needs more points than its plot has pixels.  The budget
+comes from the browser viewport width (see ``point_budget``), and each
+series is reduced to that many points with either
+
+* min/max bucketing -- the lowest and highest sample of every bucket, so
+  spikes survive; fully vectorised, the default; or
+* LTTB (largest-triangle-three-buckets) -- one visually representative
+  sample per bucket, better for smooth lines.
+
+Rows are selected, not interpolated, so the result is a subset of the
+frame and multi-trace figures keep their traces aligned.
+"""
+import re
+
+import dash
+import numpy as np
+from dash import dcc, html
+from dash.dependencies import Input, Output
+
+DEFAULT_POINTS = 2000
+MIN_POINTS = 100
+
+
+def point_budget(width=None, share=1.0, per_pixel=2):
+    """Points worth sending to a graph ``share`` of a ``width``-px viewport wide."""
+    if not width:
+        return DEFAULT_POINTS
+    return max(int(width * share * per_pixel), MIN_POINTS)
+
+
+def viewport_probe(prefix):
+    """Components that record the browser width in ``<prefix>-viewport`` once the page loads.
+
+    Figure callbacks read it as ``State('<prefix>-viewport', 'data')`` and
+    pass it to ``point_budget``.
+    """
+    dash.clientside_callback(
+        'function(n) { return window.innerWidth; }',
+        Output(prefix + '-viewport', 'data'),
+        Input(prefix + '-viewport-probe', 'n_intervals'))
+    return html.Div([
+        dcc.Store(id=prefix + '-viewport'),
+        dcc.Interval(id=prefix + '-viewport-probe', interval=250, max_intervals=1),
+    ])
+
+
+def minmax_indices(y, buckets):
+    """Sorted positions of the min and max of ``y`` in each of ``buckets`` equal buckets."""
+    y = np.asarray(y, dtype='float64')
+    n = len(y)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    missing = np.isnan(padded)
+    offsets = np.arange(buckets) * size
+    lows = np.where(missing, np.inf, padded).argmin(axis=1) + offsets
+    highs = np.where(missing, -np.inf, padded).argmax(axis=1) + offsets
+    picked = np.concatenate([[0, n - 1], lows, highs])
+    return np.unique(picked[picked < n])
+
+
+def lttb_indices(x, y, n_out):
+    """Positions picked by largest-triangle-three-buckets, first and last always kept."""
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], max(edges[i + 1], edges[i] + 1)
+        nstart, nstop = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[nstart:max(nstop, nstart + 1)].mean()
+        avg_y = np.nanmean(y[nstart:max(nstop, nstart + 1)]) if nstop > nstart else y[n - 1]
+        area = np.abs((x[a] - avg_x) * (y[start:stop] - y[a])
+                      - (x[a] - x[start:stop]) * (avg_y - y[a]))
+        a = start + (int(np.nanargmax(area)) if not np.isnan(area).all() else 0)
+        picked[i + 1] = a
+    return np.unique(picked)
+
+
+def downsample(frame, y_cols, n_points=DEFAULT_POINTS, x_col=None, method='minmax'):
+    """Rows of ``frame`` that keep the shape of every ``y_cols`` series, at most ``n_points`` in all.
+
+    The budget is split evenly across ``y_cols``.  ``x_col`` (needed for
+    LTTB) is the time column; the frame must be sorted by it.
+    """
+    if method == 'lttb' and x_col is None:
+        raise ValueError("method='lttb' needs x_col, the column the frame is sorted by")
+    if len(frame) <= n_points:
+        return frame
+    share = max(n_points // max(len(y_cols), 1), 3)
+    picked = []
+    for col in y_cols:
+        y = frame[col].to_numpy(dtype='float64', na_value=np.nan)
+        if method == 'lttb':
+            x = frame[x_col].to_numpy(dtype='datetime64[ns]').view('int64')
+            picked.append(lttb_indices(x, y, share))
+        else:
+            # the first and last rows come on top of each bucket's min and max
+            picked.append(minmax_indices(y, max((share - 2) // 2, 1)))
+    return frame.iloc[np.unique(np.concatenate(picked))]
+
+
+def zoom_range(relayout, start_date, end_date):
+    """The (start, end) range a graph should show after a ``relayoutData`` event.
+
+    A zoom gives the zoomed x-range, a reset (autorange) the date-picker
+    range, and any event that leaves the x-axis alone gives None.
+    """
+    if not relayout:
+        return None
+    # any x axis: subplots (small multiples) report xaxis2, xaxis3, ...
+    for key, value in relayout.items():
+        axis, _, prop = key.partition('.')
+        if not re.fullmatch(r'xaxis\d*', axis):
+            continue
+        if prop == 'autorange' and value:
+            return start_date, end_date
+        if prop == 'range[0]':
+            return value, relayout[axis + '.range[1]']
+        if prop == 'range':
+            return tuple(value)
+    return None
@@ -0,0 +1,160 @@
+"""Streaming download of the rows behind the charts, as CSV or Parquet.
+
+``/export/<source>?start=...&end=...&node=...&format=csv|parquet``
+(``app.py``) answers with a generator pipeline: ``TelemetryStore.batches``
+reads ``BATCH_ROWS`` rows at a time, and each batch is encoded by
+pyarrow's CSV or Parquet writer into a ``_Drain`` that is emptied and
+handed to the server before the next batch is read.  A worker therefore
+holds one batch whatever the range and the number of nodes.  The CSV has
+one header line; the Parquet file one row group per batch, with its
+footer sent last.  Node and shift names are written as strings.
+
+Each export streams from its own request thread and uses neither the memo
+cache nor the report pool, so interactive callbacks are not queued behind
+it.  At most ``MAX_EXPORTS`` run at once; more are answered 503 with a
+``Retry-After``.  ``export_links`` puts download links on a page whose
+URLs follow its date picker and node dropdown.
+"""
+import json
+import threading
+
+import dash
+import flask
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from dash import html
+from dash.dependencies import Input, Output
+
+from telemetry.store import get_store, time_bounds
+
+# rows read, encoded and sent at a time
+BATCH_ROWS = 50000
+# exports streaming at once, per process
+MAX_EXPORTS = 4
+# format -> (mimetype, link label, pyarrow writer class)
+FORMATS = {'csv': ('text/csv', 'CSV', pacsv.CSVWriter),
+           'parquet': ('application/vnd.apache.parquet', 'Parquet', pq.ParquetWriter)}
+
+_slots = threading.BoundedSemaphore(MAX_EXPORTS)
+
+
+class _Drain:
+    """Write-only file collecting bytes until ``take`` hands them out."""
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _schema(empty):
+    fields = []
+    for col in empty.columns:
+        dtype = empty[col].dtype
+        fields.append(pa.field(col, pa.string() if isinstance(dtype, pd.CategoricalDtype) else pa.from_numpy_dtype(dtype)))
+    return pa.schema(fields)
+
+
+def encode(batches, empty, fmt):
+    """Bytes of a ``fmt`` file holding ``batches`` (frames shaped like ``empty``), one chunk per batch."""
+    schema = _schema(empty)
+    drain = _Drain()
+    with FORMATS[fmt][2](drain, schema) as writer:
+        for batch in batches:
+            writer.write_table(pa.Table.from_pandas(batch, schema=schema, preserve_index=False))
+            yield drain.take()
+    yield drain.take()
+
+
+def _streamed(chunks, release):
+    try:
+        yield from chunks
+    finally:
+        release()
+
+
+def export_response(name, args):
+    """Streaming response exporting the rows of ``name`` selected by the query ``args``."""
+    fmt = args.get('format', 'csv')
+    if fmt not in FORMATS:
+        flask.abort(400, 'format must be one of %s' % ', '.join(FORMATS))
+    start, end = args.get('start') or None, args.get('end') or None
+    try:
+        time_bounds(start, end)
+    except ValueError:
+        flask.abort(400, 'start and end must be dates')
+    if not _slots.acquire(blocking=False):
+        return flask.Response('too many exports running, retry shortly', 503, {'Retry-After': '10'})
+    released = []
+
+    def release():
+        # once, from whichever comes first: the stream ending or the server closing the response
+        if not released:
+            released.append(True)
+            _slots.release()
+
+    try:
+        store = get_store(name)
+        columns = args.getlist('column') or None
+        unknown = set(columns or ()) - set(store.segments[0].empty().columns)
+        if unknown:
+            flask.abort(400, 'unknown column: %s' % ', '.join(sorted(unknown)))
+        empty = store.segments[0].empty(columns)
+        batches = store.batches(args.getlist('node') or None, start, end, columns, BATCH_ROWS)
+        chunks = encode(batches, empty, fmt)
+        filename = '%s_%s_%s.%s' % (name, start or 'first', end or 'last', fmt)
+        response = flask.Response(_streamed(chunks, release), mimetype=FORMATS[fmt][0],
+                                  headers={'Content-Disposition': 'attachment; filename="%s"' % filename})
+    except BaseException:
+        release()
+        raise
+    response.call_on_close(release)
+    return response
+
+
+def export_links(prefix, name, date_picker, node_select=None):
+    """Download links for ``name``'s rows in the range of ``date_picker`` and the nodes of ``node_select``.
+
+    Their URLs are rebuilt in the browser whenever the selection changes.
+    Returns the links, which must be part of the page layout.
+    """
+    ids = ['%s-export-%s' % (prefix, fmt) for fmt in FORMATS]
+    inputs = [Input(date_picker, 'start_date'), Input(date_picker, 'end_date')]
+    if node_select is not None:
+        inputs.append(Input(node_select, 'value'))
+    dash.clientside_callback(
+        '''function(start, end, nodes) {
+            var params = new URLSearchParams();
+            if (start) { params.append('start', start); }
+            if (end) { params.append('end', end); }
+            [].concat(nodes || []).forEach(function(node) { params.append('node', node); });
+            return %s.map(function(fmt) { params.set('format', fmt); return '/export/%s?' + params; });
+        }''' % (json.dumps(list(FORMATS)), name),
+        [Output(id_, 'href') for id_ in ids],
+        inputs,
+        prevent_initial_call=False)
+    return html.Div(['Download the selected data: '] + [
+        html.A(FORMATS[fmt][1], id=id_, href='/export/%s?format=%s' % (name, fmt), download='',
+               style={'margin-right': '10px'})
+        for fmt, id_ in zip(FORMATS, ids)])
@@ -0,0 +1,185 @@
+"""Memoised callback results keyed by inputs and data version.
+
+Figure callbacks decorated with ``memoize`` are looked up by callback
+name, arguments, the input that triggered them and the ``data_version``
+of the stores they read, which changes whenever ingestion adds rows.  A
+hit returns the figures as plain dicts parsed from the cached JSON, so
+neither pandas nor plotly runs.  A result computed in the report pool is
+stored under the versions its worker read (``telemetry.offload``), which
+may be older than the web process's own.
+
+Two tiers, both size-bounded with least-recently-used eviction:
+
+* memory -- parsed results in an ordered dict, per worker;
+* disk -- the serialised JSON under ``data/.cache/figures``, shared by
+  every worker on the host (and served from the OS page cache).
+
+``figure_cache.stats()`` reports hits, misses and evictions per tier.
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import dash
+from plotly.utils import PlotlyJSONEncoder
+
+from telemetry.metrics import callback_metrics
+from telemetry.offload import read_versions
+from telemetry.store import CACHE_DIR, CACHE_VERSION, _atomic_write
+
+FIGURE_DIR = os.path.join(CACHE_DIR, 'figures')
+# the disk tier is swept for eviction once every this many writes
+SWEEP_EVERY = 16
+
+
+class FigureCache:
+    def __init__(self, max_bytes=64 * 2 ** 20, disk_dir=FIGURE_DIR, max_disk_bytes=512 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(['hits', 'disk_hits', 'misses', 'evictions', 'disk_evictions'], 0)
+
+    def stats(self):
+        return dict(self.counters, entries=len(self._entries), bytes=self._bytes)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return entry[1]
+        payload = self._disk_get(key)
+        if payload is None:
+            self.counters['misses'] += 1
+            return None
+        self.counters['disk_hits'] += 1
+        value = json.loads(payload)
+        self._remember(key, value, len(payload))
+        return value
+
+    def put(self, key, value):
+        """Cache ``value`` and return it as it will come back from ``get``."""
+        payload = json.dumps(value, cls=PlotlyJSONEncoder).encode()
+        parsed = json.loads(payload)
+        self._remember(key, parsed, len(payload))
+        self._disk_put(key, payload)
+        return parsed
+
+    def _remember(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[0]
+            self._entries[key] = (size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][0]
+                self.counters['evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + '.json')
+
+    def _disk_get(self, key):
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return payload
+
+    def _disk_put(self, key, payload):
+        if self.disk_dir is None:
+            return
+        os.makedirs(self.disk_dir, exist_ok=True)
+
+        def write(tmp):
+            with open(tmp, 'wb') as f:
+                f.write(payload)
+
+        _atomic_write(self._disk_path(key), write)
+        self._writes += 1
+        if self._writes % SWEEP_EVERY == 0:
+            self._disk_evict()
+
+    def _disk_evict(self):
+        # least recently used first: hits touch the file's mtime
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith('.json'):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.counters['disk_evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+figure_cache = FigureCache()
+
+
+def _triggered_id():
+    try:
+        return dash.ctx.triggered_id
+    except Exception:
+        return None
+
+
+def _key(name, args, trigger, versions):
+    raw = json.dumps([CACHE_VERSION, name, args, trigger, versions], default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def memoize(name, stores, cache=None):
+    """Cache a figure callback's outputs per (inputs, trigger, data version of ``stores``).
+
+    The versions are the ones the result was computed from: those its pool
+    jobs read, else this process's.  Results that contain ``dash.no_update``
+    (partial updates), or whose jobs read a store at different versions,
+    are not cached.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            target = figure_cache if cache is None else cache
+            trigger = _triggered_id()
+            versions = [store.data_version for store in stores]
+            value = target.get(_key(name, args, trigger, versions))
+            if value is not None:
+                callback_metrics.mark_cached()
+                return value
+            with read_versions() as read:
+                result = func(*args)
+            outputs = result if isinstance(result, (list, tuple)) else [result]
+            if any(output is dash.no_update for output in outputs):
+                return result
+            versions = [read.get(store.source.name, version) for store, version in zip(stores, versions)]
+            if None in versions:
+                return result
+            return target.put(_key(name, args, trigger, versions), result)
+        return wrapper
+    return decorator
+
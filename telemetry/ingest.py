@@ -0,0 +1,141 @@
+"""Background ingestion of new meter rows into the running stores.
+
+A daemon thread polls every source and appends whatever arrived since the
+last poll:
+
+* CSV sources (vfd, air) are tailed by byte offset, so only the bytes
+  written after the cached snapshot are parsed;
+* every source also watches a drop directory ``data/incoming/<name>/``
+  where any ``*.csv`` file with the source's columns is ingested once.
+  This is the route for EM readings, since EM.xlsx cannot be tailed.
+
+If a source file shrinks or, for Excel, changes at all, it was replaced
+rather than appended to and the store is reloaded from scratch.
+
+Sources are only followed once a page has loaded their store.  Each
+worker runs its own ingester against its own in-memory tail; the
+drop directory is never modified, so every worker sees every file.
+Whatever changes the latest readings is pushed to open pages through
+``telemetry.live``.
+"""
+import glob
+import io
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from telemetry.live import broadcaster
+from telemetry.sources import DATA_DIR, SOURCES
+from telemetry.store import get_store, peek_store, source_fingerprint
+
+INCOMING_DIR = os.path.join(DATA_DIR, 'incoming')
+
+logger = logging.getLogger(__name__)
+
+
+class CsvTail:
+    """Reads the complete lines appended to a CSV file since the last call."""
+
+    def __init__(self, path, offset):
+        self.path = path
+        self.offset = offset
+        with open(path, 'rb') as f:
+            self.header = f.readline()
+
+    def read(self):
+        size = os.path.getsize(self.path)
+        if size <= self.offset:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        end = chunk.rfind(b'\n') + 1
+        if not end:
+            return None
+        self.offset += end
+        return pd.read_csv(io.BytesIO(self.header + chunk[:end]), encoding='utf-8-sig')
+
+
+class DropDirectory:
+    """Yields each CSV file dropped into a directory exactly once."""
+
+    def __init__(self, path):
+        self.path = path
+        self.seen = set()
+
+    def read(self):
+        frames = []
+        for name in sorted(glob.glob(os.path.join(self.path, '*.csv'))):
+            if name not in self.seen:
+                self.seen.add(name)
+                frames.append(pd.read_csv(name, encoding='utf-8-sig'))
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+
+class Ingester:
+    def __init__(self, names=None, interval=2.0):
+        self.names = list(SOURCES) if names is None else list(names)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._readers = {}
+
+    def _readers_for(self, name):
+        source = SOURCES[name]
+        store = get_store(name)
+        readers = [DropDirectory(os.path.join(INCOMING_DIR, name))]
+        if source.filename.endswith('.csv'):
+            readers.append(CsvTail(source.path, store.source_state['size']))
+        return readers
+
+    def _source_replaced(self, name):
+        source = SOURCES[name]
+        current = source_fingerprint(source.path)
+        tails = [reader for reader in self._readers[name] if isinstance(reader, CsvTail)]
+        if tails:
+            return current['size'] < tails[0].offset
+        return current != get_store(name).source_state
+
+    def poll(self):
+        """Ingest everything that arrived since the previous poll."""
+        for name in self.names:
+            store = peek_store(name)
+            if store is None:
+                # not loaded yet: it will read the source as it is when first used
+                continue
+            if name not in self._readers:
+                self._readers[name] = self._readers_for(name)
+            if self._source_replaced(name):
+                logger.info('%s was replaced, reloading', SOURCES[name].path)
+                store.reload()
+                self._readers[name] = self._readers_for(name)
+                broadcaster.reset(name)
+                continue
+            for reader in self._readers[name]:
+                rows = reader.read()
+                if rows is not None:
+                    broadcaster.publish(name, store.append(rows))
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('telemetry ingestion failed')
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='telemetry-ingest', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def start_ingestion(interval=2.0):
+    """Start tailing all sources in a daemon thread; returns the ingester."""
+    return Ingester(interval=interval).start()
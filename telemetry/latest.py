@@ -0,0 +1,85 @@
+"""Latest reading per node, for the gauge callbacks.
+
+The numeric columns of every node's most recent row are kept in one
+float64 array with a ``node -> row`` dict in front of it, so a gauge read
+is a dict lookup plus one fancy-index instead of a filter over the frame.
+"""
+import numpy as np
+import pandas as pd
+
+
+class LatestIndex:
+    def __init__(self, node_col, time_col, columns):
+        self.node_col = node_col
+        self.time_col = time_col
+        self.columns = list(columns)
+        self._col_pos = {c: i for i, c in enumerate(self.columns)}
+        self._selections = {}
+        # (node -> row, row times, values) is swapped as a whole so readers never see a half update
+        self._state = ({}, np.empty(0, dtype='datetime64[ns]'), np.empty((0, len(self.columns))))
+
+    @classmethod
+    def from_frame(cls, latest, node_col, time_col):
+        """Build from a frame holding one (the newest) row per node."""
+        columns = [c for c in latest.columns
+                   if c not in (node_col, time_col) and pd.api.types.is_numeric_dtype(latest[c])]
+        index = cls(node_col, time_col, columns)
+        index.update(latest)
+        return index
+
+    def __contains__(self, node):
+        return node in self._state[0]
+
+    def time(self, node):
+        rows, times, _ = self._state
+        return pd.Timestamp(times[rows[node]])
+
+    def get(self, node, columns):
+        """Latest values of ``columns`` for ``node`` as a list of floats."""
+        rows, _, values = self._state
+        key = tuple(columns)
+        selection = self._selections.get(key)
+        if selection is None:
+            selection = self._selections[key] = np.array([self._col_pos[c] for c in columns])
+        return values[rows[node], selection].tolist()
+
+    def snapshot(self):
+        """Every node's latest values as ``{node: {column: value}}``, NaN as None."""
+        rows, _, values = self._state
+        return {node: self._as_dict(values[row]) for node, row in rows.items()}
+
+    def _as_dict(self, row, changed=None):
+        columns = self.columns if changed is None else [self.columns[i] for i in np.flatnonzero(changed)]
+        picked = row if changed is None else row[changed]
+        return {c: (None if np.isnan(v) else v) for c, v in zip(columns, picked.tolist())}
+
+    def update(self, frame):
+        """Fold in a batch sorted by node then time; older readings never replace newer ones.
+
+        Returns the values that changed as ``{node: {column: value}}``.
+        """
+        latest = frame.groupby(self.node_col, observed=True, sort=False).tail(1)
+        nodes = latest[self.node_col].astype(object).tolist()
+        new_times = latest[self.time_col].to_numpy(dtype='datetime64[ns]')
+        new_values = latest.reindex(columns=self.columns).to_numpy(dtype='float64', na_value=np.nan)
+
+        rows, times, values = self._state
+        added = [n for n in dict.fromkeys(nodes) if n not in rows]
+        if added:
+            rows = {**rows, **{n: len(rows) + i for i, n in enumerate(added)}}
+            times = np.concatenate([times, np.full(len(added), np.datetime64('NaT'), dtype='datetime64[ns]')])
+            values = np.vstack([values, np.full((len(added), len(self.columns)), np.nan)])
+        else:
+            times, values = times.copy(), values.copy()
+        changes = {}
+        for i, node in enumerate(nodes):
+            row = rows[node]
+            if np.isnat(times[row]) or new_times[i] >= times[row]:
+                old, new = values[row], new_values[i]
+                changed = (old != new) & ~(np.isnan(old) & np.isnan(new))
+                if changed.any():
+                    changes[node] = self._as_dict(new, changed)
+                times[row] = new_times[i]
+                values[row] = new
+        self._state = (rows, times, values)
+        return changes
@@ -0,0 +1,122 @@
+"""Server push of latest readings to open pages, over server-sent events.
+
+The ingester publishes, once per ingested batch, the latest-reading
+values that changed; the broadcaster serialises that delta once and hands
+the same bytes to every subscriber of the source.  Each browser tab holds
+one ``EventSource`` on ``/live/<source>`` (see ``assets/live.js``), which
+starts with a snapshot of every node and then merges the deltas.
+
+Gauges are filled from the browser's copy by a clientside callback (see
+``live_outputs``), so a tab makes no server requests for them at all; the
+server's cost per update is one delta, whatever the number of viewers.
+
+Subscribers are plain bounded queues fed from the ingester thread.  A tab
+that falls too far behind is dropped and reconnects to a fresh snapshot.
+"""
+import json
+import queue
+import threading
+
+import dash
+from dash import dcc
+from dash.dependencies import Input, Output
+
+from telemetry.store import get_store
+
+# seconds between keep-alive comments on an idle stream
+KEEPALIVE = 15
+# events queued for one subscriber before it is dropped as too slow
+MAX_PENDING = 256
+# how often (ms) the browser copies its pushed readings into the gauges; no server traffic
+RENDER_INTERVAL = 500
+
+
+def _event(kind, payload):
+    return ('event: %s\ndata: %s\n\n' % (kind, json.dumps(payload, separators=(',', ':')))).encode()
+
+
+class _Subscriber:
+    def __init__(self):
+        self.events = queue.Queue(MAX_PENDING)
+        self.dropped = False
+
+
+class Broadcaster:
+    def __init__(self):
+        self._subscribers = {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, name):
+        subscriber = _Subscriber()
+        with self._lock:
+            self._subscribers.setdefault(name, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, name, subscriber):
+        with self._lock:
+            self._subscribers.get(name, set()).discard(subscriber)
+
+    def subscribers(self, name):
+        with self._lock:
+            return len(self._subscribers.get(name, ()))
+
+    def publish(self, name, changes):
+        """Send ``changes`` (``{node: {column: value}}``) to every subscriber of ``name``."""
+        if changes:
+            self._send(name, _event('delta', changes))
+
+    def reset(self, name):
+        """Send every subscriber a fresh snapshot, e.g. after the store was reloaded."""
+        self._send(name, self.snapshot(name))
+
+    def _send(self, name, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(name, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.events.put_nowait(message)
+            except queue.Full:
+                subscriber.dropped = True
+                self.unsubscribe(name, subscriber)
+
+    def snapshot(self, name):
+        """Snapshot event for ``name``, serialised once per store version."""
+        store = get_store(name)
+        version = store.version
+        cached = self._snapshots.get(name)
+        if cached is None or cached[0] != version:
+            cached = self._snapshots[name] = (version, _event('snapshot', store.latest.snapshot()))
+        return cached[1]
+
+    def stream(self, name):
+        """Server-sent event stream for one client: a snapshot, then deltas."""
+        subscriber = self.subscribe(name)
+        try:
+            yield self.snapshot(name)
+            while not subscriber.dropped:
+                try:
+                    yield subscriber.events.get(timeout=KEEPALIVE)
+                except queue.Empty:
+                    yield b': keep-alive\n\n'
+        finally:
+            self.unsubscribe(name, subscriber)
+
+
+broadcaster = Broadcaster()
+
+
+def live_outputs(prefix, name, node_id, targets):
+    """Fill ``targets`` (``[(component id, column), ...]``) from pushed readings of ``name``.
+
+    The values follow the node selected in ``node_id``'s ``value`` (the first
+    one, for a multi-select dropdown).
+    Returns the render timer, which must be part of the page layout.
+    """
+    dash.clientside_callback(
+        'function(n, node) { return window.telemetryLive.values(%s, %s, n, node, %s); }' % (
+            json.dumps(name), json.dumps(prefix), json.dumps([column for _, column in targets])),
+        [Output(component, 'value') for component, _ in targets],
+        Input(prefix + '-live-render', 'n_intervals'),
+        Input(node_id, 'value'))
+    return dcc.Interval(id=prefix + '-live-render', interval=RENDER_INTERVAL)
@@ -0,0 +1,269 @@
+"""Latency, payload and row metrics of the dashboard callbacks.
+
+Every page callback is wrapped in ``instrument(name)``, which splits its
+wall time into phases:
+
+* query -- time inside the store's query methods (``timed_query``), which
+  also count the rows they return;
+* figure -- the rest of the callback body: reshaping, downsampling and
+  building the plotly figures (or the lookup, for a memo-cache hit, which
+  records no query time or rows; for a report computed in the pool of
+  ``telemetry.offload``, the wait for the worker, whose query time and
+  rows are reported back);
+* serialize -- from the callback returning to the response being ready,
+  i.e. Dash validating the outputs and encoding them as JSON;
+* total -- all of the above, as seen by the server.
+
+Response bytes are recorded as the payload, the server-side proxy for
+network transfer time.  Everything lands in fixed-bucket histograms
+(Prometheus ``le`` semantics), so recording is a bisect and a few adds
+under a lock, a few microseconds per callback, and p50/p95/p99 are
+estimated from the buckets the way ``histogram_quantile`` does.
+
+``exposition()`` renders the Prometheus text format for ``/metrics``;
+``summary()`` feeds the diagnostics page.
+"""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+
+import flask
+from dash.exceptions import PreventUpdate
+
+# histogram upper bounds
+SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES = (1e3, 4e3, 16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6)
+ROWS = (10, 100, 1e3, 1e4, 1e5, 1e6, 1e7)
+
+PHASES = ('query', 'figure', 'serialize', 'total')
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate of the ``q`` quantile, interpolating within its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lo = 0.0 if i == 0 else self.bounds[i - 1]
+                return lo + (self.bounds[i] - lo) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+
+class _Call:
+    __slots__ = ('name', 'start', 'returned', 'query', 'rows', 'depth', 'cached')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.returned = None
+        self.query = 0.0
+        self.rows = 0
+        self.depth = 0
+        self.cached = False
+
+
+_current = contextvars.ContextVar('telemetry_callback', default=None)
+
+
+def _rows(result):
+    if isinstance(result, dict):
+        return sum(_rows(v) for v in result.values())
+    if isinstance(result, (tuple, list)):
+        return sum(_rows(v) for v in result)
+    return len(result) if hasattr(result, 'shape') else 0
+
+
+class CallbackMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._calls = {}
+
+    def _observe(self, family, labels, bounds, value):
+        with self._lock:
+            histogram = self._histograms.get((family, labels))
+            if histogram is None:
+                histogram = self._histograms[(family, labels)] = Histogram(bounds)
+            histogram.observe(value)
+
+    def _count(self, name, outcome):
+        with self._lock:
+            self._calls[(name, outcome)] = self._calls.get((name, outcome), 0) + 1
+
+    def instrument(self, name):
+        """Decorator recording the phases of the callback ``name``."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                call = _Call(name)
+                token = _current.set(call)
+                try:
+                    result = func(*args)
+                except PreventUpdate:
+                    self._count(name, 'prevented')
+                    raise
+                except Exception:
+                    self._count(name, 'error')
+                    raise
+                finally:
+                    _current.reset(token)
+                call.returned = time.perf_counter()
+                if not call.cached:
+                    # a memo-cache hit ran no queries; its lookup time counts as the figure phase
+                    self._observe('seconds', (name, 'query'), SECONDS, call.query)
+                    self._observe('rows', (name,), ROWS, call.rows)
+                self._observe('seconds', (name, 'figure'), SECONDS, call.returned - call.start - call.query)
+                if flask.has_request_context():
+                    # serialisation happens after we return: finished in ``finish``
+                    flask.g.telemetry_call = call
+                else:
+                    self._observe('seconds', (name, 'total'), SECONDS, call.returned - call.start)
+                    self._count(name, 'cached' if call.cached else 'ok')
+                return result
+            return wrapper
+        return decorator
+
+    def timed_query(self, method):
+        """Decorator adding a store query's time and rows to the running callback."""
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            call = _current.get()
+            if call is None or call.depth:
+                return method(*args, **kwargs)
+            call.depth += 1
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                call.depth -= 1
+                call.query += time.perf_counter() - start
+            call.rows += _rows(result)
+            return result
+        return wrapper
+
+    def measure(self, name, func, *args):
+        """Run ``func`` outside any callback; returns its result, query seconds and rows.
+
+        For work done in another process (``telemetry.offload``), whose
+        numbers are handed back to the callback with ``add_query``.
+        """
+        call = _Call(name)
+        token = _current.set(call)
+        try:
+            result = func(*args)
+        finally:
+            _current.reset(token)
+        return result, call.query, call.rows
+
+    def add_query(self, seconds, rows):
+        """Add query time and rows measured elsewhere to the running callback."""
+        call = _current.get()
+        if call is not None:
+            call.query += seconds
+            call.rows += rows
+
+    def mark_cached(self):
+        """Note that the running callback was answered from the memo cache."""
+        call = _current.get()
+        if call is not None:
+            call.cached = True
+
+    def finish(self, response):
+        """``after_request`` hook: serialisation time and payload of an instrumented callback."""
+        call = flask.g.pop('telemetry_call', None)
+        if call is None:
+            return response
+        now = time.perf_counter()
+        self._observe('seconds', (call.name, 'serialize'), SECONDS, now - call.returned)
+        self._observe('seconds', (call.name, 'total'), SECONDS, now - call.start)
+        if not response.is_streamed:
+            self._observe('bytes', (call.name,), BYTES, len(response.get_data()))
+        self._count(call.name, 'cached' if call.cached else 'ok')
+        return response
+
+    def _snapshot(self):
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count, h.bounds) for key, h in self._histograms.items()}
+            return histograms, dict(self._calls)
+
+    def summary(self):
+        """Per callback: calls by outcome, and p50/p95/p99 of each phase, the payload and the rows."""
+        histograms, calls = self._snapshot()
+        names = sorted({key[1][0] for key in histograms} | {name for name, _ in calls})
+        rows = []
+        for name in names:
+            row = {'callback': name}
+            for outcome in ('ok', 'cached', 'prevented', 'error'):
+                row[outcome] = calls.get((name, outcome), 0)
+            for family, labels, label in ([('seconds', (name, phase), phase) for phase in PHASES] +
+                                          [('bytes', (name,), 'bytes'), ('rows', (name,), 'rows')]):
+                state = histograms.get((family, labels))
+                histogram = None
+                if state is not None:
+                    histogram = Histogram(state[3])
+                    histogram.counts, histogram.sum, histogram.count = state[0], state[1], state[2]
+                for q in QUANTILES:
+                    row['%s p%d' % (label, q * 100)] = None if histogram is None else histogram.quantile(q)
+            rows.append(row)
+        return rows
+
+    def exposition(self):
+        """All metrics in the Prometheus text format."""
+        histograms, calls = self._snapshot()
+        families = {
+            'seconds': ('telemetry_callback_seconds', 'Callback wall time by phase.', ('callback', 'phase')),
+            'bytes': ('telemetry_callback_response_bytes', 'Callback response payload size.', ('callback',)),
+            'rows': ('telemetry_callback_rows', 'Rows returned by store queries per callback.', ('callback',)),
+        }
+        lines = []
+        for family, (metric, help_text, label_names) in families.items():
+            lines += ['# HELP %s %s' % (metric, help_text), '# TYPE %s histogram' % metric]
+            for (fam, labels), (counts, total, count, bounds) in sorted(histograms.items()):
+                if fam != family:
+                    continue
+                label = ','.join('%s="%s"' % pair for pair in zip(label_names, labels))
+                cumulative = 0
+                for bound, n in zip(list(bounds) + ['+Inf'], counts):
+                    cumulative += n
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (metric, label, bound, cumulative))
+                lines.append('%s_sum{%s} %r' % (metric, label, total))
+                lines.append('%s_count{%s} %d' % (metric, label, count))
+        lines += ['# HELP telemetry_callback_quantile_seconds Callback phase quantiles estimated from the buckets.',
+                  '# TYPE telemetry_callback_quantile_seconds gauge']
+        for row in self.summary():
+            for phase in PHASES:
+                for q in QUANTILES:
+                    value = row['%s p%d' % (phase, q * 100)]
+                    if value is not None:
+                        lines.append('telemetry_callback_quantile_seconds{callback="%s",phase="%s",quantile="%s"} %r'
+                                     % (row['callback'], phase, q, value))
+        lines += ['# HELP telemetry_callback_calls_total Callback calls by outcome.',
+                  '# TYPE telemetry_callback_calls_total counter']
+        for (name, outcome), n in sorted(calls.items()):
+            lines.append('telemetry_callback_calls_total{callback="%s",outcome="%s"} %d' % (name, outcome, n))
+        return '\n'.join(lines) + '\n'
+
+
+callback_metrics = CallbackMetrics()
+instrument = callback_metrics.instrument
+timed_query = callback_metrics.timed_query
@@ -0,0 +1,271 @@
+"""Heavy figure callbacks computed in a pool of worker processes.
+
+A year-long report holds the GIL for seconds of pandas and plotly work,
+and every other request of the web process -- the live streams, cheap
+callbacks, other viewers -- waits behind it.  Functions decorated with
+``offload(name)`` run in a bounded process pool instead; the web thread
+just waits on the result without holding the GIL.
+
+* The pool is forked by ``start_pool`` at startup, after the pages are
+  imported and before any thread starts, so workers inherit the pages
+  and their job registry.  Each worker opens the stores itself, which
+  memory-maps the same Arrow cache files or opens its own connections to
+  the same database (``telemetry.store``): arguments and the figures'
+  JSON are all that cross the process boundary.
+* Before each job a worker polls its own ingester (``telemetry.ingest``),
+  but it can still be behind (or ahead of) the web process.  A job hands
+  back the ``data_version`` of every store the worker holds, and
+  ``read_versions`` collects them for the callback, so that
+  ``telemetry.figcache`` files the result under the data it was really
+  computed from.
+* Jobs are serialised to JSON in the worker; the callback returns the
+  parsed figures.  Store query time and rows measured there are added to
+  the callback's metrics (``telemetry.metrics``).
+* A job is tagged with the browser tab it came from (``RENDERER`` adds a
+  tab id to every callback request).  A newer request for the same
+  callback from the same tab -- the date range changed again -- drops the
+  older job if it is still queued, makes it stop at its next
+  ``checkpoint()`` if it is running, and answers the older request with
+  ``PreventUpdate`` straight away.
+
+Without a pool (not started, fork unavailable, ``TELEMETRY_POOL_WORKERS=0``
+or a broken pool) the functions run in the calling thread as before.
+"""
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+
+import flask
+from dash.exceptions import PreventUpdate
+from plotly.io.json import to_json_plotly
+
+from telemetry.ingest import Ingester
+from telemetry.metrics import callback_metrics
+from telemetry.store import data_versions
+
+# worker processes; 0 runs every job in the calling thread
+WORKERS = int(os.environ.get('TELEMETRY_POOL_WORKERS', min(4, max((os.cpu_count() or 2) // 2, 1))))
+# tab/callback pairs whose latest job a running job can be checked against
+SLOTS = 1024
+
+# clientside: tag every callback request with an id of the browser tab it came from
+RENDERER = '''var renderer = new DashRenderer({
+    request_pre: function(payload) {
+        window.telemetryTab = window.telemetryTab || Math.random().toString(36).slice(2);
+        payload.tab = window.telemetryTab;
+    }
+});'''
+
+logger = logging.getLogger(__name__)
+
+_jobs = {}
+# web-side: {store name: data version} the pool's jobs read for the running callback
+_read = contextvars.ContextVar('telemetry_read_versions', default=None)
+# worker-side: the ingester, the shared generations and the (slot, generation) of the running job
+_ingester = None
+_generations = None
+_ticket = None
+
+
+class Superseded(Exception):
+    """A newer request for the same callback and tab replaced this job."""
+
+
+def checkpoint():
+    """Stop the running job if a newer request replaced it; a no-op outside pool workers."""
+    if _ticket is not None and _ticket[0] is not None and _generations[_ticket[0]] != _ticket[1]:
+        raise Superseded()
+
+
+@contextlib.contextmanager
+def read_versions():
+    """Collect the data versions that pool jobs run within the block read.
+
+    Yields ``{store name: data_version}``, filled in as jobs finish; a store
+    two jobs read at different versions maps to None.  Jobs run in the
+    calling thread read this process's stores and add nothing.
+    """
+    versions = {}
+    token = _read.set(versions)
+    try:
+        yield versions
+    finally:
+        _read.reset(token)
+
+
+def _note_versions(versions):
+    seen = _read.get()
+    if seen is None:
+        return
+    for name, version in versions.items():
+        seen[name] = version if seen.get(name, version) == version else None
+
+
+def _init_worker(generations):
+    global _ingester, _generations
+    # the pool object came along with the fork; jobs run here, they do not submit
+    report_pool._executor = None
+    _ingester = Ingester()
+    _generations = generations
+
+
+def _run_job(name, args, slot, generation):
+    global _ticket
+    _ticket = (slot, generation)
+    try:
+        checkpoint()
+        _ingester.poll()
+        result, seconds, rows = callback_metrics.measure(name, _jobs[name], *args)
+        return to_json_plotly(result), seconds, rows, data_versions()
+    finally:
+        _ticket = None
+
+
+def _tab():
+    if not flask.has_request_context():
+        return None
+    body = flask.request.get_json(silent=True)
+    return body.get('tab') if isinstance(body, dict) else None
+
+
+class ReportPool:
+    def __init__(self, workers=WORKERS, slots=SLOTS):
+        self.workers = workers
+        self.slots = slots
+        self._executor = None
+        self._generations = None
+        self._counter = itertools.count(1)
+        self._slots = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._executor is not None
+
+    def start(self):
+        """Fork the workers; call before starting any thread."""
+        if self._executor is not None or self.workers < 1:
+            return self
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            logger.info('no fork on this platform: reports run in the web process')
+            return self
+        context = multiprocessing.get_context('fork')
+        self._generations = context.Array('q', self.slots, lock=False)
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            self.workers, mp_context=context, initializer=_init_worker, initargs=(self._generations,))
+        # with fork the first submit starts every worker, so do it now while single-threaded
+        self._executor.submit(os.getpid).result()
+        return self
+
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _slot(self, key):
+        # a slot is reused by another key only once no job of its previous key is pending
+        slot = self._slots.get(key)
+        if slot is None:
+            if len(self._slots) < self.slots:
+                slot = len(self._slots)
+            else:
+                idle = next((k for k in self._slots if k not in self._pending), None)
+                if idle is None:
+                    return None
+                slot = self._slots.pop(idle)
+            self._slots[key] = slot
+        self._slots.move_to_end(key)
+        return slot
+
+    def _claim(self, key):
+        done = threading.Event()
+        with self._lock:
+            generation = next(self._counter)
+            if key is None:
+                return None, generation, done
+            previous = self._pending.get(key)
+            if previous is not None:
+                previous[1].set()
+            slot = self._slot(key)
+            if slot is not None:
+                self._generations[slot] = generation
+            self._pending[key] = (generation, done)
+        return slot, generation, done
+
+    def _release(self, key, generation):
+        with self._lock:
+            if key is not None and self._pending.get(key, (None,))[0] == generation:
+                del self._pending[key]
+
+    def run(self, name, *args):
+        """Result of the job ``name`` on ``args``, computed in the pool when there is one."""
+        executor = self._executor
+        if executor is None:
+            return _jobs[name](*args)
+        tab = _tab()
+        key = None if tab is None else (name, tab)
+        slot, generation, done = self._claim(key)
+        try:
+            try:
+                future = executor.submit(_run_job, name, args, slot, generation)
+            except concurrent.futures.BrokenExecutor:
+                return self._broken(name, args)
+            future.add_done_callback(lambda _: done.set())
+            done.wait()
+            if not future.done():
+                # a newer request from this tab replaced ours: drop the job if it has not started
+                future.cancel()
+                raise PreventUpdate
+            try:
+                payload, seconds, rows, versions = future.result()
+            except Superseded:
+                raise PreventUpdate
+            except concurrent.futures.BrokenExecutor:
+                return self._broken(name, args)
+        finally:
+            self._release(key, generation)
+        callback_metrics.add_query(seconds, rows)
+        _note_versions(versions)
+        return json.loads(payload)
+
+    def _broken(self, name, args):
+        # forking again from the running, threaded server is not safe: carry on without the pool
+        logger.error('report pool broke, running reports in the web process from now on')
+        self._executor = None
+        return _jobs[name](*args)
+
+
+report_pool = ReportPool()
+
+
+def offload(name):
+    """Decorator running the figure function ``name`` in the report pool.
+
+    The function must return figures (anything ``to_json_plotly``
+    serialises) and comes back as their parsed JSON.  Decorate at import
+    time, before ``start_pool``, so the forked workers know the job.
+    """
+    def decorator(func):
+        _jobs[name] = func
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            return report_pool.run(name, *args)
+        return wrapper
+    return decorator
+
+
+def start_pool(workers=None):
+    """Fork the report pool's workers; returns the pool."""
+    if workers is not None:
+        report_pool.workers = workers
+    return report_pool.start()
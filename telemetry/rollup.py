@@ -0,0 +1,265 @@
+"""Pre-aggregated hourly, daily and monthly sums per node.
+
+Every source keeps, per node, the sum of its rollup columns (and the number
+of readings) for each hour, day and month, plus daily sums per shift when
+the source has a ``Shift`` column.  The tables are built with the cache,
+persisted next to it and folded forward on every ingested batch, so they
+stay in step with the store at a cost proportional to the new rows.
+
+A range total is answered from the coarsest grains that tile the range:
+whole months from the monthly table, the leftover whole days from the
+daily table, then hours.  A one-year total for one node therefore reads
+about 12 + 60 + 48 pre-summed rows instead of every reading.  Only the
+pieces shorter than an hour at either end, which date-picker ranges
+never have, need the raw rows.
+"""
+import numpy as np
+import pandas as pd
+
+# grain -> numpy datetime unit, coarsest first
+GRAINS = {'M': 'M', 'D': 'D', 'H': 'h'}
+GRAIN_NAMES = {'M': 'Monthly', 'D': 'Daily', 'H': 'Hourly'}
+SHIFT_COL = 'Shift'
+
+
+def floor(values, grain):
+    """Start of the ``grain`` period holding each datetime64[ns] value."""
+    return np.asarray(values, dtype='datetime64[ns]').astype('datetime64[%s]' % GRAINS[grain]).astype('datetime64[ns]')
+
+
+def ceil(value, grain):
+    start = floor([value], grain)[0]
+    if start == value:
+        return start
+    return (start.astype('datetime64[%s]' % GRAINS[grain]) + 1).astype('datetime64[ns]')
+
+
+def cover(start, stop):
+    """Split ``[start, stop)`` (datetime64[ns]) into ``(grain, lo, hi)`` pieces, coarsest grains first.
+
+    Pieces shorter than an hour at either end get grain 'raw'.
+    """
+    pieces = []
+
+    def split(lo, hi, grains):
+        if lo >= hi:
+            return
+        if not grains:
+            pieces.append(('raw', lo, hi))
+            return
+        grain = grains[0]
+        a, b = ceil(lo, grain), floor([hi], grain)[0]
+        if a < b:
+            pieces.append((grain, a, b))
+            split(lo, a, grains[1:])
+            split(b, hi, grains[1:])
+        else:
+            split(lo, hi, grains[1:])
+
+    split(np.datetime64(start, 'ns'), np.datetime64(stop, 'ns'), list(GRAINS))
+    return pieces
+
+
+def clipped_cover(extent, start, stop):
+    """``cover`` of ``[start, stop)`` (None for open ends) clipped to an ``extent`` ``(first, last)``."""
+    first, last = extent
+    if first is None:
+        return []
+    start = first if start is None else max(np.datetime64(start, 'ns'), first)
+    stop = last if stop is None else min(np.datetime64(stop, 'ns'), last)
+    return cover(start, stop) if start < stop else []
+
+
+def pick_grain(start, stop, max_bars=500):
+    """Finest grain that charts ``[start, stop)`` in at most ``max_bars`` bars per node."""
+    span = np.datetime64(stop, 'ns') - np.datetime64(start, 'ns')
+    for grain, period in (('H', np.timedelta64(1, 'h')), ('D', np.timedelta64(1, 'D'))):
+        if span / period <= max_bars:
+            return grain
+    return 'M'
+
+
+def shift_frame(node_col, columns, by_node=False):
+    """Empty ``shift_totals`` result."""
+    frame = pd.DataFrame(columns=columns)
+    if by_node:
+        frame.index = pd.MultiIndex.from_arrays([[], []], names=[node_col, SHIFT_COL])
+    return frame
+
+
+def _add(old, more):
+    """``old + more`` where a missing value counts as 0 unless both are missing, like ``add(fill_value=0)``."""
+    return np.where(np.isnan(old) & np.isnan(more), np.nan, np.nan_to_num(old) + np.nan_to_num(more))
+
+
+def _node_part(sums, a, b):
+    """Rows ``a:b`` of ``sums`` (one node's) indexed by period."""
+    return sums.iloc[a:b].droplevel(0).rename_axis('period')
+
+
+class Rollups:
+    def __init__(self, node_col, time_col, columns):
+        self.node_col = node_col
+        self.time_col = time_col
+        self.columns = list(columns)
+        # grain -> node -> frame indexed by period start, columns + ['readings']
+        self.tables = {grain: {} for grain in GRAINS}
+        # node -> frame indexed by day, columns are (column, shift) pairs
+        self.shifts = {}
+
+    @classmethod
+    def from_frame(cls, frame, node_col, time_col, columns):
+        rollups = cls(node_col, time_col, columns)
+        rollups.update(frame)
+        return rollups
+
+    def update(self, frame):
+        """Add the readings in ``frame`` to every table."""
+        if not len(frame):
+            return
+        nodes = frame[self.node_col]
+        # float32 readings are summed in float64 so long totals don't drift
+        values = frame[self.columns].astype('float64').assign(readings=1.0)
+        for grain, tables in self.tables.items():
+            periods = pd.DatetimeIndex(floor(frame[self.time_col], grain))
+            sums = values.groupby([nodes.to_numpy(), periods]).sum()
+            self._fold(tables, sums)
+        if SHIFT_COL in frame:
+            days = pd.DatetimeIndex(floor(frame[self.time_col], 'D'))
+            sums = values[self.columns].groupby([nodes.to_numpy(), days, frame[SHIFT_COL].to_numpy()]).sum()
+            self._fold(self.shifts, sums.unstack(level=2).rename_axis(columns=[None, SHIFT_COL]))
+
+    @staticmethod
+    def _fold(tables, sums):
+        """Add ``sums`` (indexed by node then period) to each node's table.
+
+        Periods a table already has are added to in place and new periods
+        after its last one appended, so a batch costs the same however long
+        the history; anything else (new columns, late periods) falls back to
+        rebuilding that node's table with ``add``.
+        """
+        nodes = sums.index.get_level_values(0).to_numpy()
+        periods = sums.index.get_level_values(1).asi8
+        values = sums.to_numpy(dtype='float64')
+        starts = np.flatnonzero(np.r_[True, nodes[1:] != nodes[:-1]])
+        for a, b in zip(starts, np.r_[starts[1:], len(nodes)]):
+            node = nodes[a]
+            current = tables.get(node)
+            if current is None or not len(current):
+                tables[node] = _node_part(sums, a, b)
+                continue
+            same = current.columns.equals(sums.columns)
+            cols = np.arange(len(sums.columns)) if same else current.columns.get_indexer(sums.columns)
+            index = current.index.asi8
+            rows = np.minimum(np.searchsorted(index, periods[a:b]), len(index) - 1)
+            known = index[rows] == periods[a:b]
+            table = current.to_numpy()
+            # to_numpy is a view only of a table held as one float block
+            viewed = np.shares_memory(table, current.iloc[:, 0].to_numpy())
+            if (cols < 0).any() or not viewed or (~known).any() and periods[a:b][~known][0] <= index[-1]:
+                tables[node] = current.add(_node_part(sums, a, b), fill_value=0)
+                continue
+            if known.any():
+                picked = np.ix_(rows[known], cols)
+                table[picked] = _add(table[picked], values[a:b][known])
+            if not known.all():
+                tables[node] = pd.concat([current, _node_part(sums, a, b)[~known].reindex(columns=current.columns)])
+
+    def to_long(self):
+        """One flat frame per table, for persisting: ``{'M': ..., 'D': ..., 'H': ..., 'shift': ...}``."""
+        long = {}
+        for grain, tables in self.tables.items():
+            long[grain] = self._flatten(tables)
+        shifts = {node: table.stack(level=1).rename_axis(['period', SHIFT_COL])
+                  for node, table in self.shifts.items()}
+        long['shift'] = self._flatten(shifts)
+        return long
+
+    def _flatten(self, tables):
+        if not tables:
+            return pd.DataFrame(columns=[self.node_col, 'period'])
+        return pd.concat(tables, names=[self.node_col]).reset_index()
+
+    @classmethod
+    def from_long(cls, long, node_col, time_col, columns):
+        rollups = cls(node_col, time_col, columns)
+        for grain in GRAINS:
+            for node, part in long[grain].groupby(node_col, sort=False):
+                rollups.tables[grain][node] = part.drop(columns=node_col).set_index('period').astype('float64')
+        for node, part in long['shift'].groupby(node_col, sort=False):
+            table = part.drop(columns=node_col).set_index(['period', SHIFT_COL]).unstack(SHIFT_COL)
+            rollups.shifts[node] = table.astype('float64')
+        return rollups
+
+    def nodes(self):
+        return list(self.tables['M'])
+
+    def extent(self):
+        """``[start, stop)`` spanning every hour with a reading."""
+        hours = [table.index for table in list(self.tables['H'].values()) if len(table)]
+        if not hours:
+            return None, None
+        start = min(index[0] for index in hours).to_datetime64()
+        stop = max(index[-1] for index in hours).to_datetime64() + np.timedelta64(1, 'h')
+        return start, stop
+
+    def totals(self, start, stop, nodes=None):
+        """Per-node sums over ``[start, stop)`` (datetime64[ns], None for open ends).
+
+        Returns ``(totals, raw)``: a frame indexed by node, and the sub-hour
+        ``(lo, hi)`` ranges the caller still has to add from the raw rows.
+        """
+        nodes = self.nodes() if nodes is None else nodes
+        pieces = clipped_cover(self.extent(), start, stop)
+        raw = [(lo, hi) for grain, lo, hi in pieces if grain == 'raw']
+        return self.piece_totals([piece for piece in pieces if piece[0] != 'raw'], nodes), raw
+
+    def piece_totals(self, pieces, nodes):
+        """Per-node sums over ``(grain, lo, hi)`` pieces of whole periods, indexed by ``nodes``."""
+        rows = []
+        for grain, lo, hi in pieces:
+            for node in nodes:
+                table = self.tables[grain].get(node)
+                if table is not None:
+                    a, b = table.index.searchsorted([lo, hi])
+                    rows.append(table.iloc[a:b].sum().rename(node))
+        totals = pd.DataFrame(rows, columns=self.columns + ['readings'], dtype=float)
+        return totals.groupby(level=0, sort=False).sum().reindex(nodes, fill_value=0)
+
+    def series(self, start, stop, grain, nodes=None):
+        """Long frame of ``[node, period, columns..., readings]`` rows at ``grain`` within ``[start, stop)``."""
+        nodes = self.nodes() if nodes is None else nodes
+        parts = {}
+        for node in nodes:
+            table = self.tables[grain].get(node)
+            if table is None:
+                continue
+            a = 0 if start is None else table.index.searchsorted(np.datetime64(start, 'ns'))
+            b = len(table) if stop is None else table.index.searchsorted(np.datetime64(stop, 'ns'))
+            parts[node] = table.iloc[a:b]
+        return self._flatten(parts)
+
+    def shift_totals(self, start, stop, nodes=None, by_node=False):
+        """Sums per shift over the whole days in ``[start, stop)``, indexed by shift.
+
+        With ``by_node`` the sums are kept apart per node, indexed by node
+        then shift.
+        """
+        nodes = self.nodes() if nodes is None else nodes
+        rows = {}
+        for node in nodes:
+            table = self.shifts.get(node)
+            if table is None:
+                continue
+            a = 0 if start is None else table.index.searchsorted(ceil(np.datetime64(start, 'ns'), 'D'))
+            b = len(table) if stop is None else table.index.searchsorted(floor([np.datetime64(stop, 'ns')], 'D')[0])
+            rows[node] = table.iloc[a:b].sum()
+        if not rows:
+            return shift_frame(self.node_col, self.columns, by_node)
+        sums = pd.concat(rows, axis=1)
+        if not by_node:
+            return sums.sum(axis=1).unstack(level=0).reindex(columns=self.columns)
+        sums = sums.T.stack(level=SHIFT_COL)
+        index = pd.MultiIndex.from_product([list(rows), sorted(sums.index.levels[1])],
+                                           names=[self.node_col, SHIFT_COL])
+        return sums.reindex(index, fill_value=0).reindex(columns=self.columns)
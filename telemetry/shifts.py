@@ -0,0 +1,74 @@
+"""Shift calendars: which shift every reading falls in.
+
+A calendar lists, for each day of the week, its shifts as ``(name, start,
+end)`` time-of-day intervals, half-open so a reading exactly on a
+boundary belongs to the shift that starts there.  A shift whose end is at
+or before its start runs past midnight into the next day, and Sunday's
+night shift wraps into Monday morning.  Time not covered by any shift
+(breaks, weekends off) gets no shift.
+
+The week is laid out once as sorted interval edges in seconds since Monday
+00:00, so tagging a column of timestamps is one ``searchsorted`` plus a
+lookup of the shift code -- a million rows take a few milliseconds.
+"""
+import numpy as np
+import pandas as pd
+
+DAY = 24 * 3600
+WEEK = 7 * DAY
+
+
+def _seconds(value):
+    """Seconds since midnight of an ``'HH:MM'`` or ``'HH:MM:SS'`` string."""
+    parts = [int(p) for p in value.split(':')]
+    return parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) > 2 else 0)
+
+
+class ShiftCalendar:
+    def __init__(self, week):
+        """``week`` maps a weekday (0 = Monday) to its ``(name, start, end)`` shifts."""
+        self.names = list(dict.fromkeys(name for shifts in week.values() for name, _, _ in shifts))
+        codes = {name: i for i, name in enumerate(self.names)}
+        intervals = []
+        for day, shifts in week.items():
+            for name, start, end in shifts:
+                lo = day * DAY + _seconds(start)
+                length = (_seconds(end) - _seconds(start)) % DAY or DAY
+                hi = lo + length
+                if hi > WEEK:
+                    intervals.append((0, hi - WEEK, codes[name]))
+                    hi = WEEK
+                intervals.append((lo, hi, codes[name]))
+        intervals.sort()
+        edges, labels = [0], [-1]
+        for lo, hi, code in intervals:
+            if lo < edges[-1]:
+                raise ValueError('overlapping shifts at %s in the week' % pd.Timedelta(seconds=lo))
+            if lo > edges[-1]:
+                edges.append(lo)
+                labels.append(-1)
+            labels[-1] = code
+            edges.append(hi)
+            labels.append(-1)
+        # labels[i] is the shift of [edges[i], edges[i + 1])
+        self.edges = np.array(edges, dtype=np.int64)
+        self.labels = np.array(labels, dtype=np.int8)
+
+    @classmethod
+    def daily(cls, shifts, weekdays=range(7)):
+        """The same shifts on every one of ``weekdays``."""
+        return cls({day: shifts for day in weekdays})
+
+    def assign(self, times):
+        """Shift of each datetime in ``times`` as a categorical (NaN outside every shift)."""
+        times = np.asarray(times, dtype='datetime64[ns]')
+        # 1970-01-01 was a Thursday
+        week_seconds = (times.view(np.int64) // 10 ** 9 + 3 * DAY) % WEEK
+        codes = self.labels[np.searchsorted(self.edges, week_seconds, side='right') - 1]
+        codes[np.isnat(times)] = -1
+        return pd.Categorical.from_codes(codes, categories=self.names)
+
+
+CALENDARS = {
+    'plant': ShiftCalendar.daily([('A', '05:45', '14:20'), ('B', '14:20', '22:40'), ('C', '22:40', '05:45')]),
+}
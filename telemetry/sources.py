@@ -0,0 +1,92 @@
+"""Raw telemetry sources shipped under ``data/`` and how to parse them."""
+import os
+from dataclasses import dataclass
+
+import pandas as pd
+import pyarrow.csv as pacsv
+
+from telemetry.consumption import ConsumptionEngine
+from telemetry.schema import DERIVED, arrow_types, coerce, read_dtypes, usecols
+from telemetry.shifts import CALENDARS
+
+DATA_DIR = os.environ.get('TELEMETRY_DATA_DIR', os.path.join(os.getcwd(), 'data'))
+
+
+@dataclass(frozen=True)
+class Source:
+    name: str
+    filename: str
+    time_col: str
+    node_col: str
+    counter_col: str = None
+    rollover: float = None
+    max_gap: str = None
+    rollup_cols: tuple = ()
+    calendar: str = None
+
+    @property
+    def path(self):
+        return os.path.join(DATA_DIR, self.filename)
+
+
+SOURCES = {
+    'em': Source('em', 'EM.xlsx', 'DATE_TIME', 'Node_Name', counter_col='Cumm_Power', max_gap='6h',
+                 rollup_cols=('Last_consumption',), calendar='plant'),
+    'vfd': Source('vfd', 'vfd.csv', 'Date_Time', 'Node_Name', counter_col='Energy_Meter_KWH',
+                  rollover=10000, max_gap='6h', rollup_cols=('Last_consumption',),
+                  calendar='plant'),
+    'air': Source('air', 'Air_con.csv', 'Date_Time', 'Equipment_Name', rollup_cols=('Consumption',),
+                  calendar='plant'),
+}
+
+
+def _read_excel(path, name):
+    return pd.read_excel(path, usecols=usecols(name), dtype=read_dtypes(name))
+
+
+def _read_csv(path, name):
+    # pyarrow's reader is multi-threaded and parses straight into the schema's types
+    options = pacsv.ConvertOptions(include_columns=usecols(name), column_types=arrow_types(name))
+    return pacsv.read_csv(path, convert_options=options).to_pandas()
+
+
+def _read_parquet(path, name):
+    return pd.read_parquet(path, columns=usecols(name))
+
+
+# file extension -> reader(path, source name)
+READERS = {'.xlsx': _read_excel, '.csv': _read_csv, '.parquet': _read_parquet}
+
+
+def read_raw(source, path=None):
+    """Parse a raw xlsx, csv or parquet file with ``source``'s columns, unsorted."""
+    path = source.path if path is None else path
+    reader = READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        raise ValueError('no reader for %s (expected one of %s)' % (path, ', '.join(READERS)))
+    return reader(path, source.name)
+
+
+def read_source(source):
+    """Parse a raw source file into a frame sorted by node, then time."""
+    return derive(source, prepare(source, read_raw(source)))
+
+
+def prepare(source, data):
+    """Clean freshly parsed raw rows and sort them by node, then time."""
+    data = coerce(source.name, data)
+    return data.sort_values([source.node_col, source.time_col], kind='mergesort').reset_index(drop=True)
+
+
+def derive(source, data, engine=None):
+    """Add the derived columns the pages chart on top of the raw readings.
+
+    ``engine`` carries consumption state over from rows derived earlier.
+    """
+    if source.counter_col is not None:
+        if engine is None:
+            engine = ConsumptionEngine.for_source(source)
+        data['Last_consumption'] = engine.update(data).astype(DERIVED['Last_consumption'])
+    if source.calendar is not None:
+        data['Shift'] = CALENDARS[source.calendar].assign(data[source.time_col])
+    return data
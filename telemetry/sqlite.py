@@ -0,0 +1,426 @@
+"""SQLite backend: a store's base segment and rollups queried from disk.
+
+With ``TELEMETRY_BACKEND=sqlite`` (``telemetry.store``) a source's cached
+history is served from ``data/.cache/<name>.sqlite`` instead of the
+memory-mapped Arrow file, and a query materialises just the rows it
+returns rather than addressing the whole history:
+
+* ``readings`` holds every row in the Arrow file's order (node, then
+  time), the node as an integer code (table ``nodes``) and the time as
+  int64 nanoseconds, indexed on (node, time): a node's date range is one
+  index range scan;
+* ``rollup_M``, ``rollup_D``, ``rollup_H`` and ``rollup_shift`` hold the
+  pre-summed tables of ``telemetry.rollup``; range totals, series and
+  shift sums are ``GROUP BY`` queries over the same tiling of the range;
+* ``meta`` holds the cache identity, column types and categories, and
+  count/sum/min/max of every numeric column, so whole-history gauge
+  ranges need no scan.
+
+The database is written from the Arrow cache ``CHUNK`` rows at a time, so
+building it holds no more than a chunk in memory.  Rows ingested while the
+app runs stay in the store's in-memory tail segments, and their rollups in
+``SqliteRollups.tail``, as with the Arrow backend.  Connections are
+read-only and opened per thread and per process.
+"""
+import copy
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from telemetry.rollup import SHIFT_COL, Rollups, ceil, clipped_cover, floor, shift_frame
+
+# rows per INSERT batch while writing a database
+CHUNK = 65536
+STATS = ('count', 'sum', 'min', 'max')
+
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def frame_stats(frame, columns):
+    """count, sum, min and max of each of ``columns``, indexed by statistic."""
+    return frame[columns].agg(list(STATS))
+
+
+def combine_stats(parts):
+    """``frame_stats`` of the union of the rows ``parts`` were computed on."""
+    parts = list(parts)
+    return pd.DataFrame({
+        'count': sum(part.loc['count'] for part in parts),
+        'sum': sum(part.loc['sum'] for part in parts),
+        'min': pd.concat([part.loc['min'] for part in parts], axis=1).min(axis=1),
+        'max': pd.concat([part.loc['max'] for part in parts], axis=1).max(axis=1),
+    }).T
+
+
+def _column_type(dtype):
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        return 'INTEGER'
+    return 'TEXT'
+
+
+def _records(frame, columns, node_col, time_col, node_codes):
+    # plain Python values column by column: sqlite3 binds neither float32 nor int64 scalars
+    values = []
+    for col in columns:
+        series = frame[col]
+        if col == node_col:
+            codes = node_codes.get_indexer(series.astype(str))
+            if (codes < 0).any():
+                raise ValueError('unknown %s in %s' % (node_col, sorted(set(series[codes < 0].astype(str)))))
+            values.append(codes.tolist())
+        elif col in (time_col, 'period'):
+            values.append(series.to_numpy(dtype='datetime64[ns]').view('int64').tolist())
+        elif pd.api.types.is_float_dtype(series.dtype):
+            # NaN is stored as NULL, which SUM, MIN and MAX skip like pandas does
+            values.append(series.to_numpy(dtype='float64').tolist())
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            values.append(series.to_numpy().tolist())
+        else:
+            values.append(series.astype(object).where(series.notna(), None).tolist())
+    return zip(*values)
+
+
+def _insert(connection, table, columns, records):
+    connection.executemany('INSERT INTO %s (%s) VALUES (%s)' % (
+        table, ', '.join(map(_quote, columns)), ', '.join('?' * len(columns))), records)
+
+
+def write_database(path, table, long, node_col, time_col, identity):
+    """Write a database at ``path`` from the Arrow ``table`` and the ``long`` rollup frames.
+
+    ``table`` holds the rows sorted by node, then time; ``long`` is
+    ``Rollups.to_long()`` or the persisted rollup files; ``identity`` is
+    kept in ``meta`` for ``read_identity``.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    empty = table.schema.empty_table().to_pandas()
+    columns = list(empty.columns)
+    node_codes = pd.Index(table.column(node_col).to_pandas().cat.categories.astype(str))
+    categories = {col: list(table.column(col).to_pandas().cat.categories.astype(str))
+                  for col in columns if col != node_col and isinstance(empty[col].dtype, pd.CategoricalDtype)}
+    numeric = [col for col in columns if col not in (node_col, time_col) and col not in categories
+               and pd.api.types.is_numeric_dtype(empty[col].dtype)]
+    renamed = {node_col: 'node', time_col: 'time'}
+
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+        connection.execute('CREATE TABLE nodes (code INTEGER PRIMARY KEY, name TEXT)')
+        connection.executemany('INSERT INTO nodes VALUES (?, ?)', enumerate(node_codes))
+        connection.execute('CREATE TABLE readings (%s)' % ', '.join(
+            '%s %s' % (_quote(renamed.get(col, col)), 'INTEGER' if col in renamed else _column_type(empty[col].dtype))
+            for col in columns))
+        stats = []
+        for offset in range(0, table.num_rows, CHUNK):
+            chunk = table.slice(offset, CHUNK).to_pandas()
+            _insert(connection, 'readings', [renamed.get(col, col) for col in columns],
+                    _records(chunk, columns, node_col, time_col, node_codes))
+            stats.append(frame_stats(chunk, numeric))
+        connection.execute('CREATE INDEX readings_node_time ON readings (node, time)')
+
+        for name, frame in long.items():
+            keys = [node_col, 'period'] + ([SHIFT_COL] if name == 'shift' else [])
+            values = [col for col in frame.columns if col not in keys]
+            connection.execute('CREATE TABLE rollup_%s (node INTEGER, period INTEGER, %s)' % (name, ', '.join(
+                '%s %s' % (_quote(col), _column_type(frame[col].dtype) if col != SHIFT_COL else 'TEXT')
+                for col in keys[2:] + values)))
+            _insert(connection, 'rollup_' + name, ['node', 'period'] + keys[2:] + values,
+                    _records(frame, keys + values, node_col, time_col, node_codes))
+            connection.execute('CREATE INDEX rollup_%s_node_period ON rollup_%s (node, period)' % (name, name))
+            connection.execute('CREATE INDEX rollup_%s_period ON rollup_%s (period)' % (name, name))
+
+        stats = combine_stats(stats) if stats else pd.DataFrame(0.0, index=list(STATS), columns=numeric)
+        meta = {
+            'identity': identity,
+            'node_col': node_col,
+            'time_col': time_col,
+            'columns': columns,
+            'dtypes': {col: str(empty[col].dtype) for col in columns},
+            'categories': categories,
+            'stats': {col: {stat: float(value) for stat, value in values.items()} for col, values in stats.items()},
+        }
+        connection.executemany('INSERT INTO meta VALUES (?, ?)', [(key, json.dumps(value)) for key, value in meta.items()])
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _uri(path):
+    return pathlib.Path(path).resolve().as_uri() + '?mode=ro'
+
+
+def read_identity(path):
+    """The ``identity`` a database was written with, or None if it is missing or unreadable."""
+    try:
+        connection = sqlite3.connect(_uri(path), uri=True)
+    except sqlite3.Error:
+        return None
+    try:
+        row = connection.execute("SELECT value FROM meta WHERE key = 'identity'").fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        connection.close()
+    return None if row is None else json.loads(row[0])
+
+
+class SqliteSegment:
+    """A store's base segment read from a database written by ``write_database``.
+
+    Answers the methods of ``telemetry.store.Segment`` with SQL: ``rows``
+    fetches a node's date range through the (node, time) index, and every
+    result is a frame of just the rows asked for, with the column types
+    and the row labels (position in the Arrow file) the Arrow backend has.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._uri = _uri(path)
+        self._local = threading.local()
+        meta = {key: json.loads(value) for key, value in self.fetch('SELECT key, value FROM meta')}
+        self.identity = meta['identity']
+        self.node_col = meta['node_col']
+        self.time_col = meta['time_col']
+        self.columns = meta['columns']
+        self.dtypes = meta['dtypes']
+        self._stats = pd.DataFrame(meta['stats'])
+        self.names = pd.Index([name for _, name in self.fetch('SELECT code, name FROM nodes ORDER BY code')])
+        self.codes = {name: code for code, name in enumerate(self.names)}
+        self._categories = {col: pd.Index(values) for col, values in meta['categories'].items()}
+        self._categories[self.node_col] = self.names
+        self._spans = {}
+        for code, name in enumerate(self.names):
+            first = self.fetch('SELECT time FROM readings WHERE node = ? ORDER BY time LIMIT 1', [code])
+            if first:
+                last = self.fetch('SELECT time FROM readings WHERE node = ? ORDER BY time DESC LIMIT 1', [code])
+                self._spans[name] = (np.int64(first[0][0]), np.int64(last[0][0]))
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # a forked worker must not share its parent's connection
+            local.connection = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+            local.pid = os.getpid()
+        return local.connection
+
+    def fetch(self, sql, params=()):
+        return self._connection().execute(sql, list(params)).fetchall()
+
+    def _select(self, columns):
+        renamed = {self.node_col: 'node', self.time_col: 'time'}
+        return ', '.join(['rowid'] + [_quote(renamed.get(col, col)) for col in columns])
+
+    def _restore(self, col, values):
+        if col == self.node_col:
+            codes = np.asarray(values, dtype='int64')
+            return pd.Categorical.from_codes(codes, self.names).set_categories(self._categories[col])
+        if col == self.time_col:
+            return np.asarray(values, dtype='int64').view('datetime64[ns]')
+        if col in self._categories:
+            return pd.Categorical(values, categories=self._categories[col])
+        if self.dtypes[col].startswith('float'):
+            # NULL comes back as None, which numpy reads as NaN
+            return np.asarray(values, dtype=self.dtypes[col])
+        return pd.Series(values, dtype=object).astype(self.dtypes[col]).to_numpy()
+
+    def _frame(self, records, columns):
+        values = list(zip(*records)) or [()] * (len(columns) + 1)
+        index = pd.Index(np.asarray(values[0], dtype='int64') - 1)
+        return pd.DataFrame({col: self._restore(col, column) for col, column in zip(columns, values[1:])},
+                            index=index, columns=columns)
+
+    def _query(self, where='', params=(), order='node, time, rowid', limit=None, columns=None):
+        columns = self.columns if columns is None else list(columns)
+        sql = 'SELECT %s FROM readings%s ORDER BY %s' % (self._select(columns), where and ' WHERE ' + where, order)
+        if limit is not None:
+            sql += ' LIMIT %d' % limit
+        return self._frame(self.fetch(sql, params), columns)
+
+    @property
+    def frame(self):
+        """Every row, read into memory; the query methods read only what they return."""
+        return self._query(order='rowid')
+
+    def nodes(self):
+        return list(self._spans)
+
+    def spans(self):
+        return dict(self._spans)
+
+    def _range(self, node, start, stop):
+        where, params = ['node = ?'], [self.codes[node]]
+        if start is not None:
+            where.append('time >= ?')
+            params.append(int(start))
+        if stop is not None:
+            where.append('time < ?')
+            params.append(int(stop))
+        return ' AND '.join(where), params
+
+    def rows(self, node, start, stop, columns=None):
+        if node not in self._spans:
+            return None
+        frame = self._query(*self._range(node, start, stop), 'time, rowid', columns=columns)
+        return frame if len(frame) else None
+
+    def batches(self, node, start, stop, columns, size):
+        """``rows`` in frames of at most ``size`` rows, fetched one frame at a time."""
+        if node not in self._spans:
+            return
+        columns = self.columns if columns is None else list(columns)
+        where, params = self._range(node, start, stop)
+        cursor = self._connection().execute('SELECT %s FROM readings WHERE %s ORDER BY time, rowid' % (
+            self._select(columns), where), params)
+        try:
+            for records in iter(lambda: cursor.fetchmany(size), []):
+                yield self._frame(records, columns)
+        finally:
+            cursor.close()
+
+    def empty(self, columns=None):
+        return self._frame([], self.columns if columns is None else list(columns))
+
+    def last_rows(self, n):
+        parts = [self._query('node = ?', [self.codes[node]], 'time DESC, rowid DESC', n).iloc[::-1]
+                 for node in self._spans]
+        return pd.concat(parts) if parts else self.empty()
+
+    def newest(self):
+        return self.last_rows(1)
+
+    def head(self, n):
+        return self._query(order='rowid', limit=n)
+
+    def tail(self, n):
+        return self._query(order='rowid DESC', limit=n).iloc[::-1]
+
+    def stats(self, columns):
+        return self._stats[columns]
+
+    def categories(self, col):
+        return self._categories[col]
+
+    def with_categories(self, col, categories):
+        seg = copy.copy(self)
+        seg._categories = dict(self._categories, **{col: categories})
+        return seg
+
+
+class SqliteRollups:
+    """The rollup tables of a database, plus a ``Rollups`` of the rows ingested since.
+
+    Same interface as ``telemetry.rollup.Rollups``; the database part of
+    every answer is one ``GROUP BY`` or range query.
+    """
+
+    def __init__(self, db, columns):
+        self.db = db
+        self.node_col = db.node_col
+        self.time_col = db.time_col
+        self.columns = list(columns)
+        self.tail = Rollups(db.node_col, db.time_col, columns)
+        self._nodes = [db.names[code] for code, in db.fetch('SELECT DISTINCT node FROM rollup_M ORDER BY node')]
+        first, last = db.fetch('SELECT MIN(period), MAX(period) FROM rollup_H')[0]
+        self._extent = (None, None) if first is None else (
+            np.datetime64(first, 'ns'), np.datetime64(last, 'ns') + np.timedelta64(1, 'h'))
+        self._shifts = [shift for shift, in db.fetch('SELECT DISTINCT %s FROM rollup_shift ORDER BY 1' % _quote(SHIFT_COL))]
+
+    def update(self, frame):
+        self.tail.update(frame)
+
+    def nodes(self):
+        return list(dict.fromkeys(self._nodes + self.tail.nodes()))
+
+    def extent(self):
+        extents = [extent for extent in (self._extent, self.tail.extent()) if extent[0] is not None]
+        if not extents:
+            return None, None
+        return min(extent[0] for extent in extents), max(extent[1] for extent in extents)
+
+    def _codes(self, nodes):
+        codes = [self.db.codes[node] for node in nodes if node in self.db.codes]
+        return 'node IN (%s)' % ', '.join(map(str, codes))
+
+    def _frame(self, records, columns):
+        frame = pd.DataFrame.from_records(records, columns=columns)
+        frame['node'] = self.db.names[frame['node'].to_numpy(dtype='int64')]
+        return frame
+
+    def totals(self, start, stop, nodes=None):
+        nodes = self.nodes() if nodes is None else nodes
+        pieces = clipped_cover(self.extent(), start, stop)
+        whole = [piece for piece in pieces if piece[0] != 'raw']
+        sums = ', '.join('SUM(%s)' % _quote(col) for col in self.columns + ['readings'])
+        selects = ['SELECT node, %s FROM rollup_%s WHERE %s AND period >= %d AND period < %d GROUP BY node' % (
+            sums, grain, self._codes(nodes), lo.astype('int64'), hi.astype('int64')) for grain, lo, hi in whole]
+        parts = []
+        if selects:
+            records = self.db.fetch(' UNION ALL '.join(selects))
+            parts.append(self._frame(records, ['node'] + self.columns + ['readings']).set_index('node').rename_axis(None))
+        if self.tail.nodes():
+            parts.append(self.tail.piece_totals(whole, nodes))
+        totals = pd.concat(parts) if parts else pd.DataFrame(columns=self.columns + ['readings'], dtype='float64')
+        raw = [(lo, hi) for grain, lo, hi in pieces if grain == 'raw']
+        return totals.groupby(level=0, sort=False).sum().reindex(nodes, fill_value=0), raw
+
+    def series(self, start, stop, grain, nodes=None):
+        nodes = self.nodes() if nodes is None else nodes
+        where = [self._codes(nodes)]
+        if start is not None:
+            where.append('period >= %d' % np.datetime64(start, 'ns').astype('int64'))
+        if stop is not None:
+            where.append('period < %d' % np.datetime64(stop, 'ns').astype('int64'))
+        columns = ['node', 'period'] + self.columns + ['readings']
+        records = self.db.fetch('SELECT %s FROM rollup_%s WHERE %s ORDER BY node, period' % (
+            ', '.join(map(_quote, columns)), grain, ' AND '.join(where)))
+        frame = self._frame(records, columns)
+        frame['period'] = frame['period'].to_numpy(dtype='int64').view('datetime64[ns]')
+        frame = frame.rename(columns={'node': self.node_col})
+        tail = self.tail.series(start, stop, grain, [node for node in nodes if node in self.tail.tables[grain]])
+        if len(tail):
+            frame = pd.concat([frame, tail]).groupby([self.node_col, 'period'], sort=False).sum().reset_index()
+        if not any(node in self.db.codes or node in self.tail.tables[grain] for node in nodes):
+            return pd.DataFrame(columns=[self.node_col, 'period'])
+        order = {node: i for i, node in enumerate(nodes)}
+        return frame.sort_values([self.node_col, 'period'], kind='mergesort', key=lambda s: (
+            s.map(order) if s.name == self.node_col else s)).reset_index(drop=True)
+
+    def shift_totals(self, start, stop, nodes=None, by_node=False):
+        nodes = self.nodes() if nodes is None else nodes
+        where = [self._codes(nodes)]
+        if start is not None:
+            where.append('period >= %d' % ceil(np.datetime64(start, 'ns'), 'D').astype('int64'))
+        if stop is not None:
+            where.append('period < %d' % floor([np.datetime64(stop, 'ns')], 'D')[0].astype('int64'))
+        sums = ', '.join('SUM(%s)' % _quote(col) for col in self.columns)
+        if by_node:
+            records = self.db.fetch('SELECT node, %s, %s FROM rollup_shift WHERE %s GROUP BY 1, 2' % (
+                _quote(SHIFT_COL), sums, ' AND '.join(where)))
+            totals = self._frame(records, ['node', SHIFT_COL] + self.columns).set_index(['node', SHIFT_COL])
+        else:
+            records = self.db.fetch('SELECT %s, %s FROM rollup_shift WHERE %s GROUP BY 1' % (
+                _quote(SHIFT_COL), sums, ' AND '.join(where)))
+            totals = pd.DataFrame.from_records(records, columns=[SHIFT_COL] + self.columns).set_index(SHIFT_COL)
+        if any(node in self.tail.shifts for node in nodes):
+            totals = totals.add(self.tail.shift_totals(start, stop, nodes, by_node).rename_axis(totals.index.names),
+                                fill_value=0)
+        present = [node for node in nodes if node in self.db.codes or node in self.tail.shifts]
+        if not present:
+            return shift_frame(self.node_col, self.columns, by_node)
+        shifts = sorted(set(self._shifts) | set(totals.index.get_level_values(SHIFT_COL)))
+        if by_node:
+            index = pd.MultiIndex.from_product([present, shifts], names=[self.node_col, SHIFT_COL])
+            return totals.rename_axis(index.names).reindex(index, fill_value=0).astype('float64')
+        return totals.reindex(shifts, fill_value=0).astype('float64').rename_axis(SHIFT_COL)
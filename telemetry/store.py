@@ -0,0 +1,690 @@
+"""Shared columnar cache for the EM, VFD and air telemetry sources.
+
+Each source is parsed once into an uncompressed Arrow IPC file under
+``data/.cache``, sorted by node and time, next to a JSON manifest holding
+the source fingerprint and the row range of every (node, day) partition.
+Workers memory-map the file, so they all read one copy of the data through
+the OS page cache.  The cache is rebuilt only when the source's content
+changes; ``python -m telemetry.convert`` builds it ahead of time.
+
+With ``TELEMETRY_BACKEND=sqlite`` the Arrow cache is also imported into a
+SQLite database next to it, which then serves the base segment and the
+rollups: queries are pushed down as SQL and a worker holds only their
+results (``telemetry.sqlite``).
+
+Rows ingested while the app runs are kept in memory as small tail segments
+after the base; see ``telemetry.ingest``.
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from telemetry.anomaly import WARMUP, AnomalyDetector
+from telemetry.consumption import ConsumptionEngine
+from telemetry.demand import DemandEngine
+from telemetry.latest import LatestIndex
+from telemetry.metrics import timed_query
+from telemetry.rollup import Rollups, pick_grain
+from telemetry.sources import DATA_DIR, SOURCES, derive, prepare, read_source
+from telemetry.sqlite import SqliteRollups, SqliteSegment, combine_stats, frame_stats, read_identity, write_database
+
+CACHE_DIR = os.path.join(DATA_DIR, '.cache')
+# bump when the cached columns change so stale caches are rebuilt
+CACHE_VERSION = 8
+# tail segments are merged once there are more than this many
+MAX_TAIL_SEGMENTS = 32
+# 'arrow' (memory-mapped cache) or 'sqlite' (database built from it)
+BACKEND = os.environ.get('TELEMETRY_BACKEND', 'arrow')
+BACKENDS = ('arrow', 'sqlite')
+ROLLUP_TABLES = ('M', 'D', 'H', 'shift')
+# least seconds between saves of the demand engine's state while ingesting
+CHECKPOINT_SECONDS = 60
+
+_stores = {}
+# per source: serialises cache builds and first loads
+_locks = {name: threading.RLock() for name in SOURCES}
+
+
+def source_fingerprint(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def source_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_paths(name):
+    return (os.path.join(CACHE_DIR, name + '.arrow'),
+            os.path.join(CACHE_DIR, name + '.json'))
+
+
+def _rollup_path(name, table):
+    return os.path.join(CACHE_DIR, '%s.rollup-%s.arrow' % (name, table))
+
+
+def _database_path(name):
+    return os.path.join(CACHE_DIR, name + '.sqlite')
+
+
+def _demand_path(name):
+    return os.path.join(CACHE_DIR, name + '.demand.json')
+
+
+def _write_arrow(path, frame):
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+
+    def write(tmp):
+        with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    _atomic_write(path, write)
+
+
+def _read_table(path):
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def _read_arrow(path):
+    return _read_table(path).to_pandas(split_blocks=True)
+
+
+def _atomic_write(path, write):
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _partitions(frame, source):
+    if not len(frame):
+        return {}
+    nodes = pd.Categorical(frame[source.node_col])
+    codes = nodes.codes
+    days = frame[source.time_col].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    edges = np.flatnonzero((codes[1:] != codes[:-1]) | (days[1:] != days[:-1])) + 1
+    starts = np.concatenate([[0], edges])
+    stops = np.concatenate([edges, [len(frame)]])
+    names = nodes.categories.astype(str)[codes[starts]]
+    labels = days[starts].astype(str)
+    partitions = {}
+    for node, day, start, stop in zip(names, labels, starts.tolist(), stops.tolist()):
+        part = partitions.setdefault(node, {'days': [], 'starts': [], 'stops': []})
+        part['days'].append(day)
+        part['starts'].append(start)
+        part['stops'].append(stop)
+    return partitions
+
+
+def time_bounds(start_date=None, end_date=None):
+    """Half-open ``[start, stop)`` nanosecond bounds for a date-picker range.
+
+    Either end may be None (unbounded).  A date-only ``end_date`` such as
+    '2022-06-14' includes that whole day; a full timestamp is inclusive.
+    """
+    start = None if start_date is None else pd.Timestamp(start_date).value
+    stop = None
+    if end_date is not None:
+        end = pd.Timestamp(end_date)
+        if isinstance(end_date, str) and len(end_date) <= 10:
+            end += pd.Timedelta(days=1)
+        else:
+            end += pd.Timedelta(1)
+        stop = end.value
+    return start, stop
+
+
+def build_cache(name):
+    """Parse the raw source and (re)write its Arrow file and manifest."""
+    source = SOURCES[name]
+    arrow_path = _cache_paths(name)[0]
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fingerprint = source_fingerprint(source.path)
+    sha256 = source_hash(source.path)
+    frame = read_source(source)
+    rollups = Rollups.from_frame(frame, source.node_col, source.time_col, source.rollup_cols)
+    _write_arrow(arrow_path, frame)
+    for table, long in rollups.to_long().items():
+        _write_arrow(_rollup_path(name, table), long)
+    _write_manifest(name, {'version': CACHE_VERSION, 'source': fingerprint, 'sha256': sha256,
+                           'partitions': _partitions(frame, source)})
+
+
+def _read_manifest(name):
+    try:
+        with open(_cache_paths(name)[1]) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(name, manifest):
+    def write(path):
+        with open(path, 'w') as f:
+            json.dump(manifest, f)
+
+    _atomic_write(_cache_paths(name)[1], write)
+
+
+def ensure_cache(name):
+    """Bring the cache of ``name`` up to date with its source; returns the manifest.
+
+    A source whose size or mtime changed is hashed first: if the content is
+    what the cache was built from (the file was copied or touched), only
+    the manifest is updated.  One thread per process builds at a time;
+    others wait for its result instead of parsing the source again.
+    """
+    source = SOURCES[name]
+    with _locks[name]:
+        manifest = _read_manifest(name)
+        if manifest is not None and manifest.get('version') == CACHE_VERSION:
+            fingerprint = source_fingerprint(source.path)
+            if manifest['source'] == fingerprint:
+                return manifest
+            if manifest.get('sha256') == source_hash(source.path):
+                manifest['source'] = fingerprint
+                _write_manifest(name, manifest)
+                return manifest
+        build_cache(name)
+        return _read_manifest(name)
+
+
+def build_database(name, manifest):
+    """(Re)write the SQLite database of ``name`` from its Arrow cache and rollup files."""
+    source = SOURCES[name]
+    table = _read_table(_cache_paths(name)[0])
+    long = {rollup: _read_arrow(_rollup_path(name, rollup)) for rollup in ROLLUP_TABLES}
+
+    def write(tmp):
+        write_database(tmp, table, long, source.node_col, source.time_col, _identity(manifest))
+
+    _atomic_write(_database_path(name), write)
+
+
+def _identity(manifest):
+    return {'version': CACHE_VERSION, 'sha256': manifest['sha256']}
+
+
+def ensure_database(name):
+    """``ensure_cache``, then bring the SQLite database of ``name`` up to date with it; returns the manifest."""
+    with _locks[name]:
+        manifest = ensure_cache(name)
+        if read_identity(_database_path(name)) != _identity(manifest):
+            build_database(name, manifest)
+        return manifest
+
+
+def ensure_backend(name):
+    """Bring every file the configured ``BACKEND`` serves ``name`` from up to date; returns the manifest."""
+    if BACKEND not in BACKENDS:
+        raise ValueError('TELEMETRY_BACKEND must be one of %s, not %r' % (', '.join(BACKENDS), BACKEND))
+    return ensure_database(name) if BACKEND == 'sqlite' else ensure_cache(name)
+
+
+def load_store(name):
+    """Open the cached source with the configured ``BACKEND``, rebuilding it first if the source changed."""
+    source = SOURCES[name]
+    manifest = ensure_backend(name)
+    if BACKEND == 'sqlite':
+        return TelemetryStore.from_database(source, _database_path(name), source_state=manifest['source'],
+                                            demand_path=_demand_path(name))
+    base = Segment(_read_arrow(_cache_paths(name)[0]), manifest['partitions'], source.time_col)
+    long = {table: _read_arrow(_rollup_path(name, table)) for table in ROLLUP_TABLES}
+    rollups = Rollups.from_long(long, source.node_col, source.time_col, source.rollup_cols)
+    return TelemetryStore(source, base, source_state=manifest['source'], rollups=rollups,
+                          demand_path=_demand_path(name))
+
+
+def get_store(name):
+    """Process-wide store for ``name`` ('em', 'vfd' or 'air')."""
+    if name not in _stores:
+        with _locks[name]:
+            if name not in _stores:
+                _stores[name] = load_store(name)
+    return _stores[name]
+
+
+def register_store(name, store):
+    """Serve ``store`` as ``name`` in this process, e.g. one built from synthetic data."""
+    with _locks[name]:
+        _stores[name] = store
+
+
+def peek_store(name):
+    """The store for ``name`` if something already loaded it, else None."""
+    return _stores.get(name)
+
+
+def data_versions():
+    """``data_version`` of every store loaded in this process, by name."""
+    return {name: store.data_version for name, store in list(_stores.items())}
+
+
+class LazyStore:
+    """Stands in for ``get_store(name)`` without loading anything until first used.
+
+    Pages hold one at import time, so starting the app parses no data.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_store(self.name), attr)
+
+
+def _node_list(node):
+    return [node] if isinstance(node, str) else list(node)
+
+
+class Segment:
+    """A frame sorted by node then time, with each node's row range.
+
+    ``times`` is an int64 view of the time column, so within a node's rows a
+    time range is two ``searchsorted`` calls and the result an ``iloc`` view.
+    Column statistics are computed once per column and kept.
+    ``telemetry.sqlite.SqliteSegment`` answers the same methods from a
+    database.
+    """
+
+    def __init__(self, frame, partitions, time_col):
+        self.frame = frame
+        self.partitions = partitions
+        self.times = frame[time_col].to_numpy(dtype='datetime64[ns]').view('int64')
+        self.bounds = {node: (part['starts'][0], part['stops'][-1]) for node, part in partitions.items()}
+        self._stats = {}
+
+    def node_range(self, node, start, stop):
+        lo, hi = self.bounds.get(node, (0, 0))
+        times = self.times[lo:hi]
+        if stop is not None:
+            hi = lo + int(np.searchsorted(times, stop, 'left'))
+        if start is not None:
+            lo += int(np.searchsorted(times, start, 'left'))
+        return lo, hi
+
+    def nodes(self):
+        return list(self.partitions)
+
+    def spans(self):
+        """``{node: (first, last)}`` reading times, as int64 nanoseconds."""
+        return {node: (self.times[lo], self.times[hi - 1]) for node, (lo, hi) in self.bounds.items() if hi > lo}
+
+    def rows(self, node, start, stop, columns=None):
+        """View of ``node``'s rows in ``[start, stop)`` (int64 nanoseconds, None for open ends), or None."""
+        lo, hi = self.node_range(node, start, stop)
+        if hi <= lo:
+            return None
+        view = self.frame.iloc[lo:hi]
+        return view if columns is None else view[columns]
+
+    def batches(self, node, start, stop, columns, size):
+        """``rows`` in frames of at most ``size`` rows, each a view unless ``columns`` picks some."""
+        lo, hi = self.node_range(node, start, stop)
+        for a in range(lo, hi, size):
+            view = self.frame.iloc[a:min(a + size, hi)]
+            yield view if columns is None else view[columns]
+
+    def empty(self, columns=None):
+        frame = self.frame.iloc[0:0]
+        return frame if columns is None else frame[columns]
+
+    def last_rows(self, n):
+        """The last ``n`` rows of every node."""
+        tails = [np.arange(max(lo, hi - n), hi) for lo, hi in self.bounds.values()]
+        return self.frame.iloc[np.concatenate(tails)] if tails else self.frame.iloc[0:0]
+
+    def newest(self):
+        return self.last_rows(1)
+
+    def head(self, n):
+        return self.frame.head(n)
+
+    def tail(self, n):
+        return self.frame.tail(n)
+
+    def stats(self, columns):
+        missing = [col for col in columns if col not in self._stats]
+        if missing:
+            self._stats.update(frame_stats(self.frame, missing).items())
+        return pd.DataFrame({col: self._stats[col] for col in columns})
+
+    def categories(self, col):
+        return self.frame[col].cat.categories
+
+    def with_categories(self, col, categories):
+        """This segment with ``col`` recoded to ``categories``; the other columns are shared, not copied."""
+        frame = self.frame.copy(deep=False)
+        frame[col] = frame[col].cat.set_categories(categories)
+        seg = copy.copy(self)
+        seg.frame = frame
+        return seg
+
+
+class TelemetryStore:
+    """Base segment (memory-mapped or SQLite) plus the tail segments ingested since startup.
+
+    ``segments`` is only ever replaced, never mutated, so callbacks reading
+    it concurrently with ``append`` always see a consistent snapshot.
+    ``version`` increases with every append; ``latest`` holds each node's
+    newest reading, ``rollups`` the pre-summed rollup columns,
+    ``anomalies`` the alarm detector (None for sources without rules) and
+    ``demand`` the demand KPI engine (None for sources without power
+    readings).  Given a ``demand_path``, the engine's state is saved there
+    and resumed from on the next start.
+    """
+
+    def __init__(self, source, base, source_state=None, rollups=None, demand_path=None):
+        self.source = source
+        self.segments = [base]
+        self.source_state = source_state
+        self.version = 0
+        self.appended_rows = 0
+        self._lock = threading.Lock()
+        newest = base.newest()
+        self.latest = LatestIndex.from_frame(newest, source.node_col, source.time_col)
+        if rollups is None:
+            rollups = Rollups.from_frame(base.frame, source.node_col, source.time_col, source.rollup_cols)
+        self.rollups = rollups
+        self.consumption = None
+        if source.counter_col is not None:
+            self.consumption = ConsumptionEngine.for_source(source)
+            self.consumption.seed(newest)
+        self.anomalies = AnomalyDetector.for_source(source)
+        if self.anomalies is not None:
+            self.anomalies.update(base.last_rows(WARMUP))
+        self.demand_path = demand_path
+        self.demand = DemandEngine.for_source(source)
+        self._demand_saved = 0.0
+        if self.demand is not None:
+            self._resume_demand(base)
+
+    def _resume_demand(self, base):
+        # from the saved state if it still matches the history, then the rows it has not seen, node by node
+        if self.demand_path is not None and os.path.exists(self.demand_path):
+            with open(self.demand_path) as f:
+                self.demand.restore(json.load(f), base.spans())
+        for node in base.nodes():
+            self.demand.update(base.rows(node, self.demand.after(node), None, self.demand.columns))
+        self._save_demand()
+
+    def _save_demand(self):
+        if self.demand_path is None:
+            return
+        state = self.demand.state()
+
+        def write(path):
+            with open(path, 'w') as f:
+                json.dump(state, f)
+
+        _atomic_write(self.demand_path, write)
+        self._demand_saved = time.monotonic()
+
+    @classmethod
+    def from_frame(cls, source, frame, **kwargs):
+        """Store over ``frame``, sorted by node then time, held in memory, e.g. a synthetic history."""
+        return cls(source, Segment(frame, _partitions(frame, source), source.time_col), **kwargs)
+
+    @classmethod
+    def from_database(cls, source, path, **kwargs):
+        """Store whose base segment and rollups are read from the SQLite database at ``path``."""
+        base = SqliteSegment(path)
+        return cls(source, base, rollups=SqliteRollups(base, source.rollup_cols), **kwargs)
+
+    @property
+    def time_col(self):
+        return self.source.time_col
+
+    @property
+    def node_col(self):
+        return self.source.node_col
+
+    @property
+    def data_version(self):
+        """Token that changes with the data and matches across workers holding the same data."""
+        state = self.source_state or {}
+        return '%s.%s.%d' % (state.get('mtime_ns'), state.get('size'), self.appended_rows)
+
+    @property
+    def frame(self):
+        """Every row as one frame; with the SQLite backend this reads the whole history."""
+        segments = self.segments
+        if len(segments) == 1:
+            return segments[0].frame
+        return pd.concat([seg.frame for seg in segments], ignore_index=True)
+
+    def extent(self):
+        """Timestamps of the oldest and newest reading, from each node's first and last row."""
+        times = [time for seg in self.segments for span in seg.spans().values() for time in span]
+        if not times:
+            return None, None
+        return pd.Timestamp(min(times)), pd.Timestamp(max(times))
+
+    def nodes(self):
+        nodes = {}
+        for seg in self.segments:
+            nodes.update(dict.fromkeys(seg.nodes()))
+        return list(nodes)
+
+    @timed_query
+    def slices(self, node=None, start_date=None, end_date=None, columns=None):
+        """Zero-copy views of the rows for ``node`` (all nodes if None) in a date range.
+
+        ``node`` may be one node or a list of them, here and in the other
+        query methods.
+        See ``time_bounds`` for how the range is interpreted.  ``columns``
+        picks columns out of each view, copying just the selected rows.
+        """
+        start, stop = time_bounds(start_date, end_date)
+        return self._views(node, start, stop, columns)
+
+    def _views(self, node, start, stop, columns=None):
+        segments = self.segments
+        nodes = self.nodes() if node is None else _node_list(node)
+        views = []
+        for n in nodes:
+            for seg in segments:
+                view = seg.rows(n, start, stop, columns)
+                if view is not None:
+                    views.append(view)
+        return views
+
+    def batches(self, node=None, start_date=None, end_date=None, columns=None, size=50000):
+        """The rows of ``query`` as a generator of frames of at most ``size`` rows.
+
+        Reads one frame at a time, node by node, from the segments as they
+        were when iteration started, so memory stays flat however long the
+        range; for streaming exports (``telemetry.export``).
+        """
+        start, stop = time_bounds(start_date, end_date)
+        nodes = self.nodes() if node is None else _node_list(node)
+        segments = self.segments
+        for n in nodes:
+            for seg in segments:
+                yield from seg.batches(n, start, stop, columns, size)
+
+    @timed_query
+    def query(self, node=None, start_date=None, end_date=None, columns=None):
+        """Rows of ``slices`` as one frame; a single slice comes back as a view."""
+        views = self.slices(node, start_date, end_date, columns)
+        if not views:
+            return self.segments[0].empty(columns)
+        if len(views) == 1:
+            return views[0]
+        return pd.concat(views)
+
+    @timed_query
+    def by_node(self, nodes, start_date=None, end_date=None, columns=None):
+        """``{node: rows}`` for each of ``nodes`` over a date range.
+
+        Each node costs two ``searchsorted`` calls (or one index range scan)
+        per segment; its rows are a view unless they span several segments
+        or come from the database.
+        """
+        start, stop = time_bounds(start_date, end_date)
+        frames = {}
+        for node in _node_list(nodes):
+            views = self._views(node, start, stop, columns)
+            if views:
+                frames[node] = views[0] if len(views) == 1 else pd.concat(views)
+        return frames
+
+    @timed_query
+    def head(self, n):
+        """The first ``n`` rows in storage order (node, then time, then ingested batches)."""
+        parts = []
+        for seg in self.segments:
+            if n <= 0:
+                break
+            part = seg.head(n)
+            parts.append(part)
+            n -= len(part)
+        return parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+
+    @timed_query
+    def tail(self, n):
+        """The last ``n`` rows in storage order: the newest ingested ones, else the base's last."""
+        parts = []
+        for seg in reversed(self.segments):
+            if n <= 0:
+                break
+            part = seg.tail(n)
+            parts.insert(0, part)
+            n -= len(part)
+        return parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+
+    @timed_query
+    def column_stats(self, columns):
+        """Mean, min and max of each of ``columns`` over every row, indexed by statistic."""
+        stats = combine_stats(seg.stats(columns) for seg in self.segments)
+        return pd.DataFrame({'mean': stats.loc['sum'] / stats.loc['count'],
+                             'min': stats.loc['min'], 'max': stats.loc['max']}).T
+
+    @timed_query
+    def totals(self, start_date=None, end_date=None, node=None):
+        """Per-node sums of the rollup columns over a date range, indexed by node."""
+        start, stop = time_bounds(start_date, end_date)
+        nodes = None if node is None else _node_list(node)
+        totals, raw = self.rollups.totals(start, stop, nodes)
+        for lo, hi in raw:
+            cols = [self.node_col] + self.rollups.columns
+            for view in self._views(node, lo.astype('int64'), hi.astype('int64'), cols):
+                sums = view.groupby(self.node_col, observed=True)[self.rollups.columns].sum()
+                totals = totals.add(sums.assign(readings=len(view)), fill_value=0)
+        return totals
+
+    @timed_query
+    def series(self, start_date=None, end_date=None, node=None, grain=None):
+        """Rollup rows ``[node, period, columns..., readings]`` over a date range.
+
+        ``grain`` ('H', 'D' or 'M') defaults to the finest one that keeps the
+        chart to a few hundred bars; returns ``(grain, frame)``.
+        """
+        start, stop = time_bounds(start_date, end_date)
+        if grain is None:
+            first, last = self.rollups.extent()
+            start_, stop_ = (first if start is None else start), (last if stop is None else stop)
+            grain = 'H' if start_ is None or stop_ is None else pick_grain(start_, stop_)
+        nodes = None if node is None else _node_list(node)
+        return grain, self.rollups.series(start, stop, grain, nodes)
+
+    @timed_query
+    def shift_totals(self, start_date=None, end_date=None, node=None, by_node=False):
+        """Rollup column sums per shift over the whole days of a date range.
+
+        With ``by_node`` the sums are indexed by node then shift instead of
+        added up over the nodes.
+        """
+        start, stop = time_bounds(start_date, end_date)
+        return self.rollups.shift_totals(start, stop, None if node is None else _node_list(node), by_node)
+
+    @timed_query
+    def alarms(self, node=None, columns=None):
+        """Recent alarms raised for ``node`` (all if None), newest first.
+
+        The detector is seeded with each node's last ``WARMUP`` readings and
+        keeps the last ``MAX_ALARMS`` alarms, so these are not filtered by a
+        date range: earlier alarms were never raised or are no longer kept.
+        """
+        if self.anomalies is None:
+            return None
+        return self.anomalies.recent(None if node is None else _node_list(node), columns=columns)
+
+    @timed_query
+    def demand_days(self, node=None, start_date=None, end_date=None):
+        """Daily demand, load factor and power factor per node over a date range (``DemandEngine.daily``)."""
+        if self.demand is None:
+            return None
+        start, stop = time_bounds(start_date, end_date)
+        return self.demand.daily(None if node is None else _node_list(node), start, stop)
+
+    def demand_now(self, node):
+        """``node``'s current demand, rolling peak and day so far (``DemandEngine.current``)."""
+        return None if self.demand is None else self.demand.current(node)
+
+    def append(self, raw):
+        """Ingest newly read raw rows, deriving columns for just these rows.
+
+        Returns the latest-reading values that changed, ``{node: {column: value}}``.
+        """
+        if not len(raw):
+            return {}
+        with self._lock:
+            batch = derive(self.source, self._align_nodes(prepare(self.source, raw)), self.consumption)
+            segments = self.segments + [Segment(batch, _partitions(batch, self.source), self.time_col)]
+            if len(segments) > MAX_TAIL_SEGMENTS + 1:
+                segments = segments[:1] + [self._merge(segments[1:])]
+            self.segments = segments
+            changes = self.latest.update(batch)
+            self.rollups.update(batch)
+            if self.anomalies is not None:
+                self.anomalies.update(batch)
+            if self.demand is not None:
+                self.demand.update(batch)
+                if time.monotonic() - self._demand_saved >= CHECKPOINT_SECONDS:
+                    self._save_demand()
+            self.appended_rows += len(batch)
+            self.version += 1
+        return changes
+
+    def reload(self):
+        """Re-read the whole source, e.g. after it was replaced rather than appended to."""
+        # the saved demand state describes the old history
+        if self.demand_path is not None and os.path.exists(self.demand_path):
+            os.remove(self.demand_path)
+        fresh = load_store(self.source.name)
+        with self._lock:
+            self.segments = fresh.segments
+            self.source_state = fresh.source_state
+            self.latest = fresh.latest
+            self.rollups = fresh.rollups
+            self.consumption = fresh.consumption
+            self.anomalies = fresh.anomalies
+            self.demand = fresh.demand
+            self.appended_rows = 0
+            self.version += 1
+
+    def _align_nodes(self, batch):
+        # keep one set of node categories across segments so slices concatenate as categoricals
+        col = self.node_col
+        categories = self.segments[0].categories(col)
+        if not set(batch[col].cat.categories).issubset(categories):
+            categories = categories.union(batch[col].cat.categories)
+            self.segments = [seg.with_categories(col, categories) for seg in self.segments]
+        batch[col] = batch[col].cat.set_categories(categories)
+        return batch
+
+    def _merge(self, segments):
+        frame = pd.concat([seg.frame for seg in segments], ignore_index=True)
+        frame = frame.sort_values([self.node_col, self.time_col], kind='mergesort').reset_index(drop=True)
+        return Segment(frame, _partitions(frame, self.source), self.time_col)
@@ -0,0 +1,55 @@
+"""ConsumptionEngine deltas across counter rollovers, meter resets, gaps and appends."""
+import numpy as np
+import pandas as pd
+
+from telemetry.consumption import ConsumptionEngine
+
+
+def readings(node, counters, start='2023-01-02 00:00', freq='5min', times=None):
+    times = pd.date_range(start, periods=len(counters), freq=freq) if times is None else pd.DatetimeIndex(times)
+    return pd.DataFrame({'Node': node, 'Time': times, 'kWh': np.asarray(counters, dtype='float64')})
+
+
+def frame(*parts):
+    out = pd.concat(parts, ignore_index=True)
+    out['Node'] = out['Node'].astype('category')
+    return out
+
+
+def engine(**kwargs):
+    return ConsumptionEngine('Node', 'Time', 'kWh', **kwargs)
+
+
+def test_first_reading_of_each_node_is_unknown():
+    deltas = engine().update(frame(readings('a', [5, 7, 10]), readings('b', [100, 101])))
+    np.testing.assert_array_equal(deltas, [np.nan, 2, 3, np.nan, 1])
+
+
+def test_counter_rollover():
+    deltas = engine(rollover=10000).update(frame(readings('a', [9990, 9998, 4, 20])))
+    np.testing.assert_array_equal(deltas, [np.nan, 8, 6, 16])
+
+
+def test_meter_reset():
+    # a low counter that cannot be a wrap: the meter restarted from zero
+    deltas = engine(rollover=10000).update(frame(readings('a', [3000, 3050, 12, 30])))
+    np.testing.assert_array_equal(deltas, [np.nan, 50, 12, 18])
+    deltas = engine().update(frame(readings('a', [9990, 9998, 4])))
+    np.testing.assert_array_equal(deltas, [np.nan, 8, 4])
+
+
+def test_gap_longer_than_max_gap_is_unknown():
+    times = ['2023-01-02 00:00', '2023-01-02 00:05', '2023-01-02 03:00', '2023-01-02 03:05']
+    deltas = engine(max_gap='1h').update(frame(readings('a', [1, 2, 40, 41], times=times)))
+    np.testing.assert_array_equal(deltas, [np.nan, 1, np.nan, 1])
+
+
+def test_appends_continue_from_the_last_reading():
+    whole = frame(readings('a', [9990, 9998, 4, 20, 25]), readings('b', [7, 9, 2, 5, 6]))
+    expected = engine(rollover=10000).update(whole)
+    split = engine(rollover=10000)
+    first = whole.groupby('Node', observed=True).head(2)
+    rest = whole.drop(first.index)
+    deltas = pd.concat([split.update(first), split.update(rest)]).reindex(whole.index)
+    np.testing.assert_array_equal(deltas, expected)
+    np.testing.assert_array_equal(expected, [np.nan, 8, 6, 16, 5, np.nan, 2, 2, 3, 1])
@@ -0,0 +1,131 @@
+"""DemandEngine against a brute-force re-integration of every window."""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from telemetry import demand as demand_module
+from telemetry.demand import MIN_COVERAGE, NS_PER_HOUR, NS_PER_MINUTE, PEAK_HOURS, DemandEngine
+
+COLUMNS = ('Node_Name', 'DATE_TIME', 'Active_Power', 'Average_Power_Factor')
+MAX_GAP = pd.Timedelta('1h').value
+
+
+def readings(nodes=2, n=1200, seed=1, minutes=2):
+    """Jittered readings about ``minutes`` apart over a few days, with long gaps and missing values."""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for k in range(nodes):
+        step = minutes * 60e9 * rng.uniform(0.5, 1.5, n)
+        step[rng.integers(0, n, 3)] = 3 * 3600e9
+        times = pd.Timestamp('2022-06-01').value + np.cumsum(step).astype(np.int64)
+        power = rng.uniform(0, 50, n)
+        power[rng.integers(0, n, 8)] = np.nan
+        pf = rng.uniform(0.5, 1, n)
+        pf[rng.integers(0, n, 8)] = np.nan
+        parts.append(pd.DataFrame({'Node_Name': 'N%d' % k, 'DATE_TIME': times.view('datetime64[ns]'),
+                                   'Active_Power': power, 'Average_Power_Factor': pf}))
+    frame = pd.concat(parts, ignore_index=True)
+    frame['Node_Name'] = frame['Node_Name'].astype('category')
+    return frame
+
+
+def brute_force(frame, minutes):
+    """``{node: (times, demand)}``, every window integrated from scratch."""
+    out = {}
+    for node, group in frame.groupby('Node_Name', observed=True):
+        times = group['DATE_TIME'].to_numpy().view(np.int64)
+        power = group['Active_Power'].to_numpy()
+        gap = times - np.r_[times[0], times[:-1]]
+        held = np.where((gap > 0) & (gap <= MAX_GAP), gap, 0)
+        starts = times - held
+        window = minutes * NS_PER_MINUTE
+        demand = []
+        for i, end in enumerate(times):
+            overlap = np.clip(np.minimum(times[:i + 1], end) - np.maximum(starts[:i + 1], end - window), 0, None)
+            overlap = overlap * (held[:i + 1] > 0)
+            ok = ~np.isnan(power[:i + 1])
+            covered = overlap[ok].sum() / NS_PER_HOUR
+            energy = (overlap[ok] * power[:i + 1][ok]).sum() / NS_PER_HOUR
+            demand.append(energy / covered if covered >= MIN_COVERAGE * minutes / 60 else np.nan)
+        out[node] = times, np.array(demand)
+    return out
+
+
+def engine():
+    return DemandEngine(*COLUMNS, max_gap='1h')
+
+
+def batched(frame, seed=2):
+    """``frame`` cut into random batches, every node interleaved in each."""
+    rng = np.random.default_rng(seed)
+    n = frame.groupby('Node_Name', observed=True).size().max()
+    cuts = np.r_[0, np.unique(rng.integers(1, n, 30)), n]
+    grouped = frame.groupby('Node_Name', observed=True)
+    for lo, hi in zip(cuts[:-1], cuts[1:]):
+        yield pd.concat([group.iloc[lo:hi] for _, group in grouped], ignore_index=True)
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return readings()
+
+
+@pytest.fixture(scope='module')
+def fed(frame):
+    demand = engine()
+    for batch in batched(frame):
+        demand.update(batch)
+        # rows already seen are skipped
+        demand.update(batch.iloc[:3])
+    return demand
+
+
+@pytest.mark.parametrize('minutes', [15, 30])
+def test_current_demand_matches_brute_force(frame, fed, minutes):
+    for node, (times, demand) in brute_force(frame, minutes).items():
+        assert np.isclose(fed.current(node)['Demand_%dmin' % minutes], demand[-1], equal_nan=True)
+
+
+def test_peak_and_daily_maximum_match_brute_force(frame, fed):
+    for node, (times, demand) in brute_force(frame, 15).items():
+        recent = times > times[-1] - PEAK_HOURS * NS_PER_HOUR
+        assert np.isclose(fed.current(node)['Peak_Demand'], np.nanmax(demand[recent]))
+        expected = pd.Series(demand).groupby(pd.DatetimeIndex(times).floor('D')).max()
+        daily = fed.daily([node]).set_index('Day')['Max_Demand_15min']
+        np.testing.assert_allclose(daily.to_numpy(), expected.to_numpy())
+
+
+def test_batches_match_a_single_pass(frame, fed):
+    single = engine()
+    single.update(frame)
+    pd.testing.assert_frame_equal(fed.daily().reset_index(drop=True), single.daily().reset_index(drop=True),
+                                  check_exact=False)
+
+
+def test_state_round_trip(frame, fed):
+    spans = {node: (group['DATE_TIME'].iloc[0].value, group['DATE_TIME'].iloc[-1].value)
+             for node, group in frame.groupby('Node_Name', observed=True)}
+    resumed = engine()
+    assert resumed.restore(json.loads(json.dumps(fed.state())), spans)
+    pd.testing.assert_frame_equal(resumed.daily(), fed.daily())
+
+
+def test_current_day_matches_daily(frame, fed):
+    for node in frame['Node_Name'].cat.categories:
+        today = fed.daily([node]).iloc[-1]
+        current = fed.current(node)
+        for name in today.index.drop('Node_Name'):
+            assert current[name] == today[name] or pd.isna(current[name]) and pd.isna(today[name]), name
+
+
+def test_closed_days_are_capped(monkeypatch, frame):
+    monkeypatch.setattr(demand_module, 'DAYS_KEPT', 1)
+    capped = engine()
+    capped.update(frame)
+    full = engine()
+    full.update(frame)
+    # the last closed day and the open one
+    expected = full.daily().groupby('Node_Name').tail(2).reset_index(drop=True)
+    pd.testing.assert_frame_equal(capped.daily(), expected)
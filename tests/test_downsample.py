@@ -0,0 +1,69 @@
+"""Downsampling stays within its point budget and keeps the shape of every series."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from telemetry.downsample import downsample, lttb_indices, minmax_indices
+
+METHODS = ['minmax', 'lttb']
+
+
+def frame(n=50000, columns=5, seed=0):
+    rng = np.random.default_rng(seed)
+    out = pd.DataFrame({'time': pd.date_range('2024-01-01', periods=n, freq='s')})
+    for k in range(columns):
+        values = rng.normal(size=n).cumsum()
+        values[rng.integers(0, n, 20)] = np.nan
+        out['c%d' % k] = values
+    return out
+
+
+@pytest.mark.parametrize('n, buckets', [(10, 10), (1000, 7), (1001, 100), (99999, 250)])
+def test_minmax_indices(n, buckets):
+    y = np.random.default_rng(n).normal(size=n)
+    picked = minmax_indices(y, buckets)
+    assert len(picked) <= max(2 * buckets + 2, n if n <= 2 * buckets else 0)
+    assert np.all(np.diff(picked) > 0)
+    assert picked[0] == 0 and picked[-1] == n - 1
+    assert {int(np.argmin(y)), int(np.argmax(y))} <= set(picked)
+
+
+@pytest.mark.parametrize('n, n_out', [(10, 20), (1000, 3), (1001, 100), (99999, 500)])
+def test_lttb_indices(n, n_out):
+    y = np.random.default_rng(n).normal(size=n)
+    picked = lttb_indices(np.arange(n), y, n_out)
+    assert len(picked) <= max(n_out, n if n <= n_out else 0)
+    assert np.all(np.diff(picked) > 0)
+    assert picked[0] == 0 and picked[-1] == n - 1
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('n_points', [100, 1001, 2000])
+@pytest.mark.parametrize('columns', [1, 2, 5])
+def test_downsample_stays_within_budget(method, n_points, columns):
+    data = frame()
+    y_cols = ['c%d' % k for k in range(columns)]
+    out = downsample(data, y_cols, n_points, x_col='time', method=method)
+    assert len(out) <= n_points
+    assert out.index.is_monotonic_increasing and out.index.is_unique
+    assert out.index[0] == 0 and out.index[-1] == len(data) - 1
+
+
+@pytest.mark.parametrize('columns', [1, 3])
+def test_minmax_keeps_every_series_extrema(columns):
+    data = frame()
+    y_cols = ['c%d' % k for k in range(columns)]
+    out = downsample(data, y_cols, 600)
+    for col in y_cols:
+        assert out[col].max() == data[col].max()
+        assert out[col].min() == data[col].min()
+
+
+def test_short_frames_are_returned_whole():
+    data = frame(n=500)
+    assert downsample(data, ['c0', 'c1'], 500) is data
+
+
+def test_lttb_needs_the_x_column():
+    with pytest.raises(ValueError, match='x_col'):
+        downsample(frame(), ['c0'], 100, method='lttb')
@@ -0,0 +1,64 @@
+"""memoize keys results by the data versions they were computed from."""
+from types import SimpleNamespace
+
+from telemetry import offload
+from telemetry.figcache import FigureCache, memoize
+
+
+def fake_store(name, version):
+    return SimpleNamespace(source=SimpleNamespace(name=name), data_version=version)
+
+
+def memoized(stores, worker_versions):
+    """A memoized callback whose pool jobs report ``worker_versions`` (one dict per job)."""
+    cache = FigureCache(disk_dir=None)
+    calls = []
+
+    @memoize('test', stores, cache)
+    def callback(value):
+        calls.append(value)
+        for versions in worker_versions:
+            offload._note_versions(versions)
+        return {'value': value}
+
+    return callback, calls
+
+
+def test_results_from_this_process_are_keyed_by_its_versions():
+    store = fake_store('em', 'v1')
+    callback, calls = memoized([store], [])
+    assert callback(1) == callback(1) == {'value': 1}
+    assert calls == [1]
+    store.data_version = 'v2'
+    callback(1)
+    assert calls == [1, 1]
+
+
+def test_a_stale_worker_result_is_not_served_for_newer_data():
+    store = fake_store('em', 'v2')
+    callback, calls = memoized([store], [{'em': 'v1', 'vfd': 'x'}])
+    callback(1)
+    callback(1)
+    assert calls == [1, 1]
+    # once this process is back at the worker's version, the result is there
+    store.data_version = 'v1'
+    callback(1)
+    assert calls == [1, 1]
+
+
+def test_jobs_that_read_different_versions_are_not_cached():
+    store = fake_store('em', 'v1')
+    callback, calls = memoized([store], [{'em': 'v1'}, {'em': 'v0'}])
+    callback(1)
+    callback(1)
+    assert calls == [1, 1]
+
+
+def test_versions_are_collected_per_block():
+    with offload.read_versions() as outer:
+        offload._note_versions({'em': 'v1'})
+        with offload.read_versions() as inner:
+            offload._note_versions({'em': 'v2'})
+    assert outer == {'em': 'v1'} and inner == {'em': 'v2'}
+    # outside any block nothing is collected
+    offload._note_versions({'em': 'v3'})
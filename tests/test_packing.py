@@ -0,0 +1,127 @@
+"""Packed figures decode, the way assets/packing.js does it, to the values that were packed."""
+import base64
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+
+from telemetry.packing import pack_figure, pack_times, pack_values
+
+NS_PER_MS = 10 ** 6
+
+
+def decode(packed):
+    """``decode`` of assets/packing.js: little-endian typed arrays, integer minimum as missing."""
+    values = np.frombuffer(base64.b64decode(packed['bdata']), dtype='<' + packed['dtype'])
+    if packed['dtype'][0] == 'f':
+        return values.astype('float64')
+    missing = values == -2 ** (8 * values.itemsize - 1)
+    if 'decimals' in packed:
+        out = values / 10 ** packed['decimals']
+    else:
+        out = packed['offset'] + values.astype('float64') * packed['unit']
+    return np.where(missing, np.nan, out)
+
+
+def unpack(figure):
+    """``unpack`` of assets/packing.js: packed arrays decoded, refs resolved to earlier traces."""
+    data = []
+    for trace in figure['data']:
+        trace = dict(trace)
+        for axis in ('x', 'y'):
+            packed = trace.get(axis)
+            if isinstance(packed, dict) and 'bdata' in packed:
+                trace[axis] = decode(packed)
+            elif isinstance(packed, dict) and 'ref' in packed:
+                trace[axis] = data[packed['ref'][0]][packed['ref'][1]]
+        data.append(trace)
+    return data
+
+
+def assert_times(decoded, times):
+    """``decoded`` are ``times`` in epoch milliseconds, to the microsecond."""
+    times = pd.DatetimeIndex(times)
+    expected = np.where(times.isna(), np.nan, times.asi8 // NS_PER_MS + times.asi8 % NS_PER_MS / NS_PER_MS)
+    np.testing.assert_allclose(decoded, expected, rtol=0, atol=1e-3)
+
+
+@pytest.mark.parametrize('places, values, dtype', [
+    (2, [0.0, 1.234, -5.678, np.nan, 99.999], 'i2'),
+    (3, [0.5, 0.999, 1.0, np.nan], 'i2'),
+    (0, [1, -2, 30000, np.nan], 'i2'),
+    (2, [0.0, 400.001, -12345.678, np.nan], 'i4'),
+    (1, [1e12, np.nan, -1.0], 'f8'),
+])
+def test_values_round_trip(places, values, dtype):
+    packed = pack_values(values, places)
+    assert packed['dtype'] == dtype
+    np.testing.assert_array_equal(decode(packed), np.round(np.asarray(values, dtype='float64'), places))
+
+
+@pytest.mark.parametrize('places, values, dtype', [
+    (0, [32767, -32767], 'i2'),
+    (0, [32768, 0], 'i4'),
+    # the minimum is the missing-value sentinel, so it cannot be sent as a value
+    (0, [-32768, 0], 'i4'),
+    (2, [327.67, -327.67, np.nan], 'i2'),
+    (2, [327.68], 'i4'),
+    (0, [2 ** 31 - 1, -(2 ** 31 - 1)], 'i4'),
+    (0, [2 ** 31, 0], 'f8'),
+    (0, [-(2 ** 31), 0], 'f8'),
+])
+def test_values_at_the_integer_limits(places, values, dtype):
+    packed = pack_values(values, places)
+    assert packed['dtype'] == dtype
+    np.testing.assert_array_equal(decode(packed), np.asarray(values, dtype='float64'))
+
+
+@pytest.mark.parametrize('places', [None, 0, 2])
+def test_all_missing_values(places):
+    decoded = decode(pack_values([np.nan] * 5, places))
+    assert len(decoded) == 5 and np.isnan(decoded).all()
+
+
+def test_values_without_decimals_go_as_float32():
+    values = np.array([0.1, 123456.789, np.nan, -1e-3])
+    packed = pack_values(values)
+    assert packed['dtype'] == 'f4' and 'decimals' not in packed
+    np.testing.assert_array_equal(decode(packed), values.astype('float32').astype('float64'))
+
+
+@pytest.mark.parametrize('times, unit', [
+    (pd.date_range('2024-03-01', periods=500, freq='5min'), 1000),
+    (pd.date_range('2024-03-01', periods=500, freq='250ms'), 1),
+    (pd.DatetimeIndex(['2024-03-01 00:00', None, '2024-03-01 00:10', '2024-02-28 23:00']), 1000),
+    # more than int32 seconds apart
+    (pd.DatetimeIndex(['1950-01-01', '2024-01-01']), None),
+    # sub-millisecond times
+    (pd.DatetimeIndex(['2024-01-01 00:00:00.0000005', '2024-01-01 00:00:01']), None),
+    (pd.DatetimeIndex([None, None]), None),
+])
+def test_times_round_trip(times, unit):
+    packed = pack_times(times)
+    assert packed.get('unit') == unit
+    assert packed['dtype'] == ('i4' if unit else 'f8')
+    assert_times(decode(packed), times)
+
+
+def test_figure_round_trip():
+    times = pd.date_range('2024-03-01', periods=300, freq='min')
+    frequency = np.linspace(49.5, 50.5, 300)
+    frequency[7] = np.nan
+    figure = go.Figure()
+    figure.add_scatter(x=times, y=frequency, meta='Frequency')
+    figure.add_scatter(x=times, y=np.arange(300) * 1.5, yaxis='y2')
+    figure.add_scatter(x=times[:3], y=[1, 2, 3], name='plain list')
+    packed = pack_figure(figure, places=1)
+    assert packed['data'][0]['y']['decimals'] == 2
+    assert packed['data'][1]['y']['decimals'] == 1
+    assert packed['data'][1]['x'] == {'ref': [0, 'x']}
+    assert packed['layout']['xaxis']['type'] == 'date'
+    data = unpack(packed)
+    for trace, source in zip(data, figure.data):
+        assert_times(trace['x'], source.x)
+    np.testing.assert_array_equal(data[0]['y'], np.round(frequency, 2))
+    np.testing.assert_array_equal(data[1]['y'], np.arange(300) * 1.5)
+    assert list(data[2]['y']) == [1, 2, 3]
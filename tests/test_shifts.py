@@ -0,0 +1,58 @@
+"""ShiftCalendar boundaries: half-open shifts, midnight and week wrap, uncovered time."""
+import pandas as pd
+import pytest
+
+from telemetry.shifts import CALENDARS, ShiftCalendar
+
+
+def shifts(calendar, times):
+    return list(calendar.assign(pd.DatetimeIndex(times)).astype(object))
+
+
+@pytest.mark.parametrize('time, shift', [
+    ('2023-01-02 05:44:59', 'C'),
+    ('2023-01-02 05:45:00', 'A'),
+    ('2023-01-02 14:19:59', 'A'),
+    ('2023-01-02 14:20:00', 'B'),
+    ('2023-01-02 22:39:59', 'B'),
+    ('2023-01-02 22:40:00', 'C'),
+    ('2023-01-03 00:00:00', 'C'),
+])
+def test_plant_boundaries(time, shift):
+    assert shifts(CALENDARS['plant'], [time]) == [shift]
+
+
+def test_sunday_night_wraps_into_monday():
+    # 2023-01-01 was a Sunday
+    calendar = ShiftCalendar({0: [('day', '08:00', '16:00')], 6: [('night', '22:00', '06:00')]})
+    times = ['2023-01-01 21:59:59', '2023-01-01 22:00:00', '2023-01-02 00:00:00',
+             '2023-01-02 05:59:59', '2023-01-02 06:00:00', '2023-01-02 08:00:00']
+    assigned = shifts(calendar, times)
+    assert pd.isna(assigned).tolist() == [True, False, False, False, True, False]
+    assert assigned[1:4] == ['night'] * 3 and assigned[5] == 'day'
+
+
+def test_uncovered_time_and_missing_times_get_no_shift():
+    calendar = ShiftCalendar.daily([('A', '06:00', '14:00')], weekdays=range(5))
+    times = pd.DatetimeIndex(['2023-01-06 13:59', '2023-01-06 14:00', '2023-01-07 10:00', None])
+    assert pd.isna(calendar.assign(times)).tolist() == [False, True, True, True]
+
+
+def test_full_day_shift():
+    calendar = ShiftCalendar.daily([('all', '00:00', '00:00')])
+    assert shifts(calendar, ['2023-01-02 00:00', '2023-01-02 23:59:59', '2023-01-08 12:00']) == ['all'] * 3
+
+
+def test_overlapping_shifts_are_rejected():
+    with pytest.raises(ValueError, match='overlapping'):
+        ShiftCalendar.daily([('A', '06:00', '14:30'), ('B', '14:00', '22:00')])
+
+
+def test_matches_a_per_reading_lookup():
+    calendar = CALENDARS['plant']
+    times = pd.date_range('2022-12-25', '2023-01-09', freq='7min')
+    expected = []
+    for t in times:
+        minute = t.hour * 60 + t.minute
+        expected.append('A' if 345 <= minute < 860 else 'B' if 860 <= minute < 1360 else 'C')
+    assert shifts(calendar, times) == expected
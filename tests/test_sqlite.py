@@ -0,0 +1,115 @@
+"""The SQLite backend answers every store query the way the Arrow backend does."""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from benchmarks.synthetic import synthetic
+from telemetry.rollup import Rollups
+from telemetry.sources import SOURCES, derive, prepare
+from telemetry.sqlite import write_database
+from telemetry.store import TelemetryStore
+
+NAMES = ['em', 'vfd', 'air']
+
+
+def raw_rows(name, nodes=3, periods=4 * 24 * 12, freq='5min'):
+    return synthetic(name, nodes, periods, freq)
+
+
+def both(name, directory):
+    """``(arrow, sqlite)`` stores over the same synthetic history of ``name``."""
+    source = SOURCES[name]
+    frame = derive(source, prepare(source, raw_rows(name)))
+    path = str(directory / (name + '.sqlite'))
+    long = Rollups.from_frame(frame, source.node_col, source.time_col, source.rollup_cols).to_long()
+    write_database(path, pa.Table.from_pandas(frame, preserve_index=False), long,
+                   source.node_col, source.time_col, {'test': True})
+    return TelemetryStore.from_frame(source, frame), TelemetryStore.from_database(source, path)
+
+
+def appended(store):
+    """A batch after the history: the first node's next readings and a node the history lacks."""
+    source = store.source
+    raw = raw_rows(source.name, nodes=1, periods=30)
+    last = store.extent()[1]
+    raw[source.time_col] += last - raw[source.time_col].min() + pd.Timedelta('5min')
+    node = store.nodes()[0]
+    extra = raw.copy()
+    extra[source.node_col] = 'ZZ NEW NODE'
+    raw[source.node_col] = node
+    batch = pd.concat([raw, extra], ignore_index=True)
+    batch[source.node_col] = batch[source.node_col].astype(str)
+    return batch
+
+
+@pytest.fixture(scope='module', params=NAMES)
+def stores(request, tmp_path_factory):
+    arrow, sqlite = both(request.param, tmp_path_factory.mktemp(request.param))
+    return arrow, sqlite
+
+
+@pytest.fixture(scope='module')
+def grown(stores):
+    """The stores after the same batch was appended to each."""
+    arrow, sqlite = stores
+    batch = appended(arrow)
+    arrow.append(batch.copy())
+    sqlite.append(batch.copy())
+    return arrow, sqlite
+
+
+def ranges(store):
+    first, last = store.extent()
+    return [(None, None), (str(first.date()), str(last.date())),
+            (str((first + pd.Timedelta('1D')).date()), str((first + pd.Timedelta('2D')).date())),
+            ('2000-01-01', '2000-01-02')]
+
+
+def node_choices(store):
+    return [None, store.nodes()[0], store.nodes()[1:]]
+
+
+def check(arrow, sqlite):
+    assert sqlite.nodes() == arrow.nodes()
+    assert sqlite.extent() == arrow.extent()
+    for start, end in ranges(arrow):
+        for node in node_choices(arrow):
+            pd.testing.assert_frame_equal(sqlite.query(node, start, end), arrow.query(node, start, end))
+            pd.testing.assert_frame_equal(sqlite.totals(start, end, node), arrow.totals(start, end, node),
+                                          check_dtype=False)
+            for grain in ('H', 'D', 'M'):
+                a_grain, a_series = arrow.series(start, end, node, grain)
+                s_grain, s_series = sqlite.series(start, end, node, grain)
+                pd.testing.assert_frame_equal(s_series, a_series, check_dtype=False)
+            if arrow.source.calendar is not None:
+                for by_node in (False, True):
+                    pd.testing.assert_frame_equal(sqlite.shift_totals(start, end, node, by_node),
+                                                  arrow.shift_totals(start, end, node, by_node), check_dtype=False)
+    for node in node_choices(arrow):
+        alarms = arrow.alarms(node)
+        if alarms is not None:
+            pd.testing.assert_frame_equal(sqlite.alarms(node).reset_index(drop=True), alarms.reset_index(drop=True))
+    numeric = arrow.query(columns=None).select_dtypes('number').columns.tolist()
+    pd.testing.assert_frame_equal(sqlite.column_stats(numeric), arrow.column_stats(numeric), rtol=1e-6)
+
+
+def test_backends_match(stores):
+    check(*stores)
+
+
+def test_backends_match_after_an_append(grown):
+    arrow, sqlite = grown
+    assert 'ZZ NEW NODE' in arrow.nodes()
+    check(arrow, sqlite)
+
+
+def test_query_columns_and_empty_ranges(stores):
+    arrow, sqlite = stores
+    source = arrow.source
+    node = arrow.nodes()[0]
+    columns = [source.time_col] + list(source.rollup_cols)
+    pd.testing.assert_frame_equal(sqlite.query(node, columns=columns), arrow.query(node, columns=columns))
+    empty = sqlite.query(node, '2000-01-01', '2000-01-02')
+    assert not len(empty) and list(empty.columns) == list(arrow.query(node, '2000-01-01', '2000-01-02').columns)
+    assert np.isclose(sqlite.totals()[source.rollup_cols[0]].sum(), arrow.totals()[source.rollup_cols[0]].sum())